@@ -0,0 +1,105 @@
+"""Benchmark sorting throughput of each executor on small and large files.
+
+Usage:
+
+    python -m benchmarks.bench_executors --concurrency 4
+"""
+import argparse
+import pathlib
+import shutil
+import tempfile
+import time
+import warnings
+from typing import Dict, List, Tuple
+
+from dicomsorter.config import EXECUTORS, Config
+from dicomsorter.dicomsorter import DICOMSorter
+from tests.factories import DicomFactory
+
+
+def build_corpus(directory: pathlib.Path, files: int, pixel_bytes: int) -> int:
+    """Create a corpus of DICOM files and return its total size in bytes."""
+    directory.mkdir(parents=True)
+
+    for k in range(files):
+        dicom = DicomFactory.build_with_defaults(
+            InstanceNumber=k,
+            BitsAllocated=8,
+            PixelRepresentation=0,
+            PixelData=b"\x00" * pixel_bytes,
+        )
+        dicom.save_as(directory.joinpath("Image%06d" % k), write_like_original=False)
+
+    return sum(f.stat().st_size for f in directory.iterdir())
+
+
+def run(
+    corpus: pathlib.Path, output: pathlib.Path, executor: str, concurrency: int
+) -> float:
+    config = Config(
+        input_directory=corpus,
+        output_directory=output,
+        concurrency=concurrency,
+        executor=executor,
+        verbose=True,
+    )
+
+    start = time.perf_counter()
+    DICOMSorter(config).start()
+    elapsed = time.perf_counter() - start
+
+    shutil.rmtree(output)
+
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--small-files", type=int, default=2000)
+    parser.add_argument("--small-size", type=int, default=8 * 1024)
+    parser.add_argument("--large-files", type=int, default=20)
+    parser.add_argument("--large-size", type=int, default=64 * 1024 * 1024)
+    arguments = parser.parse_args()
+
+    # Generated descriptions may exceed the maximum length of their VR
+    warnings.simplefilter("ignore", UserWarning)
+
+    corpora: Dict[str, Tuple[int, int]] = {
+        "small": (arguments.small_files, arguments.small_size),
+        "large": (arguments.large_files, arguments.large_size),
+    }
+
+    with tempfile.TemporaryDirectory() as temp:
+        root = pathlib.Path(temp)
+        rows: List[Tuple[str, str, float, float, float]] = []
+
+        for name, (files, size) in corpora.items():
+            corpus = root.joinpath(name)
+            total_bytes = build_corpus(corpus, files, size)
+
+            for executor in EXECUTORS:
+                elapsed = run(
+                    corpus, root.joinpath("output"), executor, arguments.concurrency
+                )
+                rows.append(
+                    (
+                        name,
+                        executor,
+                        elapsed,
+                        files / elapsed,
+                        total_bytes / elapsed / 1024**2,
+                    )
+                )
+
+    print(
+        "%-8s %-8s %10s %12s %10s"
+        % ("corpus", "executor", "seconds", "files/s", "MB/s")
+    )
+
+    for row in rows:
+        print("%-8s %-8s %10.2f %12.1f %10.1f" % row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Time each stage of sorting on synthetic corpora and report the results as JSON.
+
+Each stage (discovery, parse, format, collision and copy) is timed separately
+in a single thread so that regressions can be attributed, followed by an
+end-to-end run with the requested concurrency.
+
+Usage:
+
+    python -m benchmarks.bench_stages --scale 0.1 --output results.json
+"""
+import argparse
+import json
+import pathlib
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+from dicomsorter import __version__
+from dicomsorter.config import Config
+from dicomsorter.dicomsorter import DICOMSorter
+from dicomsorter.utils import cache_scope, claim_unique_filename, ensure_directory
+
+from .corpus import CORPORA, generate, scaled
+
+T = TypeVar("T")
+
+
+def timed(func: Callable[[], T]) -> Tuple[T, float]:
+    start = time.perf_counter()
+    result = func()
+
+    return result, time.perf_counter() - start
+
+
+def bench_corpus(
+    corpus: pathlib.Path, output: pathlib.Path, concurrency: int, executor: str
+) -> Dict[str, Any]:
+    config = Config(
+        input_directory=corpus,
+        output_directory=output,
+        concurrency=concurrency,
+        executor=executor,
+        verbose=True,
+    )
+    sorter = DICOMSorter(config)
+    cache_scope(sorter.run_id)
+
+    stages: Dict[str, float] = {}
+
+    files, stages["discovery"] = timed(lambda: list(sorter.discover()))
+    dicoms, stages["parse"] = timed(lambda: [sorter.load(f) for f in files])
+    destinations, stages["format"] = timed(
+        lambda: [sorter.destination(f, d) for f, d in zip(files, dicoms)]
+    )
+
+    def claim() -> List[pathlib.Path]:
+        claimed = []
+
+        for destination in destinations:
+            ensure_directory(destination.parent)
+            claimed.append(claim_unique_filename(destination))
+
+        return claimed
+
+    claimed, stages["collision"] = timed(claim)
+
+    def copy() -> None:
+        for source, destination in zip(files, claimed):
+            sorter.transfer(source, destination)
+
+    _, stages["copy"] = timed(copy)
+    shutil.rmtree(output)
+
+    # A new sorter so that no per-process caches are shared with the stages
+    _, stages["total"] = timed(lambda: DICOMSorter(config).start())
+    shutil.rmtree(output)
+
+    total_bytes = sum(f.stat().st_size for f in files)
+
+    return {
+        "files": len(files),
+        "bytes": total_bytes,
+        "seconds": stages,
+        "files_per_second": {
+            stage: len(files) / elapsed if elapsed else None
+            for stage, elapsed in stages.items()
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--corpus", nargs="+", choices=list(CORPORA), default=list(CORPORA)
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--executor", default=Config.executor)
+    parser.add_argument(
+        "--directory",
+        type=pathlib.Path,
+        help="directory in which to generate the corpora (default: a temporary directory)",
+    )
+    parser.add_argument(
+        "--output", type=pathlib.Path, help="file to write the results to"
+    )
+    arguments = parser.parse_args()
+
+    results: Dict[str, Any] = {
+        "dicomsorter": __version__,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": arguments.seed,
+        "scale": arguments.scale,
+        "concurrency": arguments.concurrency,
+        "executor": arguments.executor,
+        "corpora": {},
+    }
+
+    with tempfile.TemporaryDirectory(dir=arguments.directory) as temp:
+        root = pathlib.Path(temp)
+
+        for name in arguments.corpus:
+            corpus = root.joinpath(name)
+            generate(
+                corpus, name, scaled(CORPORA[name], arguments.scale), arguments.seed
+            )
+
+            results["corpora"][name] = bench_corpus(
+                corpus,
+                root.joinpath("output"),
+                arguments.concurrency,
+                arguments.executor,
+            )
+
+    report = json.dumps(results, indent=2)
+
+    if arguments.output:
+        arguments.output.write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
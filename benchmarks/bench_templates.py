@@ -0,0 +1,106 @@
+"""Microbenchmark comparing recursive and compiled template interpolation.
+
+Usage:
+
+    python -m benchmarks.bench_templates --files 1000000
+"""
+import argparse
+import pathlib
+import time
+from typing import Callable, Dict, List
+
+from pydicom import Dataset
+
+from dicomsorter.config import Config
+from dicomsorter.dicom_utils import DICOM
+from dicomsorter.utils import clean_directory_name, recursive_string_interpolation
+
+
+def build_dicom() -> DICOM:
+    dataset = Dataset()
+    dataset.PatientName = "Doe^Jane"
+    dataset.PatientBirthDate = "19700101"
+    dataset.StudyDate = "20200101"
+    dataset.ImageType = ["ORIGINAL", "PRIMARY", "M", "FFE"]
+    dataset.SeriesDescription = "T1 MPRAGE"
+    dataset.SeriesNumber = 3
+    dataset.InstanceNumber = 42
+
+    return DICOM(pathlib.Path("image.dcm"), dcm=dataset)
+
+
+def recursive(dicom: DICOM, path: List[str], filename_format: str) -> str:
+    directories = [clean_directory_name(dicom[field]) for field in path]
+    filename = clean_directory_name(
+        recursive_string_interpolation(filename_format, dicom)
+    )
+
+    return "/".join(directories + [filename])
+
+
+def compiled(dicom: DICOM, path: List[str], filename_format: str) -> str:
+    directories = [clean_directory_name(dicom.get(field)) for field in path]
+
+    return "/".join(directories + [dicom.format(filename_format)])
+
+
+def run(files: int, repeat: int = 3) -> Dict[str, float]:
+    dicom = build_dicom()
+    path = ["PatientAge", "SeriesDescription"]
+    filename_format = Config.filename_format
+
+    assert recursive(dicom, path, filename_format) == compiled(
+        dicom, path, filename_format
+    )
+
+    implementations: Dict[str, Callable[[DICOM, List[str], str], str]] = {
+        "recursive": recursive,
+        "compiled": compiled,
+    }
+    results = {}
+
+    for name, func in implementations.items():
+        timings = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+
+            for _ in range(files):
+                func(dicom, path, filename_format)
+
+            timings.append(time.perf_counter() - start)
+
+        results[name] = min(timings)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=1000000,
+        help="number of files to format (default: 1000000)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of repetitions, the fastest of which is reported (default: 3)",
+    )
+    arguments = parser.parse_args()
+
+    results = run(arguments.files, arguments.repeat)
+
+    for name, elapsed in results.items():
+        print(
+            "%-10s %8.2f s total %8.2f us/file"
+            % (name, elapsed, elapsed / arguments.files * 1e6)
+        )
+
+    print("speedup    %8.2fx" % (results["recursive"] / results["compiled"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Generate reproducible synthetic DICOM corpora for benchmarking.
+
+Usage:
+
+    python -m benchmarks.corpus /tmp/corpus --corpus tiny deep --scale 0.5
+"""
+import argparse
+import pathlib
+import random
+import warnings
+from dataclasses import dataclass
+from typing import Dict, List
+
+from faker import Faker
+from pydicom.uid import generate_uid
+
+from tests.factories import DicomFactory
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    """Shape of a synthetic corpus.
+
+    Files are spread evenly over ``directories`` directories, each nested
+    ``depth`` levels below the root of the corpus.
+    """
+
+    directories: int
+    files_per_directory: int
+    depth: int = 1
+    pixel_bytes: int = 0
+    frames: int = 1
+
+    # Give every file the same header, so that every destination collides
+    collide: bool = False
+
+
+CORPORA: Dict[str, CorpusSpec] = {
+    # Many tiny slices, as produced by most CT and MR series
+    "tiny": CorpusSpec(directories=50, files_per_directory=100, pixel_bytes=512),
+    # A few huge enhanced multi-frame objects
+    "multiframe": CorpusSpec(
+        directories=2, files_per_directory=2, pixel_bytes=32 * 1024 * 1024, frames=128
+    ),
+    # Deeply nested directories, each with only a few files
+    "deep": CorpusSpec(directories=500, files_per_directory=4, depth=8),
+    # Every file is sorted to the same destination
+    "collisions": CorpusSpec(directories=10, files_per_directory=200, collide=True),
+}
+
+
+def scaled(spec: CorpusSpec, scale: float) -> CorpusSpec:
+    """Scale the number of directories in a corpus (keeping at least one)."""
+    return CorpusSpec(
+        directories=max(int(spec.directories * scale), 1),
+        files_per_directory=spec.files_per_directory,
+        depth=spec.depth,
+        pixel_bytes=spec.pixel_bytes,
+        frames=spec.frames,
+        collide=spec.collide,
+    )
+
+
+def generate(
+    directory: pathlib.Path, name: str, spec: CorpusSpec, seed: int = 0
+) -> List[pathlib.Path]:
+    """Write a corpus into a directory, returning the files that were created.
+
+    The same seed always produces the same headers, UIDs and layout.
+    """
+    # The factories use the module level random and Faker generators
+    random.seed(seed)
+    Faker.seed(seed)
+
+    # Generated descriptions may exceed the maximum length of their VR
+    warnings.simplefilter("ignore", UserWarning)
+
+    files = []
+    pixel_data = b"\x00" * spec.pixel_bytes
+
+    for d in range(spec.directories):
+        parts = ["level%d_%04d" % (level, d) for level in range(spec.depth)]
+        series = directory.joinpath(*parts)
+        series.mkdir(parents=True, exist_ok=True)
+
+        fields = {
+            "StudyInstanceUID": generate_uid(entropy_srcs=[name, str(seed)]),
+            "SeriesInstanceUID": generate_uid(entropy_srcs=[name, str(seed), str(d)]),
+            "SeriesNumber": d + 1,
+        }
+
+        for k in range(spec.files_per_directory):
+            uid = generate_uid(entropy_srcs=[name, str(seed), str(d), str(k)])
+            instance = dict(fields, SOPInstanceUID=uid, InstanceNumber=k + 1)
+
+            if spec.collide:
+                instance.update(SeriesDescription=name, InstanceNumber=1)
+
+            if spec.pixel_bytes:
+                instance.update(
+                    BitsAllocated=8,
+                    PixelRepresentation=0,
+                    NumberOfFrames=spec.frames,
+                    PixelData=pixel_data,
+                )
+
+            dicom = DicomFactory.build_with_defaults(**instance)
+            filename = series.joinpath("Image%06d.dcm" % k)
+            dicom.save_as(filename, write_like_original=False)
+            files.append(filename)
+
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", type=pathlib.Path)
+    parser.add_argument(
+        "--corpus", nargs="+", choices=list(CORPORA), default=list(CORPORA)
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    for name in arguments.corpus:
+        spec = scaled(CORPORA[name], arguments.scale)
+        files = generate(arguments.directory.joinpath(name), name, spec, arguments.seed)
+        print("%s: %d files" % (name, len(files)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import io
+import pathlib
+import tarfile
+import threading
+import zipfile
+from dataclasses import dataclass
+from typing import Dict, Generator, Iterable, Literal, Optional, Set, Union
+
+from pydicom.dataset import Dataset
+
+from .dicom_utils import PROBE_SIZE, parse_dicom
+from .errors import DicomsorterException
+from .utils import filename_generator, mkdir_p
+
+# Archive formats which sorted output can be written to, by file extension
+OUTPUT_FORMATS = {
+    ".zip": "zip",
+    ".tar": "w",
+    ".tar.gz": "w:gz",
+    ".tgz": "w:gz",
+    ".tar.bz2": "w:bz2",
+    ".tar.xz": "w:xz",
+}
+
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    name: str
+    data: bytes
+
+
+def is_archive(filename: pathlib.Path) -> bool:
+    """Check whether a path is a zip or (optionally compressed) tar archive."""
+    if not filename.is_file():
+        return False
+
+    return zipfile.is_zipfile(filename) or tarfile.is_tarfile(filename)
+
+
+def archive_members(
+    filename: pathlib.Path,
+) -> Generator[ArchiveMember, None, None]:
+    """Read each regular file from an archive into memory, in archive order.
+
+    Tar archives are read as a stream so that compressed archives are only
+    decompressed once, and never extracted to disk.
+    """
+    if zipfile.is_zipfile(filename):
+        with zipfile.ZipFile(filename) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield ArchiveMember(info.filename, archive.read(info))
+        return
+
+    with tarfile.open(filename, mode="r|*") as tar:
+        for member in tar:
+            fid = tar.extractfile(member) if member.isfile() else None
+
+            if fid is not None:
+                yield ArchiveMember(member.name, fid.read())
+
+
+def read_member(
+    member: ArchiveMember,
+    ignore_dicomdir: bool = True,
+    stop_before_pixels: bool = False,
+    specific_tags: Optional[Iterable[str]] = None,
+) -> Optional[Dataset]:
+    """Parse an archive member from memory, or None if it isn't a DICOM object."""
+    return parse_dicom(
+        io.BytesIO(member.data),
+        member.data[:PROBE_SIZE],
+        member.name,
+        ignore_dicomdir=ignore_dicomdir,
+        stop_before_pixels=stop_before_pixels,
+        specific_tags=specific_tags,
+    )
+
+
+def output_format(filename: pathlib.Path) -> Optional[str]:
+    """Determine the archive format to write based upon the file extension."""
+    name = filename.name.lower()
+
+    for extension, mode in OUTPUT_FORMATS.items():
+        if name.endswith(extension):
+            return mode
+
+    return None
+
+
+class ArchiveWriter:
+    """Write sorted files into a single zip or tar archive.
+
+    Archives can only be written sequentially, so workers determine the
+    destination of each file and a single writer adds them. Names are made
+    unique in memory, in the same way as files written to a directory.
+    """
+
+    filename: pathlib.Path
+
+    def __init__(self, filename: pathlib.Path, overwrite: bool = False) -> None:
+        mode = output_format(filename)
+
+        if mode is None:
+            raise ValueError("%s is not a supported archive format" % filename)
+
+        self.filename = filename
+        mkdir_p(filename.parent)
+
+        # Unless overwriting, only create a new archive (in the same way as
+        # exclusively creating files in an output directory)
+        create: Literal["w", "x"] = "w" if overwrite else "x"
+
+        self._archive: Union[zipfile.ZipFile, tarfile.TarFile]
+
+        try:
+            if mode == "zip":
+                self._archive = zipfile.ZipFile(filename, create, zipfile.ZIP_DEFLATED)
+            else:
+                self._archive = tarfile.open(
+                    filename, mode.replace("w", create), dereference=True
+                )
+        except FileExistsError:
+            raise DicomsorterException(
+                "%s already exists, use --overwrite to replace it" % filename
+            )
+
+        self._lock = threading.Lock()
+        self._names: Set[str] = set()
+        self._keys: Dict[str, str] = {}
+
+    def write(
+        self,
+        name: str,
+        source: Optional[pathlib.Path] = None,
+        data: Optional[bytes] = None,
+        key: str = "",
+    ) -> str:
+        """Add a file (or its contents) to the archive and return its unique name.
+
+        If a file with the same (non-empty) key was already added, nothing is
+        written and the name of the earlier file is returned.
+        """
+        with self._lock:
+            if key and key in self._keys:
+                return self._keys[key]
+
+            name = next(
+                candidate.as_posix()
+                for candidate in filename_generator(pathlib.Path(name))
+                if candidate.as_posix() not in self._names
+            )
+            self._names.add(name)
+
+            if key:
+                self._keys[key] = name
+
+            if data is None:
+                assert source is not None, "Either a source or data is required"
+                self._add_file(name, source)
+            else:
+                self._add_data(name, data)
+
+            return name
+
+    def _add_file(self, name: str, source: pathlib.Path) -> None:
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.write(source, name)
+        else:
+            self._archive.add(source, name)
+
+    def _add_data(self, name: str, data: bytes) -> None:
+        if isinstance(self._archive, zipfile.ZipFile):
+            self._archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self) -> None:
+        self._archive.close()
@@ -0,0 +1,126 @@
+import asyncio
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncGenerator,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+
+from .config import Config
+from .dicomsorter import DICOMSorter, SortResult
+
+
+class AsyncDICOMSorter(DICOMSorter):
+    """Sort files with a large number of concurrent reads and copies.
+
+    Each file still goes through the same ``resolve`` and ``place`` steps as
+    with DICOMSorter, but these are issued from an event loop onto a pool of
+    ``inflight`` threads. This keeps many requests outstanding on high-latency
+    (e.g. network) filesystems without the cost of a process per request.
+    """
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self.inflight = max(config.inflight, 1)
+
+    def dispatch(
+        self, dcm_files: Iterable[pathlib.Path], place: bool = True
+    ) -> Generator[List[Optional[SortResult]], None, None]:
+        loop = asyncio.new_event_loop()
+        completed = self.sort_async(dcm_files, place)
+
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(completed.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(completed.aclose())
+            loop.close()
+
+    async def sort_async(
+        self, dcm_files: Iterable[pathlib.Path], place: bool = True
+    ) -> AsyncGenerator[List[Optional[SortResult]], None]:
+        """Sort files concurrently, yielding the results as they complete."""
+        loop = asyncio.get_running_loop()
+        files: Iterator[pathlib.Path] = iter(dcm_files)
+
+        # Discovery may block (e.g. when streaming), so it gets its own thread
+        discoverer = ThreadPoolExecutor(max_workers=1)
+        workers = ThreadPoolExecutor(max_workers=self.inflight)
+
+        def next_file() -> "asyncio.Future[Optional[pathlib.Path]]":
+            return loop.run_in_executor(discoverer, next, files, None)
+
+        discovery: Optional["asyncio.Future[Optional[pathlib.Path]]"] = next_file()
+        exhausted = False
+        tasks: Set["asyncio.Future[Optional[SortResult]]"] = set()
+
+        try:
+            while discovery is not None or tasks:
+                waiting: Set["asyncio.Future[Any]"] = set(tasks)
+
+                if discovery is not None:
+                    waiting.add(discovery)
+
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if discovery is not None and discovery in done:
+                    filename = discovery.result()
+                    discovery = None
+
+                    if filename is None:
+                        exhausted = True
+                    else:
+                        tasks.add(
+                            asyncio.ensure_future(
+                                self.sort_file(filename, workers, place)
+                            )
+                        )
+
+                finished = [task for task in done if task in tasks]
+                tasks.difference_update(finished)
+
+                # Only look for more files while there is room for them
+                if not exhausted and discovery is None and len(tasks) < self.inflight:
+                    discovery = next_file()
+
+                if finished:
+                    yield [task.result() for task in finished]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            workers.shutdown(wait=True)
+            discoverer.shutdown(wait=False)
+
+    async def sort_file(
+        self,
+        source_filename: pathlib.Path,
+        executor: ThreadPoolExecutor,
+        place: bool = True,
+    ) -> Optional[SortResult]:
+        loop = asyncio.get_running_loop()
+
+        def resolve() -> Optional[SortResult]:
+            return self.profiled(self.resolve, source_filename)
+
+        # Reading and placing are separate so that they can interleave
+        result = await loop.run_in_executor(executor, resolve)
+
+        if not place:
+            return result
+
+        def place_result() -> Optional[SortResult]:
+            return self.profiled(self.place, result)
+
+        return await loop.run_in_executor(executor, place_result)
@@ -9,10 +9,21 @@ import sys
 import textwrap
 
 from . import __version__
-from .config import Config, logger
+from .async_sorter import AsyncDICOMSorter
+from .config import EXECUTORS, SKIP_EXTENSIONS, Config, logger
+from .dedupe import DEDUPE_MODES
 from .dicom_utils import available_fields
 from .dicomsorter import DICOMSorter
 from .errors import DicomsorterException
+from .plan import SortPlan
+from .profiling import PROFILE_MODES
+from .sharding import parse_shard
+from .transfer import LINK_MODES
+
+
+def extension(value: str) -> str:
+    """Normalize a file extension, e.g. TXT to .txt"""
+    return "." + value.lower().lstrip(".")
 
 
 def run() -> None:
@@ -30,13 +41,13 @@ def run() -> None:
     parser.add_argument(
         "input_directory",
         type=pathlib.Path,
-        help="directory to recursively search for DICOM images",
+        help="directory to recursively search for DICOM images, or a zip or tar archive",
     )
 
     parser.add_argument(
         "output_directory",
         type=pathlib.Path,
-        help="directory in which to place sorted DICOM images",
+        help="directory in which to place sorted DICOM images, or a .zip or .tar(.gz) archive to write them to",
     )
 
     parser.add_argument(
@@ -52,6 +63,33 @@ def run() -> None:
         help="format to use for the filename",
     )
 
+    parser.add_argument(
+        "--skip-extensions",
+        nargs="*",
+        type=extension,
+        default=list(SKIP_EXTENSIONS),
+        metavar="EXT",
+        help="extensions of files which are never opened to check whether they are "
+        "DICOM (default: %(default)s). Provide no extensions to check every file",
+    )
+
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        dest="memory_map",
+        help="memory map large files to read their headers, so that pixel data "
+        "isn't read into the page cache (best for local storage, with --move or "
+        "--link, and ignored with --read-pixel-data)",
+    )
+
+    parser.add_argument(
+        "--single-open",
+        action="store_true",
+        help="don't open files during discovery, instead checking whether each "
+        "file is DICOM while reading its header so that it is only opened once. "
+        "The progress bar then includes files which aren't DICOM",
+    )
+
     parser.add_argument(
         "--anonymize", action="store_true", help="anonymize the output images"
     )
@@ -78,10 +116,63 @@ def run() -> None:
         help="do not actually save the resulting images",
     )
 
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="keep an index of sorted files in the output directory and skip unchanged files on subsequent runs",
+    )
+
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="only sort the files in shard I of N (counting from 0), split by directory, so that N hosts can share the work (each with its own journal and index)",
+    )
+
+    parser.add_argument(
+        "--file-list",
+        type=pathlib.Path,
+        metavar="FILE",
+        help="sort the files listed (one per line) in FILE rather than searching the input directory",
+    )
+
+    parser.add_argument(
+        "--journal",
+        action="store_true",
+        help="record each operation in a journal within the output directory so an interrupted run can be resumed",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip files which an interrupted run already sorted, according to its journal",
+    )
+
+    parser.add_argument(
+        "--plan",
+        type=pathlib.Path,
+        metavar="PLAN_FILE",
+        help="save the destination of every file to a plan file rather than sorting",
+    )
+
+    parser.add_argument(
+        "--apply-plan",
+        type=pathlib.Path,
+        metavar="PLAN_FILE",
+        help="sort files according to a previously saved plan file",
+    )
+
     parser.add_argument(
         "--original-filename", action="store_true", help="use the original filename"
     )
 
+    parser.add_argument(
+        "--read-pixel-data",
+        action="store_false",
+        dest="header_only",
+        help="parse the entire file rather than stopping before the pixel data",
+    )
+
     parser.add_argument(
         "--concurrency",
         type=int,
@@ -89,12 +180,127 @@ def run() -> None:
         help=f"number of threads to perform sorting (default: {Config.concurrency})",
     )
 
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=Config.chunk_size,
+        help="number of files sent to a worker at once (default: adapt to the time taken per file)",
+    )
+
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default=Config.executor,
+        help=f"run workers as threads, processes, or parse in processes and copy in threads (default: {Config.executor})",
+    )
+
+    parser.add_argument(
+        "--discovery-workers",
+        type=int,
+        default=Config.discovery_workers,
+        help=f"number of threads used to search the input directory (default: {Config.discovery_workers})",
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="start sorting while files are still being discovered rather than finding all files first",
+    )
+
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=Config.queue_size,
+        help=f"maximum number of discovered files waiting to be sorted when streaming (default: {Config.queue_size})",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and sort files as they are added to the input directory",
+    )
+
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=Config.settle,
+        help=f"seconds a file must be unchanged before it is sorted when watching (default: {Config.settle})",
+    )
+
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="watch by listing the input directory rather than using inotify (e.g. for network filesystems)",
+    )
+
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=Config.poll_interval,
+        help=f"seconds between checks for new files when watching (default: {Config.poll_interval})",
+    )
+
+    parser.add_argument(
+        "--async",
+        action="store_true",
+        dest="use_async",
+        help="issue many concurrent reads and copies from an event loop, for high-latency filesystems",
+    )
+
+    parser.add_argument(
+        "--inflight",
+        type=int,
+        default=Config.inflight,
+        help=f"maximum number of files being sorted at once with --async (default: {Config.inflight})",
+    )
+
     parser.add_argument(
         "--move",
         action="store_true",
         help="move the original files rather than copying them",
     )
 
+    parser.add_argument(
+        "--link",
+        choices=LINK_MODES,
+        help="link to the original files rather than copying them (falls back to copying)",
+    )
+
+    parser.add_argument(
+        "--dedupe",
+        choices=DEDUPE_MODES,
+        help="skip files which duplicate an already sorted SOPInstanceUID or file content",
+    )
+
+    parser.add_argument(
+        "--stats-file",
+        type=pathlib.Path,
+        metavar="FILE",
+        help="write the latency of each stage and throughput of the run to FILE as JSON",
+    )
+
+    parser.add_argument(
+        "--live-stats",
+        action="store_true",
+        help="show the latency of each stage and throughput alongside the progress bar",
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=pathlib.Path,
+        metavar="DIR",
+        help="profile the main and worker processes, writing the profiles and a "
+        "merged summary to DIR",
+    )
+
+    parser.add_argument(
+        "--profile-mode",
+        choices=PROFILE_MODES,
+        default="cprofile",
+        help="profile every call (cprofile) or periodically sample the stack of "
+        "each worker to attribute time to each stage (sample)",
+    )
+
     parser.add_argument(
         "--force", action="store_true", help="automatically accept any prompts"
     )
@@ -112,6 +318,9 @@ def run() -> None:
     if arguments.anonymize:
         raise DicomsorterException("--anonymize is not yet supported")
 
+    if arguments.move and arguments.link:
+        raise DicomsorterException("--move and --link can not be used together")
+
     if not arguments.force:
         # Check if the user wants to move the files, but they aren't preserving files
         if arguments.move and arguments.overwrite and not arguments.dry_run:
@@ -128,7 +337,16 @@ def run() -> None:
                 return
 
     config = Config.from_dict(dict(**vars(arguments)))
-    DICOMSorter(config).start()
+    sorter = AsyncDICOMSorter(config) if config.use_async else DICOMSorter(config)
+
+    if arguments.apply_plan:
+        sorter.execute(SortPlan.load(arguments.apply_plan))
+    elif arguments.plan:
+        sorter.plan().save(arguments.plan)
+    elif arguments.watch:
+        sorter.watch()
+    else:
+        sorter.start()
 
 
 def main() -> None:
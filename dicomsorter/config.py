@@ -2,7 +2,27 @@ import logging
 import pathlib
 import sys
 from dataclasses import dataclass, field, fields
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+
+EXECUTORS = ("thread", "process", "hybrid")
+
+# Extensions of files which are never DICOM, so aren't opened during discovery
+SKIP_EXTENSIONS = (
+    ".bmp",
+    ".csv",
+    ".gif",
+    ".htm",
+    ".html",
+    ".jpeg",
+    ".jpg",
+    ".json",
+    ".log",
+    ".md",
+    ".pdf",
+    ".png",
+    ".txt",
+    ".xml",
+)
 
 _default_path = [
     "SeriesDescription",
@@ -16,13 +36,39 @@ class Config:
 
     filename_format: str = "%(ImageType)s (%(InstanceNumber)04d)%(Extension)s"
     path: List[str] = field(default_factory=lambda: _default_path)
+    skip_extensions: List[str] = field(default_factory=lambda: list(SKIP_EXTENSIONS))
     concurrency: int = 2
+    chunk_size: int = 0
+    discovery_workers: int = 1
+    executor: str = "process"
+    inflight: int = 256
+    queue_size: int = 1000
+    shard: Optional[Tuple[int, int]] = None
+    file_list: Optional[pathlib.Path] = None
+    settle: float = 2.0
+    poll_interval: float = 1.0
+    stats_file: Optional[pathlib.Path] = None
+    profile: Optional[pathlib.Path] = None
+    profile_mode: str = "cprofile"
 
+    dedupe: Optional[str] = None
     dry_run: bool = False
+    header_only: bool = True
+    index: bool = False
+    journal: bool = False
+    link: Optional[str] = None
+    memory_map: bool = False
     move: bool = False
     original_filename: bool = False
     overwrite: bool = False
+    poll: bool = False
+    resume: bool = False
+    single_open: bool = False
+    live_stats: bool = False
+    stream: bool = False
+    use_async: bool = False
     verbose: bool = False
+    watch: bool = False
 
     anonymize: bool = False
 
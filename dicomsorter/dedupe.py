@@ -0,0 +1,74 @@
+import hashlib
+import os
+import pathlib
+import uuid
+from typing import Optional
+
+from .utils import ensure_directory
+
+DEDUPE_MODES = ("uid", "content")
+DEDUPE_DIRECTORY = ".dicomsorter-dedupe"
+
+
+def content_hash(filename: pathlib.Path, chunk_size: int = 1 << 20) -> str:
+    """Hash the contents of a file without reading it into memory at once."""
+    digest = hashlib.sha256()
+
+    with open(filename, "rb") as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class DedupeIndex:
+    """Index of the instances which have already been placed in the output.
+
+    Each key (a SOPInstanceUID or content hash) is claimed by atomically
+    linking a file containing the destination into the index directory. This
+    works without a lock across processes, and hosts sharing the filesystem.
+    """
+
+    directory: pathlib.Path
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+
+    def path(self, key: str) -> pathlib.Path:
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return self.directory.joinpath(name[:2], name)
+
+    def claim(self, key: str, destination: pathlib.Path) -> Optional[pathlib.Path]:
+        """Claim a key for a destination.
+
+        If the key was already claimed and its destination still exists, the
+        existing destination is returned instead.
+        """
+        path = self.path(key)
+        ensure_directory(path.parent)
+
+        temporary = path.with_name(".%s.%s.tmp" % (path.name, uuid.uuid4()))
+        temporary.write_text(str(destination))
+
+        try:
+            os.link(temporary, path)
+            return None
+        except FileExistsError:
+            existing = pathlib.Path(path.read_text())
+
+            if os.path.lexists(existing):
+                return existing
+
+            # The previous copy has since been removed, so take its place
+            os.replace(temporary, path)
+            return None
+        finally:
+            if temporary.exists():
+                temporary.unlink()
+
+    def release(self, key: str) -> None:
+        """Remove a claim, e.g. because the file could not be placed."""
+        try:
+            self.path(key).unlink()
+        except FileNotFoundError:
+            pass
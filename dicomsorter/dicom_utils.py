@@ -1,15 +1,37 @@
+import io
+import mmap
 import os
 import pathlib
-from typing import Any, Dict, Generator, List, Optional, Set, Union
+import struct
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Collection,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
 import pydicom
 from pydicom import Dataset
+from pydicom.datadict import tag_for_keyword
 from pydicom.dicomdir import DicomDir
 from pydicom.errors import InvalidDicomError
+from pydicom.tag import BaseTag
 
-from .config import logger
-from .errors import DicomsorterException
-from .utils import clean_directory_name, recursive_string_interpolation
+from .config import SKIP_EXTENSIONS, logger
+from .errors import DicomsorterException, NotDicomError
+from .utils import clean_directory_name, compile_template, template_fields
 
 IMAGE_TYPE_MAP: Dict[str, Set[str]] = {
     "Phase": {"P"},
@@ -18,6 +40,46 @@ IMAGE_TYPE_MAP: Dict[str, Set[str]] = {
     "Magnitude": {"FFE", "M"},
 }
 
+# Number of files checked by each task when searching directories in parallel
+PROBE_BATCH_SIZE = 64
+
+# Number of bytes read from the start of a file to determine whether it is DICOM
+PROBE_SIZE = 512
+
+# Size of the (aligned) block read from the start of a file when loading it, which
+# is both probed and parsed so that most headers need only a single read
+HEADER_BUFFER_SIZE = 64 * 1024
+
+# Files at least this large may be memory mapped to read their header
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# Groups which a data set without a preamble (and file meta information) may
+# start with
+HEADERLESS_GROUPS = (0x0002, 0x0008)
+
+# Explicit VRs which have a reserved field followed by a four byte length
+LONG_VRS = {b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"UC", b"UN", b"UR", b"UT"}
+
+ELEMENT_HEADER = struct.Struct("<HHL")
+
+SERIES_DESCRIPTION_FORMAT = "Series%(SeriesNumber)04d_%(SeriesDescription)s"
+
+# Attributes that DICOM computes itself, mapped to the elements they are derived from
+DERIVED_FIELDS: Dict[str, Set[str]] = {
+    "Extension": set(),
+    "filename": set(),
+    "ImageType": {"ImageType"},
+    "PatientAge": {"PatientAge", "PatientBirthDate", "StudyDate"},
+    "SeriesDescription": set(template_fields(SERIES_DESCRIPTION_FORMAT)),
+}
+
+
+@lru_cache(maxsize=None)
+def keyword_tag(keyword: str) -> Optional[BaseTag]:
+    """Cached lookup of the tag for a DICOM keyword."""
+    tag = tag_for_keyword(keyword)
+    return None if tag is None else BaseTag(tag)
+
 
 def available_fields(directory: pathlib.Path) -> List[str]:
     dcm = next(dicom_list(directory, load=True))
@@ -30,31 +92,171 @@ def dicom_list(
     directory: pathlib.Path,
     load: bool = True,
     ignore_dicomdir: bool = True,
+    workers: int = 1,
+    select: Optional[Callable[[pathlib.Path], bool]] = None,
+    skip_extensions: Collection[str] = SKIP_EXTENSIONS,
+    probe: bool = True,
 ) -> Generator[Union[pathlib.Path, Dataset], None, None]:
+    """Find all DICOM files within a directory.
+
+    If provided, ``select`` is used to exclude files before they are opened, as
+    are files with any of the ``skip_extensions``. Without ``probe`` (and
+    ``load``), files aren't opened at all and may turn out not to be DICOM.
+    """
     # Check the validity of the folder
     if not directory.exists():
         raise DicomsorterException('Directory "%s" does not exist.' % directory)
 
     count = 0
 
+    # Loading requires opening every file anyway
+    probe = probe or load
+
+    if workers > 1:
+        candidates = search_parallel(
+            directory,
+            load,
+            ignore_dicomdir,
+            workers,
+            select=select,
+            skip_extensions=skip_extensions,
+            probe=probe,
+        )
+    else:
+        candidates = search(
+            directory, load, ignore_dicomdir, select, skip_extensions, probe
+        )
+
     # Setup a generator
+    for fullpath, dicom in candidates:
+        if dicom:
+            count += 1
+
+            if load is False:
+                yield fullpath
+            else:
+                assert isinstance(dicom, Dataset), "Unexpected data type"
+                yield dicom
+
+    # Raise a useful error message here if we didn't find any DICOMs (though a
+    # selection, e.g. a shard, may legitimately be empty)
+    if count == 0 and select is None:
+        raise DicomsorterException('No valid DICOMs found in "%s".' % directory)
+
+
+SearchResult = Tuple[pathlib.Path, Union[bool, Dataset]]
+
+
+def search(
+    directory: pathlib.Path,
+    load: bool = True,
+    ignore_dicomdir: bool = True,
+    select: Optional[Callable[[pathlib.Path], bool]] = None,
+    skip_extensions: Collection[str] = SKIP_EXTENSIONS,
+    probe: bool = True,
+) -> Generator[SearchResult, None, None]:
+    """Walk a directory and check whether each file is a DICOM."""
     for root, directories, files in os.walk(directory):
         for filename in files:
             fullpath = pathlib.Path(root).joinpath(filename)
-            dicom = is_dicom(fullpath, load=load, ignore_dicomdir=ignore_dicomdir)
 
-            if dicom:
-                count += 1
+            if select is not None and not select(fullpath):
+                continue
+
+            if not probe:
+                yield fullpath, not has_skipped_extension(fullpath, skip_extensions)
+                continue
+
+            yield fullpath, is_dicom(
+                fullpath,
+                load=load,
+                ignore_dicomdir=ignore_dicomdir,
+                skip_extensions=skip_extensions,
+            )
+
+
+def search_parallel(
+    directory: pathlib.Path,
+    load: bool = True,
+    ignore_dicomdir: bool = True,
+    workers: int = 4,
+    batch_size: int = PROBE_BATCH_SIZE,
+    select: Optional[Callable[[pathlib.Path], bool]] = None,
+    skip_extensions: Collection[str] = SKIP_EXTENSIONS,
+    probe: bool = True,
+) -> Generator[SearchResult, None, None]:
+    """Walk a directory and check whether each file is a DICOM using many threads.
+
+    Subdirectories are listed concurrently and the files within them are checked
+    in batches, so results are produced in no particular order.
+    """
+
+    def check(paths: List[pathlib.Path]) -> List[SearchResult]:
+        if not probe:
+            return [
+                (path, not has_skipped_extension(path, skip_extensions))
+                for path in paths
+            ]
+
+        return [
+            (
+                path,
+                is_dicom(
+                    path,
+                    load=load,
+                    ignore_dicomdir=ignore_dicomdir,
+                    skip_extensions=skip_extensions,
+                ),
+            )
+            for path in paths
+        ]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        listings: Set["Future[Any]"] = {executor.submit(scan_directory, directory)}
+        probes: Set["Future[Any]"] = set()
+
+        while listings or probes:
+            done, _ = wait(listings | probes, return_when=FIRST_COMPLETED)
+
+            for future in done & listings:
+                listings.remove(future)
+                files, subdirectories = future.result()
+
+                for subdirectory in subdirectories:
+                    listings.add(executor.submit(scan_directory, subdirectory))
+
+                if select is not None:
+                    files = [f for f in files if select(f)]
+
+                for start in range(0, len(files), batch_size):
+                    batch = files[start : start + batch_size]
+                    probes.add(executor.submit(check, batch))
+
+            for future in done & probes:
+                probes.remove(future)
+                yield from future.result()
 
-                if load is False:
-                    yield fullpath
+
+def scan_directory(
+    directory: pathlib.Path,
+) -> Tuple[List[pathlib.Path], List[pathlib.Path]]:
+    """List the files and subdirectories (excluding symlinks) of a directory."""
+    files = []
+    subdirectories = []
+
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # Mimic os.walk which doesn't descend into symlinked directories
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirectories.append(pathlib.Path(entry.path))
                 else:
-                    assert isinstance(dicom, Dataset), "Unexpected data type"
-                    yield dicom
+                    files.append(pathlib.Path(entry.path))
+    except OSError as e:
+        logger.debug(e)
 
-    # Raise a useful error message here if we didn't find any DICOMs
-    if count == 0:
-        raise DicomsorterException('No valid DICOMs found in "%s".' % directory)
+    return files, subdirectories
 
 
 def age_in_years(dcm: Dataset) -> str:
@@ -72,39 +274,223 @@ def age_in_years(dcm: Dataset) -> str:
     return age
 
 
+def required_tags(fields: Iterable[str]) -> Optional[Set[str]]:
+    """Compute the set of DICOM keywords needed to resolve the provided fields.
+
+    The elements used by the attributes that DICOM always derives are included.
+    None is returned if any field is not a known keyword or derived attribute,
+    in which case the entire dataset needs to be read.
+    """
+    tags: Set[str] = set()
+
+    for derived in DERIVED_FIELDS.values():
+        tags.update(derived)
+
+    for field in fields:
+        if field in DERIVED_FIELDS:
+            continue
+
+        if tag_for_keyword(field) is None:
+            return None
+
+        tags.add(field)
+
+    return tags
+
+
 def is_dicom(
     filename: pathlib.Path,
     load: bool = True,
     ignore_dicomdir: bool = True,
+    stop_before_pixels: bool = False,
+    specific_tags: Optional[Iterable[str]] = None,
+    skip_extensions: Collection[str] = SKIP_EXTENSIONS,
+    memory_map: bool = False,
 ) -> Union[bool, Dataset]:
-    """Check whether a file is a DICOM object or not."""
-    if load is False:
-        return has_dicm_prefix(filename)
+    """Check whether a file is a DICOM object or not.
+
+    Files with any of the ``skip_extensions`` are rejected without being
+    opened. Otherwise the start of the file is probed for either the DICM
+    prefix or a data set without a preamble, and only then parsed when ``load``
+    is set. The probe and parser share one buffered read of the start of the
+    file, so headers smaller than the buffer are parsed without further reads.
+
+    When ``stop_before_pixels`` is set, only the header is parsed and reading
+    stops before the (potentially very large) pixel data element. Providing
+    ``specific_tags`` further limits the elements that are parsed. Setting
+    ``memory_map`` parses the header of large files from a memory mapping
+    instead (see ``open_header``).
+    """
+    if has_skipped_extension(filename, skip_extensions):
+        return False
 
     try:
-        dicom = pydicom.dcmread(filename)
-        if (
-            dicom
-            and ignore_dicomdir
-            and (
-                isinstance(dicom, DicomDir)
-                or os.path.basename(filename).lower() == "dicomdir"
+        with open_header(filename, load, memory_map, stop_before_pixels) as fid:
+            if isinstance(fid, mmap.mmap):
+                data = fid[:PROBE_SIZE]
+            else:
+                # Peeking fills the buffer without moving the position of the file
+                data = fid.peek(PROBE_SIZE)[:PROBE_SIZE]
+
+            if load is False:
+                return has_preamble(data) or is_headerless(data)
+
+            dicom = parse_dicom(
+                cast(BinaryIO, fid),
+                data,
+                filename.name,
+                ignore_dicomdir=ignore_dicomdir,
+                stop_before_pixels=stop_before_pixels,
+                specific_tags=specific_tags,
             )
-        ):
-            return False
 
-        return dicom
+        return False if dicom is None else dicom
     except IOError as e:
         logger.warning(e)
         return False
+
+
+def parse_dicom(
+    fid: BinaryIO,
+    probe: bytes,
+    name: str,
+    ignore_dicomdir: bool = True,
+    stop_before_pixels: bool = False,
+    specific_tags: Optional[Iterable[str]] = None,
+) -> Optional[Dataset]:
+    """Parse a DICOM object from a file (or archive member), or None if it isn't one.
+
+    The ``probe`` is the start of the file, which must have either the DICM
+    prefix or look like a data set without a preamble.
+    """
+    preamble = has_preamble(probe)
+
+    if not preamble and not is_headerless(probe):
+        return None
+
+    if specific_tags is not None:
+        # pydicom needs the directory records to construct a DicomDir
+        specific_tags = [*specific_tags, "DirectoryRecordSequence"]
+
+    try:
+        # Data sets without a preamble can only be read by forcing pydicom
+        dicom = pydicom.dcmread(
+            fid,
+            stop_before_pixels=stop_before_pixels,
+            specific_tags=specific_tags,
+            force=not preamble,
+        )
     except InvalidDicomError:
-        return False
+        return None
+
+    if ignore_dicomdir and (
+        isinstance(dicom, DicomDir) or os.path.basename(name).lower() == "dicomdir"
+    ):
+        return None
+
+    return dicom
+
+
+@contextmanager
+def open_header(
+    filename: pathlib.Path,
+    load: bool = True,
+    memory_map: bool = False,
+    stop_before_pixels: bool = False,
+) -> Generator[Union[io.BufferedReader, mmap.mmap], None, None]:
+    """Open a file to probe (and parse) the start of it.
+
+    The start of the file is normally read in a single block, which is large
+    enough to hold most headers when loading. With ``memory_map``, the headers
+    of large files are instead parsed from a mapping with readahead disabled,
+    so that only the pages holding the header are read and pixel data doesn't
+    displace the page cache. Files which are read in full (including their
+    pixel data) are always read sequentially.
+    """
+    with io.FileIO(filename) as raw:
+        if (
+            memory_map
+            and load
+            and stop_before_pixels
+            and os.fstat(raw.fileno()).st_size >= MMAP_THRESHOLD
+        ):
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                if hasattr(mmap, "MADV_RANDOM"):
+                    mapping.madvise(mmap.MADV_RANDOM)
+
+                yield mapping
+
+            return
+
+        with io.BufferedReader(raw, HEADER_BUFFER_SIZE if load else PROBE_SIZE) as fid:
+            yield fid
+
+
+def has_skipped_extension(
+    filename: pathlib.Path, skip_extensions: Collection[str]
+) -> bool:
+    return filename.suffix.lower() in skip_extensions
 
 
 def has_dicm_prefix(filename: pathlib.Path) -> bool:
     with open(filename, "rb") as fid:
-        fid.seek(128)
-        return fid.read(4) == b"DICM"
+        return has_preamble(fid.read(132))
+
+
+def has_preamble(data: bytes) -> bool:
+    """Whether the start of a file has the preamble and DICM prefix."""
+    return data[128:132] == b"DICM"
+
+
+def element_end(data: bytes, offset: int, size: int) -> Optional[int]:
+    """Offset of the end of the element starting at ``offset``, if it is plausible.
+
+    Both implicit and explicit VR little endian encodings are accepted.
+    """
+    if offset + ELEMENT_HEADER.size > len(data):
+        return None
+
+    _, _, length = ELEMENT_HEADER.unpack_from(data, offset)
+    end = offset + ELEMENT_HEADER.size + length
+    vr = data[offset + 4 : offset + 6]
+
+    if vr.isalpha() and vr.isupper():
+        if vr in LONG_VRS:
+            (length,) = struct.unpack_from("<L", data, offset + 8)
+            end = offset + 12 + length
+        else:
+            (length,) = struct.unpack_from("<H", data, offset + 6)
+            end = offset + 8 + length
+
+    return end if end <= size else None
+
+
+def is_headerless(data: bytes) -> bool:
+    """Whether the start of a file looks like a data set without a preamble.
+
+    Some older implementations write the data set alone, which starts directly
+    with an element of group 0x0008 (or file meta information without the
+    preamble). The first two elements must lie within the probed data, with
+    the tag of the second greater than that of the first.
+    """
+    if len(data) < ELEMENT_HEADER.size:
+        return False
+
+    group, element, _ = ELEMENT_HEADER.unpack_from(data)
+
+    if group not in HEADERLESS_GROUPS:
+        return False
+
+    end = element_end(data, 0, len(data))
+
+    if end is None or end + 4 > len(data):
+        return False
+
+    following = struct.unpack_from("<HH", data, end)
+
+    return (
+        following > (group, element) and element_end(data, end, len(data)) is not None
+    )
 
 
 class DICOM:
@@ -115,14 +501,25 @@ class DICOM:
         self,
         filename: pathlib.Path,
         dcm: Optional[Dataset] = None,
+        stop_before_pixels: bool = False,
+        specific_tags: Optional[Iterable[str]] = None,
+        memory_map: bool = False,
     ) -> None:
         """Takes a DICOM filename in and returns a helper class."""
 
         self.filename = filename
 
-        ds = dcm or is_dicom(self.filename, load=True)
+        ds = dcm or is_dicom(
+            self.filename,
+            load=True,
+            stop_before_pixels=stop_before_pixels,
+            specific_tags=specific_tags,
+            # Files are only loaded once they have been selected for sorting
+            skip_extensions=(),
+            memory_map=memory_map,
+        )
         if ds is None or ds is False:
-            raise DicomsorterException("%s is not a DICOM file" % filename)
+            raise NotDicomError("%s is not a DICOM file" % filename)
 
         assert isinstance(ds, Dataset), "Unexpected datatype"
 
@@ -147,12 +544,24 @@ class DICOM:
 
         return value
 
+    def get(self, attribute: str) -> Any:
+        """Equivalent of __getitem__ that avoids exceptions for common lookups."""
+        if attribute in self.__dict__:
+            return self.__dict__[attribute]
+
+        tag = keyword_tag(attribute)
+
+        if tag is None or attribute in _DICOM_ATTRIBUTES:
+            return self[attribute]
+
+        return self.dicom[tag].value if tag in self.dicom else ""
+
     def enhanced_series_description(self) -> str:
-        return self.format("Series%(SeriesNumber)04d_%(SeriesDescription)s")
+        return self.format(SERIES_DESCRIPTION_FORMAT)
 
     def format(self, format_string: str) -> str:
         # Format the DICOM in the specified way and clean the result
-        return clean_directory_name(recursive_string_interpolation(format_string, self))
+        return clean_directory_name(compile_template(format_string)(self, self.get))
 
     def friendly_image_type(self) -> str:
         try:
@@ -182,3 +591,6 @@ class DICOM:
                 age = "%03dY" % computed_age
 
         return age
+
+
+_DICOM_ATTRIBUTES = frozenset(dir(DICOM))
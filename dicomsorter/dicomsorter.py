@@ -1,99 +1,987 @@
+import hashlib
+import json
 import os
 import pathlib
-import shutil
 import sys
-from tempfile import mktemp
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+    cast,
+)
 
 import tqdm
-from fasteners.process_lock import interprocess_locked  # type: ignore[import]
 from pathos.helpers import freeze_support  # type: ignore[import]
 from pathos.multiprocessing import ProcessPool  # type: ignore[import]
 
+from . import profiling as profile
+from .archive import (
+    ArchiveMember,
+    ArchiveWriter,
+    archive_members,
+    is_archive,
+    output_format,
+    read_member,
+)
 from .config import Config, logger
-from .dicom_utils import DICOM, dicom_list
-from .utils import clean_directory_name, find_unique_filename, mkdir_p
+from .dedupe import DEDUPE_DIRECTORY, DedupeIndex, content_hash
+from .dicom_utils import (
+    DICOM,
+    dicom_list,
+    has_skipped_extension,
+    is_dicom,
+    required_tags,
+)
+from .errors import DicomsorterException, NotDicomError
+from .index import INDEX_FILENAME, ScanIndex
+from .journal import JOURNAL_FILENAME, Journal, repair
+from .plan import Operation, SortPlan, build_plan
+from .scheduling import BatchResult, BatchScheduler, run_batch
+from .sharding import ShardFilter, read_file_list, shard_filename
+from .stats import Stats, collect, collecting
+from .stats import current as current_stats
+from .stats import increment, install, timed, timer
+from .transfer import transfer
+from .utils import (
+    Throttle,
+    cache_scope,
+    claim_filename,
+    claim_unique_filename,
+    clean_directory_name,
+    counted,
+    ensure_directory,
+    find_unique_filename,
+    mkdir_p,
+    release_unique_filename,
+    template_fields,
+    thread_imap,
+)
+from .watch import QuiescenceTracker, Watcher, create_watcher
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class SortResult:
+    source: pathlib.Path
+    destination: pathlib.Path
+    fields: Dict[str, str]
+
+    # Identifies duplicate instances when deduplicating
+    key: str = ""
+
+    # Status of the source before it was sorted, for the scan index
+    stat: Optional[os.stat_result] = None
 
 
 class DICOMSorter(object):
     """Class for sorting DICOM objects into a directory structure."""
 
     config: Config
+    run_id: str
+    cache_id: str
+    tags: Optional[Set[str]]
+    dedupe: Optional[DedupeIndex]
+    journal: Optional[Journal]
 
     def __init__(self, config: Config):
         self.config = config
-        self._lock = None
+        self.run_id = uuid.uuid4().hex
+
+        # Scope of the per-process caches of directories and filenames
+        self.cache_id = self.run_id
+
+        # Process which started the run, as opposed to a worker process
+        self.pid = os.getpid()
+
+        # Determine up front which elements need to be parsed from each file
+        self.tags = required_tags(self.fields()) if config.header_only else None
+
+        if self.tags is not None and config.dedupe == "uid":
+            self.tags.add("SOPInstanceUID")
+
+        self.dedupe = None
+
+        if config.dedupe:
+            self.dedupe = DedupeIndex(
+                config.output_directory.joinpath(DEDUPE_DIRECTORY, config.dedupe)
+            )
+
+        self.journal = None
+
+        if (
+            (config.journal or config.resume)
+            and not config.dry_run
+            and output_format(config.output_directory) is None
+        ):
+            self.journal = Journal(
+                shard_filename(
+                    config.output_directory.joinpath(JOURNAL_FILENAME), config.shard
+                ),
+                self.run_id,
+            )
 
     def start(self) -> None:
         # Required for pathos multiprocessing on Windows
         if sys.platform == "win32":
             freeze_support()
 
-        dcm_list = dicom_list(self.config.input_directory, load=False)
+        with self.profiling_run(), self.collecting_stats() as stats:
+            if is_archive(self.config.input_directory):
+                self.sort_archive()
+            else:
+                self.sort_directory(stats)
+
+    def sort_directory(self, stats: Optional[Stats] = None) -> None:
+        """Sort the files within the input directory (or file list)."""
+        # If we aren't going to be showing output for each file, then show the progress bar
+        progress = tqdm.tqdm(disable=self.config.verbose or self.config.dry_run)
+
+        started = time.perf_counter()
+        refreshed = 0.0
 
-        # Eager-load all filenames mainly so we have the total count
-        dcm_files = [dcm for dcm in dcm_list if dcm]
+        dcm_files: Iterable[pathlib.Path] = timed(self.discover(), "discovery")
+        profiler = self.profiler("main")
 
-        # Skip multiprocessing overhead when concurrency is 1
+        if profiler is not None:
+            dcm_files = profiler.profiled(dcm_files)
+        completed = self.resume()
+
+        if completed:
+            dcm_files = (f for f in dcm_files if f not in completed)
+
+        index = None
+        writer = self.open_writer()
+
+        try:
+            if writer is not None and self.config.index:
+                logger.warning("The scan index is not used when writing to an archive")
+            elif self.config.index and not self.config.dry_run:
+                index = self.open_index()
+                dcm_files = index.changed(dcm_files)
+
+            throttle = None
+
+            if self.config.stream:
+                # Overlap discovery with sorting and only keep a bounded number
+                # of files in flight, growing the progress bar total as files
+                # are found
+                throttle = Throttle(self.config.queue_size)
+                dcm_files = throttle(counted(dcm_files, progress))
+            else:
+                # Eager-load all filenames mainly so we have the total count
+                dcm_files = list(dcm_files)
+                progress.total = len(dcm_files)
+
+            # Files are added to an archive by this process, so workers only
+            # resolve them
+            for results in self.dispatch(dcm_files, place=writer is None):
+                for result in results:
+                    if throttle is not None:
+                        throttle.release()
+
+                    if writer is not None:
+                        self.write(writer, result)
+
+                    if index is not None and result is not None:
+                        index.record(
+                            result.source,
+                            result.destination,
+                            result.fields,
+                            result.stat,
+                        )
+
+                progress.update(len(results))
+
+                if stats is not None:
+                    stats.increment("files", sum(r is not None for r in results))
+                    stats.increment("failed", sum(r is None for r in results))
+
+                    # Show a summary of the statistics alongside the progress bar
+                    elapsed = time.perf_counter() - started
+
+                    if self.config.live_stats and elapsed - refreshed > 0.5:
+                        refreshed = elapsed
+                        progress.set_postfix_str(stats.summary(elapsed))
+        finally:
+            progress.close()
+
+            # Commit the files recorded so far, even if sorting failed
+            if index is not None:
+                index.close()
+
+            # An archive which isn't closed can't be read
+            if writer is not None:
+                writer.close()
+
+            if self.journal is not None:
+                self.journal.close()
+
+    def profiler(self, name: str) -> Optional[profile.Profiler]:
+        """The profiler of this process for the run, if profiling was requested."""
+        if self.config.profile is None:
+            return None
+
+        return profile.get_profiler(
+            self.config.profile, name, self.config.profile_mode, self.run_id
+        )
+
+    @contextmanager
+    def profiling_run(self) -> Generator[None, None, None]:
+        """Summarize the profiles of a run within this block, if requested.
+
+        The profiles are summarized even if sorting fails.
+        """
+        if self.config.profile is None:
+            yield
+            return
+
+        profile.prepare(self.config.profile)
+
+        try:
+            yield
+        finally:
+            profile.flush()
+            summary = profile.summarize(self.config.profile)
+            logger.info("Wrote a summary of the profiles to %s", summary)
+
+    @contextmanager
+    def profiling(self) -> Generator[None, None, None]:
+        """Profile the work done by a worker within this block, if requested."""
+        profiler = self.profiler("worker")
+
+        if profiler is None:
+            yield
+            return
+
+        with profiler.profile():
+            yield
+
+        # Worker processes have no hook at exit, so save after each block
+        if os.getpid() != self.pid:
+            profiler.save()
+
+    def profiled(self, func: Callable[[T], R], item: T) -> R:
+        with self.profiling():
+            return func(item)
+
+    def layout(self) -> str:
+        """Hash of the options which determine the destination of each file."""
+        options = [
+            self.config.path,
+            self.config.filename_format,
+            self.config.original_filename,
+            self.config.dedupe,
+        ]
+
+        return hashlib.sha1(json.dumps(options).encode()).hexdigest()
+
+    def open_index(self) -> ScanIndex:
+        mkdir_p(self.config.output_directory)
+
+        filename = shard_filename(
+            self.config.output_directory.joinpath(INDEX_FILENAME), self.config.shard
+        )
+
+        return ScanIndex(filename, layout=self.layout())
+
+    @property
+    def collect_stats(self) -> bool:
+        return self.config.live_stats or self.config.stats_file is not None
+
+    @contextmanager
+    def collecting_stats(self) -> Generator[Optional[Stats], None, None]:
+        """Collect the statistics of a run within this block, if requested.
+
+        The statistics file is written even if sorting fails.
+        """
+        if not self.collect_stats:
+            yield None
+            return
+
+        stats = Stats()
+        install(stats)
+        started = time.perf_counter()
+
+        try:
+            yield stats
+        finally:
+            install(None)
+
+            if self.config.stats_file is not None:
+                stats.save(self.config.stats_file, time.perf_counter() - started)
+
+    def resume(self) -> Set[pathlib.Path]:
+        """Prepare the journal, returning the files which previous runs sorted.
+
+        Unless resuming, the journal of any previous run is discarded.
+        Operations which were interrupted are cleaned up so that they can be
+        performed again.
+        """
+        if self.journal is None:
+            return set()
+
+        mkdir_p(self.config.output_directory)
+
+        if not self.config.resume:
+            self.journal.reset()
+            return set()
+
+        state = self.journal.load()
+        completed = set(state.completed)
+
+        for source, destination in state.incomplete.items():
+            if repair(source, destination):
+                self.journal.done(source, destination)
+                completed.add(source)
+
+        logger.info("Resuming, skipping %d previously sorted files", len(completed))
+
+        return completed
+
+    def open_writer(self) -> Optional[ArchiveWriter]:
+        """Open the output archive, if the output is an archive rather than a directory."""
+        if self.config.dry_run or output_format(self.config.output_directory) is None:
+            return None
+
+        if self.config.move or self.config.link:
+            logger.warning("Files are always copied into an archive")
+
+        return ArchiveWriter(self.config.output_directory, self.config.overwrite)
+
+    def write(
+        self,
+        writer: ArchiveWriter,
+        result: Optional[SortResult],
+        data: Optional[bytes] = None,
+    ) -> None:
+        """Add a resolved file to the output archive."""
+        if result is None:
+            return
+
+        try:
+            name = result.destination.relative_to(self.config.output_directory)
+            unique = writer.write(name.as_posix(), result.source, data, result.key)
+            result.destination = self.config.output_directory.joinpath(unique)
+
+            logger.debug("%s -> %s", result.source, result.destination)
+        except Exception as e:
+            logger.error(e)
+
+    def sort_archive(self) -> None:
+        """Sort the members of a zip or tar archive without extracting it to disk."""
+        progress = tqdm.tqdm(disable=self.config.verbose or self.config.dry_run)
+
+        if self.config.move or self.config.link:
+            logger.warning("Files are always copied out of an archive")
+
+        if self.config.index:
+            logger.warning("The scan index is not used when sorting an archive")
+
+        writer = self.open_writer()
+
+        # Members are held in memory until sorted (and may be very large), so only
+        # read ahead enough to keep every thread busy
+        throttle = Throttle(min(self.config.queue_size, 2 * self.config.concurrency))
+        members = throttle(
+            counted(archive_members(self.config.input_directory), progress)
+        )
+
+        def sort(member: ArchiveMember) -> Optional[SortResult]:
+            with self.profiling():
+                if writer is None:
+                    return self.sort_member(member)
+
+                result = self.resolve_member(member)
+                self.write(writer, result, member.data)
+
+            return result
+
+        try:
+            # Threads avoid copying the contents of each member to another process
+            for result in self.map(sort, members, executor="thread"):
+                throttle.release()
+                progress.update()
+
+                # Members which aren't DICOM are skipped rather than failing
+                if result is not None:
+                    increment("files")
+        finally:
+            progress.close()
+
+            # An archive which isn't closed can't be read
+            if writer is not None:
+                writer.close()
+
+    def watch(self, stop: Optional[threading.Event] = None) -> None:
+        """Continuously sort files as they are added to the input directory.
+
+        Files are sorted once they haven't changed for the configured settle
+        time. Worker pools and caches are kept between batches of new files.
+        """
+        if output_format(self.config.output_directory) is not None:
+            raise DicomsorterException("Watching can not write to an archive")
+
+        if is_archive(self.config.input_directory):
+            raise DicomsorterException("Watching requires an input directory")
+
+        stop = stop or threading.Event()
+        completed = self.resume()
+        watcher = create_watcher(self.config.input_directory, poll=self.config.poll)
+        tracker = QuiescenceTracker(self.config.settle)
+        index = None
+
+        if self.config.index and not self.config.dry_run:
+            index = self.open_index()
+
+        logger.info("Watching %s for new files", self.config.input_directory)
+
+        with self.profiling_run(), self.collecting_stats() as stats:
+            try:
+                self.watch_batches(watcher, tracker, stop, index, stats, completed)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                watcher.close()
+
+                if index is not None:
+                    index.close()
+
+                if self.journal is not None:
+                    self.journal.close()
+
+    def watch_batches(
+        self,
+        watcher: Watcher,
+        tracker: QuiescenceTracker,
+        stop: threading.Event,
+        index: Optional[ScanIndex] = None,
+        stats: Optional[Stats] = None,
+        completed: Optional[Set[pathlib.Path]] = None,
+    ) -> None:
+        """Sort each batch of files which have settled until asked to stop.
+
+        Files which were ``completed`` by an interrupted run are skipped.
+        """
+        started = time.perf_counter()
+
+        while not stop.is_set():
+            tracker.update(watcher.changes(self.config.poll_interval))
+            dcm_files: Iterable[pathlib.Path] = filter(
+                self.is_candidate, tracker.ready()
+            )
+
+            if completed:
+                dcm_files = (f for f in dcm_files if f not in completed)
+
+            if index is not None:
+                dcm_files = index.changed(dcm_files)
+
+            # Sorted directories may have been removed since the last batch
+            self.cache_id = uuid.uuid4().hex
+            count = 0
+
+            for results in self.dispatch(list(dcm_files)):
+                for result in results:
+                    if result is None:
+                        continue
+
+                    count += 1
+
+                    if index is not None:
+                        index.record(
+                            result.source,
+                            result.destination,
+                            result.fields,
+                            result.stat,
+                        )
+
+            if stats is not None:
+                stats.increment("files", count)
+
+            if count and self.config.live_stats and stats is not None:
+                elapsed = time.perf_counter() - started
+                logger.info("Sorted %d new files (%s)", count, stats.summary(elapsed))
+            elif count:
+                logger.info("Sorted %d new files", count)
+
+            if index is not None:
+                index.commit()
+
+    def is_candidate(self, filename: pathlib.Path) -> bool:
+        """Check whether a file found while watching should be sorted."""
+        # The output may be within the input directory
+        if self.config.output_directory.resolve() in filename.resolve().parents:
+            return False
+
+        return bool(
+            is_dicom(filename, load=False, skip_extensions=self.config.skip_extensions)
+        )
+
+    def dispatch(
+        self, dcm_files: Iterable[pathlib.Path], place: bool = True
+    ) -> Generator[List[Optional[SortResult]], None, None]:
+        """Sort files using the configured executor, yielding batches of results.
+
+        If ``place`` is False, files are only resolved and not transferred.
+        """
+        sort = self.sort if place else self.resolve
+
+        # Skip batching overhead when everything runs in this process
         if self.config.concurrency == 1:
-            iterator = map(self.sort, dcm_files)
+            for dcm_file in dcm_files:
+                yield [self.profiled(sort, dcm_file)]
+            return
+
+        scheduler = BatchScheduler(
+            size=self.config.chunk_size or None,
+            max_pending=self.config.queue_size if self.config.stream else None,
+        )
+
+        # Only keep a few batches in flight so batch sizes adapt to their timings
+        throttle = Throttle(self.config.concurrency * 2)
+        batches = throttle(scheduler.batches(dcm_files))
+
+        def completed(
+            batch_results: Iterable[BatchResult[Optional[SortResult]]],
+        ) -> Generator[List[Optional[SortResult]], None, None]:
+            for batch in batch_results:
+                throttle.release()
+                scheduler.record(len(batch.results), batch.elapsed)
+                collect(batch.stats)
+                yield batch.results
+
+        if self.config.executor == "hybrid" and not place:
+            yield from completed(
+                self.map(self.resolve_batch, batches, executor="process")
+            )
+        elif self.config.executor == "hybrid":
+            # Parse headers in processes and perform the I/O bound transfers in threads
+            resolved = self.map(self.resolve_batch, batches, executor="process")
+            placed = self.map(self.place_batch, completed(resolved), executor="thread")
+
+            for batch in placed:
+                collect(batch.stats)
+                yield batch.results
+        elif not place:
+            yield from completed(self.map(self.resolve_batch, batches))
         else:
-            pool = ProcessPool(self.config.concurrency)
-            iterator = pool.imap(self.sort, dcm_files)
+            yield from completed(self.map(self.sort_batch, batches))
 
-        # If we aren't going to be showing output for each file, then show the progress bar
-        if not self.config.verbose and not self.config.dry_run:
-            iterator = tqdm.tqdm(iterator, total=len(dcm_files))
+    def plan(self) -> SortPlan:
+        """Determine the destination of every file without sorting anything."""
+        if output_format(self.config.output_directory) is not None:
+            raise DicomsorterException("Plans can not write to an archive")
+
+        executor = "process" if self.config.executor == "hybrid" else None
+        operations = (
+            (result.source, result.destination)
+            for result in self.map(self.resolve, self.discover(), executor=executor)
+            if result is not None
+        )
+
+        return build_plan(operations, overwrite=self.config.overwrite)
+
+    def execute(self, plan: SortPlan) -> None:
+        """Perform all operations of a previously computed plan."""
+        if output_format(self.config.output_directory) is not None:
+            raise DicomsorterException("Plans can not write to an archive")
+
+        self.precreate_directories(plan.directories)
+
+        completed = self.resume()
+        operations = [op for op in plan.operations if op.source not in completed]
+
+        progress = tqdm.tqdm(
+            total=len(operations),
+            disable=self.config.verbose or self.config.dry_run,
+        )
+
+        executor = "thread" if self.config.executor == "hybrid" else None
+        batches = ([operation] for operation in operations)
+
+        with self.profiling_run(), self.collecting_stats():
+            try:
+                # Statistics recorded by workers are returned with each batch
+                for batch in self.map(self.apply_batch, batches, executor=executor):
+                    collect(batch.stats)
+                    increment("files", len(batch.results))
+                    progress.update(len(batch.results))
+            finally:
+                progress.close()
+
+                if self.journal is not None:
+                    self.journal.close()
+
+    def map(
+        self,
+        func: Callable[[T], R],
+        iterable: Iterable[T],
+        executor: Optional[str] = None,
+    ) -> Iterable[R]:
+        """Apply a function to each item using the configured concurrency."""
+        executor = executor or self.config.executor
+
+        # Skip multiprocessing overhead when concurrency is 1
+        if self.config.concurrency == 1:
+            return map(func, iterable)
+
+        if executor == "thread":
+            return thread_imap(func, iterable, self.config.concurrency)
+
+        pool = ProcessPool(self.config.concurrency)
+        return cast(Iterable[R], pool.imap(func, iterable))
 
-        for _ in iterator:
-            pass
+    def discover(self) -> Generator[pathlib.Path, None, None]:
+        """Lazily find all DICOM files within the input directory (or file list)."""
+        select = None
+
+        if self.config.shard is not None:
+            select = ShardFilter(self.config.input_directory, *self.config.shard)
+
+        if self.config.file_list is not None:
+            yield from self.read_file_list(self.config.file_list, select)
+            return
+
+        dcm_list = dicom_list(
+            self.config.input_directory,
+            load=False,
+            workers=self.config.discovery_workers,
+            select=select,
+            skip_extensions=self.config.skip_extensions,
+            probe=not self.config.single_open,
+        )
+
+        for dcm in dcm_list:
+            assert isinstance(dcm, pathlib.Path), "Unexpected data type"
+            yield dcm
+
+    def read_file_list(
+        self,
+        filename: pathlib.Path,
+        select: Optional[Callable[[pathlib.Path], bool]] = None,
+    ) -> Generator[pathlib.Path, None, None]:
+        """Read the files to sort from a list rather than searching for them.
+
+        Relative paths are relative to the input directory.
+        """
+        for path in read_file_list(filename):
+            path = self.config.input_directory.joinpath(path)
+
+            if select is not None and not select(path):
+                continue
+
+            if self.config.single_open:
+                if not has_skipped_extension(path, self.config.skip_extensions):
+                    yield path
+            elif is_dicom(
+                path, load=False, skip_extensions=self.config.skip_extensions
+            ):
+                yield path
+
+    def fields(self) -> List[str]:
+        """List the fields referenced by the output path and filename."""
+        fields = list(self.config.path)
+
+        if not self.config.original_filename:
+            fields.extend(template_fields(self.config.filename_format))
+
+        return fields
 
     def destination(self, source_filename: pathlib.Path, dicom: DICOM) -> pathlib.Path:
-        if self.config.original_filename:
-            filename = os.path.basename(source_filename)
-        else:
-            filename = dicom.format(self.config.filename_format)
+        with timer("format"):
+            if self.config.original_filename:
+                filename = os.path.basename(source_filename)
+            else:
+                filename = dicom.format(self.config.filename_format)
 
-        directories = map(lambda x: clean_directory_name(dicom[x]), self.config.path)
-        output_directory = self.config.output_directory.joinpath(*directories)
+            directories = map(
+                lambda x: clean_directory_name(dicom.get(x)), self.config.path
+            )
+            output_directory = self.config.output_directory.joinpath(*directories)
 
-        return output_directory.joinpath(filename)
+            return output_directory.joinpath(filename)
 
     def perform_operation(
         self,
         source: pathlib.Path,
         destination: pathlib.Path,
-    ) -> None:
+        key: str = "",
+        data: Optional[bytes] = None,
+    ) -> pathlib.Path:
+        cache_scope(self.cache_id)
+
         # Ensure the enclosing directory exists
-        mkdir_p(destination.parent)
+        with timer("mkdir"):
+            ensure_directory(destination.parent)
+
+        claimed = destination
 
         if not self.config.overwrite:
-            destination = self.find_unique_filename(destination)
+            with timer("claim"):
+                claimed = self.find_unique_filename(destination)
+
+        # Journal the operation as soon as the name is claimed, so that an
+        # interrupted run can clean up the placeholder
+        if self.journal is not None and data is None:
+            self.journal.begin(source, claimed)
+
+        if not key or self.dedupe is None:
+            self.transfer(source, claimed, data)
+            return claimed
+
+        existing = self.dedupe.claim(key, claimed)
+
+        if existing is not None:
+            if self.journal is not None and data is None:
+                self.journal.done(source, existing)
+
+            # Give up the filename that was claimed for this file
+            if not self.config.overwrite:
+                release_unique_filename(destination, claimed)
+
+            logger.debug("Skipping %s, a duplicate of %s", source, existing)
+            return existing
+
+        try:
+            self.transfer(source, claimed, data)
+        except Exception:
+            self.dedupe.release(key)
+            raise
+
+        return claimed
 
-        if self.config.move:
-            shutil.move(source, destination)
+    def precreate_directories(self, directories: Iterable[pathlib.Path]) -> None:
+        """Create all directories up front so that sorting needn't create any."""
+        if self.config.dry_run:
+            return
+
+        cache_scope(self.cache_id)
+
+        for directory in directories:
+            ensure_directory(directory)
+
+    def transfer(
+        self,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        data: Optional[bytes] = None,
+    ) -> None:
+        # Moves and links don't copy any data, so are counted separately. The size
+        # is read first as the source of a move is gone afterwards
+        copied = data is not None or not (self.config.move or self.config.link)
+        size = 0
+
+        if copied and current_stats() is not None:
+            size = os.path.getsize(source) if data is None else len(data)
+
+        with timer("transfer"):
+            if data is not None:
+                destination.write_bytes(data)
+            else:
+                transfer(
+                    source, destination, move=self.config.move, link=self.config.link
+                )
+
+        if copied:
+            increment("bytes_transferred", size)
+        elif self.config.link:
+            increment("files_linked")
         else:
-            shutil.copyfile(source, destination)
+            increment("files_moved")
+
+        # The operation was journalled when its destination was claimed
+        if self.journal is not None and data is None:
+            self.journal.done(source, destination)
 
         logger.debug("%s -> %s", source, destination)
 
-    def sort(self, source_filename: pathlib.Path) -> None:
+    def apply(self, operation: Operation) -> None:
+        """Perform a single planned operation whose destination is already unique."""
+        try:
+            if self.config.dry_run:
+                logger.info("%s -> %s", operation.source, operation.destination)
+                return
+
+            # Files may have been created at the destination since planning (or
+            # by applying the plan before)
+            if not self.config.overwrite and not claim_filename(operation.destination):
+                logger.warning(
+                    "Skipping %s as %s already exists",
+                    operation.source,
+                    operation.destination,
+                )
+                return
+
+            if self.journal is not None:
+                self.journal.begin(operation.source, operation.destination)
+
+            try:
+                self.transfer(operation.source, operation.destination)
+            except Exception:
+                # Give up the claim so that the plan can be applied again
+                if not self.config.overwrite:
+                    os.remove(operation.destination)
+
+                raise
+        except Exception as e:
+            logger.error(e)
+
+    def resolve(self, source_filename: pathlib.Path) -> Optional[SortResult]:
+        """Read the header of a file and determine its desired destination."""
         try:
-            dicom = DICOM(source_filename)
+            stat = os.stat(source_filename) if self.config.index else None
+            result = self.describe(source_filename, self.load(source_filename))
+            result.stat = stat
+
+            return result
+        except NotDicomError as e:
+            # Files are only checked when they are loaded with a single open
+            if self.config.single_open:
+                logger.debug(e)
+            else:
+                logger.error(e)
+
+            return None
+        except Exception as e:
+            logger.error(e)
+            return None
+
+    def describe(
+        self,
+        source_filename: pathlib.Path,
+        dicom: DICOM,
+        data: Optional[bytes] = None,
+    ) -> SortResult:
+        """Determine the desired destination of an already loaded file."""
+        destination = self.destination(source_filename, dicom)
 
-            destination = self.destination(source_filename, dicom)
+        fields = {}
 
+        if self.config.index:
+            fields = {field: str(dicom.get(field)) for field in self.fields()}
+
+        key = ""
+
+        if self.config.dedupe == "uid":
+            key = str(dicom.get("SOPInstanceUID"))
+        elif self.config.dedupe == "content" and data is not None:
+            key = hashlib.sha256(data).hexdigest()
+        elif self.config.dedupe == "content":
+            key = content_hash(source_filename)
+
+        return SortResult(source_filename, destination, fields, key)
+
+    def load(self, source_filename: pathlib.Path) -> DICOM:
+        with timer("parse"):
+            return DICOM(
+                source_filename,
+                stop_before_pixels=self.config.header_only,
+                specific_tags=self.tags,
+                memory_map=self.config.memory_map,
+            )
+
+    def place(
+        self, result: Optional[SortResult], data: Optional[bytes] = None
+    ) -> Optional[SortResult]:
+        """Transfer a resolved file to its (unique) destination.
+
+        If the contents of the file are provided, they are written to the
+        destination rather than transferring the source file.
+        """
+        if result is None:
+            return None
+
+        try:
             if self.config.dry_run:
-                logger.info("%s -> %s", source_filename, destination)
+                logger.info("%s -> %s", result.source, result.destination)
             else:
-                self.perform_operation(source_filename, destination)
+                result.destination = self.perform_operation(
+                    result.source, result.destination, result.key, data
+                )
+
+            return result
         except Exception as e:
             logger.error(e)
-            pass
+            return None
+
+    def sort(self, source_filename: pathlib.Path) -> Optional[SortResult]:
+        return self.place(self.resolve(source_filename))
+
+    def resolve_member(self, member: ArchiveMember) -> Optional[SortResult]:
+        """Determine the destination of a file read from an archive into memory."""
+        source_filename = self.config.input_directory.joinpath(member.name)
+
+        try:
+            dcm = read_member(
+                member,
+                stop_before_pixels=self.config.header_only,
+                specific_tags=self.tags,
+            )
+
+            # Silently skip anything that isn't DICOM, as discovery would
+            if dcm is None:
+                return None
+
+            return self.describe(
+                source_filename, DICOM(source_filename, dcm=dcm), member.data
+            )
+        except Exception as e:
+            logger.error(e)
+            return None
+
+    def sort_member(self, member: ArchiveMember) -> Optional[SortResult]:
+        """Sort a file which has been read from an archive into memory."""
+        return self.place(self.resolve_member(member), member.data)
+
+    def run_batch(self, func: Callable[[T], R], items: List[T]) -> BatchResult[R]:
+        """Process a batch, including the statistics recorded by this worker."""
+        if not self.collect_stats:
+            with self.profiling():
+                return run_batch(func, items)
+
+        with self.profiling(), collecting() as stats:
+            batch = run_batch(func, items)
+
+        batch.stats = stats
+
+        return batch
+
+    def resolve_batch(
+        self, source_filenames: List[pathlib.Path]
+    ) -> BatchResult[Optional[SortResult]]:
+        return self.run_batch(self.resolve, source_filenames)
+
+    def place_batch(
+        self, results: List[Optional[SortResult]]
+    ) -> BatchResult[Optional[SortResult]]:
+        return self.run_batch(self.place, results)
+
+    def sort_batch(
+        self, source_filenames: List[pathlib.Path]
+    ) -> BatchResult[Optional[SortResult]]:
+        return self.run_batch(self.sort, source_filenames)
+
+    def apply_batch(self, operations: List[Operation]) -> BatchResult[None]:
+        return self.run_batch(self.apply, operations)
 
-    @interprocess_locked(mktemp())  # type: ignore[misc]
     def find_unique_filename(
         self,
         filename: pathlib.Path,
         commit: bool = True,
     ) -> pathlib.Path:
+        if commit:
+            return claim_unique_filename(filename)
+
         return find_unique_filename(filename, commit)
@@ -1,2 +1,6 @@
 class DicomsorterException(Exception):
     pass
+
+
+class NotDicomError(DicomsorterException):
+    pass
@@ -0,0 +1,147 @@
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Dict, Generator, Iterable, Optional
+
+from .config import logger
+
+INDEX_FILENAME = ".dicomsorter.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    fields TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    layout TEXT NOT NULL DEFAULT ''
+)
+"""
+
+
+class ScanIndex:
+    """On-disk index of files that have already been sorted.
+
+    Files are identified by their path, size, modification time and inode so
+    that subsequent runs only need to parse files that are new or have changed.
+    Each file is also recorded with the ``layout`` (e.g. a hash of the output
+    templates) it was sorted with, so that changing the layout sorts it again.
+    """
+
+    filename: pathlib.Path
+    commit_interval: int
+    layout: str
+
+    def __init__(
+        self, filename: pathlib.Path, commit_interval: int = 1000, layout: str = ""
+    ) -> None:
+        self.filename = filename
+        self.commit_interval = commit_interval
+        self.layout = layout
+
+        # Files may be filtered on a different thread than the one recording them
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(filename), check_same_thread=False)
+        self._connection.execute(SCHEMA)
+
+        # Indexes created before layouts were recorded
+        columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(files)")
+        ]
+
+        if "layout" not in columns:
+            self._connection.execute(
+                "ALTER TABLE files ADD COLUMN layout TEXT NOT NULL DEFAULT ''"
+            )
+
+        self._uncommitted = 0
+
+    def is_sorted(self, path: pathlib.Path, stat: os.stat_result) -> bool:
+        """Check whether an unchanged copy of this file was previously sorted."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime, inode, destination, layout FROM files "
+                "WHERE path = ?",
+                (str(path),),
+            ).fetchone()
+
+        if row is None:
+            return False
+
+        size, mtime, inode, destination, layout = row
+
+        if (size, mtime, inode) != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return False
+
+        if layout != self.layout:
+            return False
+
+        return os.path.exists(destination)
+
+    def changed(
+        self, paths: Iterable[pathlib.Path]
+    ) -> Generator[pathlib.Path, None, None]:
+        """Lazily filter out all files which were sorted by a previous run."""
+        skipped = 0
+
+        for path in paths:
+            # Files may be removed (or be dangling links) by the time they're checked
+            try:
+                stat = path.stat()
+            except OSError as e:
+                logger.warning("Skipping %s: %s", path, e)
+                continue
+
+            if self.is_sorted(path, stat):
+                skipped += 1
+                continue
+
+            yield path
+
+        logger.debug("Skipped %d previously sorted files", skipped)
+
+    def record(
+        self,
+        path: pathlib.Path,
+        destination: pathlib.Path,
+        fields: Dict[str, str],
+        stat: Optional[os.stat_result] = None,
+    ) -> None:
+        """Store the header fields and destination of a sorted file.
+
+        The file's ``stat`` should be taken before it was sorted (e.g. in case
+        it was moved).
+        """
+        stat = stat or path.stat()
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    stat.st_ino,
+                    json.dumps(fields),
+                    str(destination),
+                    self.layout,
+                ),
+            )
+
+        self._uncommitted += 1
+
+        if self._uncommitted >= self.commit_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        self.commit()
+        self._connection.close()
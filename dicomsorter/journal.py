@@ -0,0 +1,128 @@
+import json
+import os
+import pathlib
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+from .config import logger
+
+JOURNAL_FILENAME = ".dicomsorter-journal"
+
+# Journal file descriptor opened by this process, and the run it was opened for
+_descriptors: Dict[pathlib.Path, Tuple[str, int]] = {}
+_descriptors_lock = threading.Lock()
+
+
+@dataclass
+class JournalState:
+    """Operations recorded by the journal of a previous run."""
+
+    completed: Dict[pathlib.Path, pathlib.Path] = field(default_factory=dict)
+
+    # Operations which were started but may not have finished
+    incomplete: Dict[pathlib.Path, pathlib.Path] = field(default_factory=dict)
+
+
+class Journal:
+    """Write-ahead journal of the files placed in the output directory.
+
+    Each operation is recorded before and after the file is transferred. Lines
+    are appended with a single O_APPEND write so that worker processes can
+    share the journal without a lock, and a crash leaves at most one partial
+    (ignored) line.
+    """
+
+    filename: pathlib.Path
+    run_id: str
+
+    def __init__(self, filename: pathlib.Path, run_id: str) -> None:
+        self.filename = filename
+        self.run_id = run_id
+
+    def _descriptor(self) -> int:
+        with _descriptors_lock:
+            run_id, fd = _descriptors.get(self.filename, ("", -1))
+
+            if run_id == self.run_id:
+                return fd
+
+            # The journal may have been recreated since a previous run
+            if fd >= 0:
+                os.close(fd)
+
+            fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+            _descriptors[self.filename] = (self.run_id, fd)
+
+            return fd
+
+    def _append(
+        self, status: str, source: pathlib.Path, destination: pathlib.Path
+    ) -> None:
+        entry = {
+            "status": status,
+            "source": str(source),
+            "destination": str(destination),
+        }
+        os.write(self._descriptor(), (json.dumps(entry) + "\n").encode())
+
+    def begin(self, source: pathlib.Path, destination: pathlib.Path) -> None:
+        self._append("begin", source, destination)
+
+    def done(self, source: pathlib.Path, destination: pathlib.Path) -> None:
+        self._append("done", source, destination)
+
+    def reset(self) -> None:
+        """Discard the entries of previous runs."""
+        # Truncate rather than replace so that open descriptors remain valid
+        with open(self.filename, "w"):
+            pass
+
+    def close(self) -> None:
+        with _descriptors_lock:
+            run_id, fd = _descriptors.get(self.filename, ("", -1))
+
+            if run_id == self.run_id:
+                os.fsync(fd)
+                os.close(fd)
+                del _descriptors[self.filename]
+
+    def load(self) -> JournalState:
+        """Read the operations recorded by previous runs."""
+        state = JournalState()
+
+        if not self.filename.exists():
+            return state
+
+        with open(self.filename) as fid:
+            for line in fid:
+                try:
+                    entry = json.loads(line)
+                    source = pathlib.Path(entry["source"])
+                    destination = pathlib.Path(entry["destination"])
+                except (ValueError, KeyError):
+                    logger.debug("Ignoring incomplete journal entry: %r", line)
+                    continue
+
+                if entry.get("status") == "done":
+                    state.incomplete.pop(source, None)
+                    state.completed[source] = destination
+                else:
+                    state.incomplete[source] = destination
+
+        return state
+
+
+def repair(source: pathlib.Path, destination: pathlib.Path) -> bool:
+    """Clean up an operation that was interrupted, returning whether it completed.
+
+    If the source still exists, the (possibly partial) destination is removed so
+    that the file is sorted again. Otherwise the file was moved into place.
+    """
+    if os.path.lexists(source):
+        if os.path.lexists(destination):
+            os.remove(destination)
+
+        return False
+
+    return os.path.lexists(destination)
@@ -0,0 +1,115 @@
+import json
+import os
+import pathlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from .utils import filename_generator
+
+PLAN_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Operation:
+    source: pathlib.Path
+    destination: pathlib.Path
+
+
+@dataclass
+class SortPlan:
+    """Serializable mapping of source files to their unique destinations."""
+
+    operations: List[Operation] = field(default_factory=list)
+    directories: List[pathlib.Path] = field(default_factory=list)
+
+    # Desired destinations shared by multiple sources, which were renamed
+    duplicates: Dict[pathlib.Path, List[pathlib.Path]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": PLAN_VERSION,
+            "directories": [str(d) for d in self.directories],
+            "duplicates": {
+                str(destination): [str(source) for source in sources]
+                for destination, sources in self.duplicates.items()
+            },
+            "operations": [
+                {"source": str(op.source), "destination": str(op.destination)}
+                for op in self.operations
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SortPlan":
+        return cls(
+            operations=[
+                Operation(pathlib.Path(op["source"]), pathlib.Path(op["destination"]))
+                for op in data.get("operations", [])
+            ],
+            directories=[pathlib.Path(d) for d in data.get("directories", [])],
+            duplicates={
+                pathlib.Path(destination): [pathlib.Path(s) for s in sources]
+                for destination, sources in data.get("duplicates", {}).items()
+            },
+        )
+
+    def save(self, filename: pathlib.Path) -> None:
+        with open(filename, "w") as fid:
+            json.dump(self.to_dict(), fid, indent=2)
+
+    @classmethod
+    def load(cls, filename: pathlib.Path) -> "SortPlan":
+        with open(filename) as fid:
+            return cls.from_dict(json.load(fid))
+
+
+def build_plan(
+    operations: Iterable[Tuple[pathlib.Path, pathlib.Path]],
+    overwrite: bool = False,
+) -> SortPlan:
+    """Resolve the desired destination of each source into a SortPlan.
+
+    Collisions, both with files that already exist and between sources, are
+    resolved in memory by listing each destination directory only once.
+    """
+    plan = SortPlan()
+    sources: Set[pathlib.Path] = set()
+    requested: Dict[pathlib.Path, List[pathlib.Path]] = {}
+    taken: Dict[pathlib.Path, Set[str]] = {}
+
+    for source, desired in operations:
+        # The same file may be listed more than once
+        if source in sources:
+            continue
+
+        sources.add(source)
+        requested.setdefault(desired, []).append(source)
+
+        directory = desired.parent
+
+        if directory not in taken:
+            taken[directory] = (
+                set(os.listdir(directory)) if directory.is_dir() else set()
+            )
+            plan.directories.append(directory)
+
+        destination = desired
+
+        if not overwrite:
+            names = taken[directory]
+            destination = next(
+                candidate
+                for candidate in filename_generator(desired)
+                if candidate.name not in names
+            )
+            names.add(destination.name)
+
+        plan.operations.append(Operation(source, destination))
+
+    plan.duplicates = {
+        destination: sources
+        for destination, sources in requested.items()
+        if len(sources) > 1
+    }
+
+    return plan
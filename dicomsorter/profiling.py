@@ -0,0 +1,334 @@
+import cProfile
+import os
+import pathlib
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from types import FrameType
+from typing import Counter as CounterType
+from typing import (
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Interval (in seconds) between samples of the stack of each profiled thread
+SAMPLE_INTERVAL = 0.005
+
+# Functions of this package which identify the stage a sample was taken in
+STAGES = {
+    "discover": "discovery",
+    "load": "parse",
+    "destination": "format",
+    "ensure_directory": "mkdir",
+    "find_unique_filename": "claim",
+    "transfer": "transfer",
+}
+
+# Names of the profilers of the main process and of workers
+PROFILER_NAMES = ("main", "worker")
+
+SUMMARY_NAME = "summary"
+SUMMARY_SUFFIXES = (".pstats", ".samples", ".txt")
+
+
+def frame_label(frame: FrameType) -> str:
+    return "%s:%s" % (frame.f_globals.get("__name__", "?"), frame.f_code.co_name)
+
+
+def fold(frame: Optional[FrameType]) -> str:
+    """Collapse a stack into a single line (outermost first), as for flame graphs."""
+    labels: List[str] = []
+
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+
+    return ";".join(reversed(labels))
+
+
+def stage_of(stack: str) -> str:
+    """The innermost stage of sorting within a collapsed stack."""
+    for label in reversed(stack.split(";")):
+        module, _, function = label.rpartition(":")
+
+        if module.split(".")[0] == __package__ and function in STAGES:
+            return STAGES[function]
+
+    return "other"
+
+
+class Profiler:
+    """Profile the threads of this process which are sorting (or discovering) files.
+
+    In "cprofile" mode each thread has its own deterministic profile, written to
+    a .pstats file. In "sample" mode a background thread periodically samples
+    the stacks of profiled threads, and the collapsed stacks are written to a
+    .samples file, which can be rendered as a flame graph.
+    """
+
+    directory: pathlib.Path
+    name: str
+    mode: str
+    pid: int
+
+    def __init__(self, directory: pathlib.Path, name: str, mode: str) -> None:
+        self.directory = directory
+        self.name = name
+        self.mode = mode
+        self.pid = os.getpid()
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        # Deterministic profile of each thread, by native thread ID
+        self._profiles: Dict[int, cProfile.Profile] = {}
+
+        # Threads which are currently being sampled, and the samples taken
+        self._sampled: Set[int] = set()
+        self._samples: CounterType[str] = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @contextmanager
+    def profile(self) -> Generator[None, None, None]:
+        """Profile the current thread within this block."""
+        # Profiles can't be nested, so the outermost block is used
+        if getattr(self._local, "active", False):
+            yield
+            return
+
+        self._local.active = True
+        self._start()
+
+        try:
+            yield
+        finally:
+            self._stop()
+            self._local.active = False
+
+    def profiled(self, iterable: Iterable[T]) -> Generator[T, None, None]:
+        """Profile the production of each item of an iterable (e.g. discovery)."""
+        iterator: Iterator[T] = iter(iterable)
+
+        while True:
+            with self.profile():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+
+            yield item
+
+    def _start(self) -> None:
+        if self.mode == "sample":
+            with self._lock:
+                self._sampled.add(threading.get_ident())
+
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample, daemon=True)
+                    self._sampler.start()
+        else:
+            with self._lock:
+                profile = self._profiles.setdefault(
+                    threading.get_native_id(), cProfile.Profile()
+                )
+
+            profile.enable()
+
+    def _stop(self) -> None:
+        if self.mode == "sample":
+            with self._lock:
+                self._sampled.discard(threading.get_ident())
+        else:
+            self._profiles[threading.get_native_id()].disable()
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            with self._lock:
+                sampled = set(self._sampled)
+
+            if not sampled:
+                continue
+
+            frames = sys._current_frames()
+            stacks = [fold(frames.get(ident)) for ident in sampled if ident in frames]
+
+            with self._lock:
+                self._samples.update(stacks)
+
+    def save(self) -> None:
+        """Write the profiles recorded so far, replacing any previously written."""
+        prefix = "%s-%d" % (self.name, self.pid)
+
+        if self.mode == "sample":
+            with self._lock:
+                samples = list(self._samples.items())
+
+            # Written even when empty, as work may be too quick to be sampled
+            save_samples(self.directory.joinpath(prefix + ".samples"), samples)
+
+            return
+
+        with self._lock:
+            profiles = list(self._profiles.items())
+
+        for thread_id, profile in profiles:
+            # Stats can't be taken from a profile which is currently enabled
+            try:
+                stats = pstats.Stats(profile)
+            except TypeError:
+                # No calls have been recorded yet
+                continue
+
+            stats.dump_stats(
+                self.directory.joinpath("%s-%d.pstats" % (prefix, thread_id))
+            )
+
+    def close(self) -> None:
+        self._stopped.set()
+
+
+# Profilers of this process, by output directory, name and run
+_profilers: Dict[Tuple[pathlib.Path, str, str], Profiler] = {}
+_profilers_lock = threading.Lock()
+
+
+def get_profiler(directory: pathlib.Path, name: str, mode: str, scope: str) -> Profiler:
+    """Get the profiler of this process for a run, creating it if necessary.
+
+    Worker processes may be reused across runs, so profilers of previous runs
+    are discarded.
+    """
+    key = (directory, name, scope)
+
+    with _profilers_lock:
+        profiler = _profilers.get(key)
+
+        # Profilers inherited from a parent process can't be reused
+        if profiler is not None and profiler.pid == os.getpid():
+            return profiler
+
+        for previous in list(_profilers):
+            if previous[2] != scope or _profilers[previous].pid != os.getpid():
+                _profilers.pop(previous).close()
+
+        profiler = _profilers[key] = Profiler(directory, name, mode)
+
+        return profiler
+
+
+def flush() -> None:
+    """Save the profiles of every profiler in this process."""
+    with _profilers_lock:
+        profilers = [p for p in _profilers.values() if p.pid == os.getpid()]
+
+    for profiler in profilers:
+        profiler.save()
+
+
+def profile_files(directory: pathlib.Path, suffix: str) -> List[pathlib.Path]:
+    """The profiles of each process or thread within a directory."""
+    return sorted(
+        filename
+        for name in PROFILER_NAMES
+        for filename in directory.glob("%s-*%s" % (name, suffix))
+    )
+
+
+def prepare(directory: pathlib.Path) -> None:
+    """Create the profile directory, removing the profiles of previous runs.
+
+    Other files (e.g. profiles which were written by other tools) are kept.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+
+    previous = profile_files(directory, ".pstats") + profile_files(
+        directory, ".samples"
+    )
+    previous.extend(directory.joinpath(SUMMARY_NAME + s) for s in SUMMARY_SUFFIXES)
+
+    for filename in previous:
+        if filename.exists():
+            filename.unlink()
+
+
+def save_samples(filename: pathlib.Path, samples: Iterable[Tuple[str, int]]) -> None:
+    # Write then rename, so that a partially written file is never read
+    temporary = filename.with_name(filename.name + ".tmp")
+
+    with open(temporary, "w") as fid:
+        for stack, count in samples:
+            fid.write("%s %d\n" % (stack, count))
+
+    os.replace(temporary, filename)
+
+
+def load_samples(filename: pathlib.Path) -> CounterType[str]:
+    samples: CounterType[str] = Counter()
+
+    with open(filename) as fid:
+        for line in fid:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            samples[stack] += int(count)
+
+    return samples
+
+
+def summarize(directory: pathlib.Path, limit: int = 40) -> pathlib.Path:
+    """Merge the profiles written by every process into a summary.
+
+    Deterministic profiles are merged into summary.pstats and samples into
+    summary.samples. A readable report of both is written to summary.txt.
+    """
+    filename = directory.joinpath(SUMMARY_NAME + ".txt")
+
+    profiles = [str(f) for f in profile_files(directory, ".pstats")]
+    samples: CounterType[str] = Counter()
+
+    for sample_file in profile_files(directory, ".samples"):
+        samples.update(load_samples(sample_file))
+
+    with open(filename, "w") as fid:
+        if profiles:
+            fid.write("Merged profiles of %d threads\n\n" % len(profiles))
+            stats = pstats.Stats(*profiles, stream=fid)
+            stats.dump_stats(directory.joinpath(SUMMARY_NAME + ".pstats"))
+            stats.sort_stats("cumulative").print_stats(limit)
+
+        if samples:
+            total = sum(samples.values())
+            save_samples(
+                directory.joinpath(SUMMARY_NAME + ".samples"), samples.most_common()
+            )
+
+            stages: CounterType[str] = Counter()
+            functions: CounterType[str] = Counter()
+
+            for stack, count in samples.items():
+                stages[stage_of(stack)] += count
+                functions[stack.rpartition(";")[2]] += count
+
+            fid.write("%d samples by stage\n\n" % total)
+
+            for stage, count in stages.most_common():
+                fid.write("%8d %6.1f%%  %s\n" % (count, 100 * count / total, stage))
+
+            fid.write("\n%d samples by function (innermost)\n\n" % total)
+
+            for function, count in functions.most_common(limit):
+                fid.write("%8d %6.1f%%  %s\n" % (count, 100 * count / total, function))
+
+    return filename
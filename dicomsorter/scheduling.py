@@ -0,0 +1,114 @@
+import pathlib
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Generator, Generic, Iterable, List, Optional, TypeVar
+
+from .stats import Stats
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class BatchResult(Generic[R]):
+    results: List[R]
+    elapsed: float
+
+    # Statistics recorded by the worker while processing the batch
+    stats: Optional[Stats] = None
+
+
+def run_batch(func: Callable[[T], R], items: List[T]) -> BatchResult[R]:
+    """Apply a function to a batch of items, timing the entire batch."""
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+
+    return BatchResult(results, time.perf_counter() - start)
+
+
+class BatchScheduler:
+    """Group files into batches sized so that each batch takes about the same time.
+
+    Files are grouped by their parent directory for locality. When no fixed size
+    is requested, the batch size is tuned from the observed time per file so that
+    a batch takes roughly ``target_duration`` seconds.
+    """
+
+    adaptive: bool
+    size: int
+    target_duration: float
+    min_size: int
+    max_size: int
+    max_pending: int
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        target_duration: float = 0.25,
+        initial_size: int = 8,
+        max_size: int = 512,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self.adaptive = size is None
+        self.target_duration = target_duration
+        self.max_size = max(size or max_size, 1)
+        self.size = min(size or initial_size, self.max_size)
+
+        # Limit the number of files held back while waiting for a full batch
+        self.max_pending = max(max_pending or self.max_size * 4, 1)
+
+        self._latency: Optional[float] = None
+
+    def record(self, files: int, elapsed: float) -> None:
+        """Update the batch size with the observed duration of a batch."""
+        if not self.adaptive or files == 0:
+            return
+
+        latency = elapsed / files
+
+        # Exponential moving average to smooth out slow individual batches
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency = 0.7 * self._latency + 0.3 * latency
+
+        if self._latency > 0:
+            size = int(self.target_duration / self._latency)
+            self.size = min(max(size, 1), self.max_size)
+        else:
+            self.size = self.max_size
+
+    def batches(
+        self, files: Iterable[pathlib.Path]
+    ) -> Generator[List[pathlib.Path], None, None]:
+        groups: Dict[pathlib.Path, List[pathlib.Path]] = {}
+        pending = 0
+
+        for filename in files:
+            group = groups.setdefault(filename.parent, [])
+            group.append(filename)
+            pending += 1
+
+            if len(group) >= self.size:
+                del groups[filename.parent]
+                pending -= len(group)
+                yield group
+            elif pending >= min(self.max_pending, self.size * 4):
+                # Release the largest group rather than holding on to many files
+                largest = max(groups, key=lambda key: len(groups[key]))
+                pending -= len(groups[largest])
+                yield groups.pop(largest)
+
+        # Combine the remaining (partial) groups
+        batch: List[pathlib.Path] = []
+
+        for group in groups.values():
+            for filename in group:
+                batch.append(filename)
+
+                if len(batch) >= self.size:
+                    yield batch
+                    batch = []
+
+        if batch:
+            yield batch
@@ -0,0 +1,74 @@
+import argparse
+import pathlib
+import zlib
+from typing import Generator, Optional, Tuple
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a shard specification of the form ``i/N`` (with 0 <= i < N)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("shard must be of the form i/N, e.g. 0/4")
+
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError("shard index must be between 0 and N - 1")
+
+    return index, count
+
+
+def shard_of(filename: pathlib.Path, root: pathlib.Path, count: int) -> int:
+    """Deterministically assign a file to a shard by hashing its directory.
+
+    The directory is taken relative to ``root`` so that hosts which mount the
+    input at different locations agree. Keeping each directory (typically a
+    series) within one shard preserves locality.
+    """
+    try:
+        directory = filename.parent.relative_to(root)
+    except ValueError:
+        directory = filename.parent
+
+    return zlib.crc32(directory.as_posix().encode()) % count
+
+
+def shard_filename(
+    filename: pathlib.Path, shard: Optional[Tuple[int, int]]
+) -> pathlib.Path:
+    """Name a file of the output directory (e.g. the journal) for one shard.
+
+    Shards share the output directory, so each needs its own copy of files
+    which record the progress of a single run.
+    """
+    if shard is None:
+        return filename
+
+    return filename.with_name(
+        "%s-%d-of-%d%s" % (filename.stem, *shard, filename.suffix)
+    )
+
+
+class ShardFilter:
+    """Select the files which belong to one of N shards."""
+
+    root: pathlib.Path
+    index: int
+    count: int
+
+    def __init__(self, root: pathlib.Path, index: int, count: int) -> None:
+        self.root = root
+        self.index = index
+        self.count = count
+
+    def __call__(self, filename: pathlib.Path) -> bool:
+        return shard_of(filename, self.root, self.count) == self.index
+
+
+def read_file_list(filename: pathlib.Path) -> Generator[pathlib.Path, None, None]:
+    """Read paths from a file containing one per line, ignoring blank lines."""
+    with open(filename) as fid:
+        for line in fid:
+            line = line.rstrip("\r\n")
+
+            if line.strip():
+                yield pathlib.Path(line)
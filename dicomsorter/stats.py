@@ -0,0 +1,222 @@
+import json
+import math
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Percentiles included in the report of each histogram
+PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class Histogram:
+    """Latency histogram with logarithmic (power of two microsecond) buckets."""
+
+    count: int = 0
+    total: float = 0.0
+    minimum: float = math.inf
+    maximum: float = 0.0
+    buckets: Dict[int, int] = field(default_factory=dict)
+
+    def record(self, seconds: float) -> None:
+        bucket = max(int(seconds * 1e6), 1).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+
+    def merge(self, other: "Histogram") -> None:
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound (in seconds) of the bucket containing a percentile."""
+        target = self.count * percent / 100
+        seen = 0
+
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+
+            if seen >= target:
+                return min((1 << bucket) / 1e6, self.maximum)
+
+        return self.maximum
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.minimum if self.count else 0.0,
+            "max": self.maximum,
+            **{"p%d" % p: self.percentile(p) for p in PERCENTILES},
+            # Keyed by the upper bound of each bucket in microseconds
+            "histogram": {
+                str(1 << bucket): count
+                for bucket, count in sorted(self.buckets.items())
+            },
+        }
+
+
+@dataclass
+class Stats:
+    """Per-stage latencies and counters, which can be merged across workers."""
+
+    stages: Dict[str, Histogram] = field(default_factory=dict)
+    counters: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"stages": self.stages, "counters": self.counters}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).record(seconds)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def merge(self, other: "Stats") -> None:
+        with self._lock:
+            for stage, histogram in other.stages.items():
+                self.stages.setdefault(stage, Histogram()).merge(histogram)
+
+            for counter, amount in other.counters.items():
+                self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        files = self.counters.get("files", 0)
+        transferred = self.counters.get("bytes_transferred", 0)
+
+        return {
+            "elapsed": elapsed,
+            "files_per_second": files / elapsed if elapsed else 0.0,
+            "bytes_per_second": transferred / elapsed if elapsed else 0.0,
+            "counters": dict(sorted(self.counters.items())),
+            "stages": {
+                stage: histogram.to_dict()
+                for stage, histogram in sorted(self.stages.items())
+            },
+        }
+
+    def save(self, filename: pathlib.Path, elapsed: float) -> None:
+        with open(filename, "w") as fid:
+            json.dump(self.to_dict(elapsed), fid, indent=2)
+
+    def summary(self, elapsed: float) -> str:
+        """A short summary of the mean latency of each stage and throughput."""
+        parts: List[str] = [
+            "%s %.1fms" % (stage, histogram.mean * 1e3)
+            for stage, histogram in sorted(self.stages.items())
+        ]
+
+        if elapsed:
+            transferred = self.counters.get("bytes_transferred", 0)
+            parts.append("%.1fMB/s" % (transferred / elapsed / 1024**2))
+
+        return ", ".join(parts)
+
+
+# Statistics collected by the current thread (e.g. for a batch)
+_local = threading.local()
+
+# Statistics collected by all other threads of this process
+_shared: Optional[Stats] = None
+
+
+def current() -> Optional[Stats]:
+    stats: Optional[Stats] = getattr(_local, "stats", None)
+
+    return _shared if stats is None else stats
+
+
+def install(stats: Optional[Stats]) -> None:
+    """Collect statistics from any thread in this process which isn't collecting."""
+    global _shared
+    _shared = stats
+
+
+@contextmanager
+def collecting() -> Generator[Stats, None, None]:
+    """Collect the statistics recorded by this thread into a new Stats."""
+    previous = getattr(_local, "stats", None)
+    _local.stats = Stats()
+
+    try:
+        yield _local.stats
+    finally:
+        _local.stats = previous
+
+
+@contextmanager
+def timer(stage: str) -> Generator[None, None, None]:
+    """Record the duration of a stage, if statistics are being collected."""
+    stats = current()
+
+    if stats is None:
+        yield
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        stats.record(stage, time.perf_counter() - start)
+
+
+def collect(stats: Optional[Stats]) -> None:
+    """Merge statistics recorded elsewhere (e.g. by a worker) into this thread's."""
+    destination = current()
+
+    if destination is not None and stats is not None:
+        destination.merge(stats)
+
+
+def increment(counter: str, amount: int = 1) -> None:
+    stats = current()
+
+    if stats is not None:
+        stats.increment(counter, amount)
+
+
+def timed(iterable: Iterable[T], stage: str) -> Generator[T, None, None]:
+    """Record the time taken to produce each item of an iterable."""
+    iterator: Iterator[T] = iter(iterable)
+
+    while True:
+        start = time.perf_counter()
+
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+
+        stats = current()
+
+        if stats is not None:
+            stats.record(stage, time.perf_counter() - start)
+
+        yield item
@@ -0,0 +1,137 @@
+import errno
+import os
+import pathlib
+import shutil
+import sys
+import uuid
+from typing import Callable, Dict, Optional, Set
+
+from .config import logger
+
+# Linux ioctl for cloning (reflinking) a file, from linux/fs.h
+FICLONE = 0x40049409
+
+LINK_MODES = ("hard", "sym", "reflink")
+
+# Errors from FICLONE meaning the filesystem (rather than a file) can't reflink
+REFLINK_UNSUPPORTED_ERRORS = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL}
+
+# Devices that have been found not to support reflinks by this process
+_reflink_unsupported: Set[int] = set()
+
+
+def reflink(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Create a copy-on-write clone of a file (e.g. on btrfs or XFS)."""
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+
+    import fcntl
+
+    def clone(source: str, destination: str) -> None:
+        with open(source, "rb") as src, open(destination, "xb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except OSError:
+                os.remove(destination)
+                raise
+
+    # Clone alongside the destination so that a failed clone never truncates it
+    _replace_with(clone, source, destination)
+
+
+def copy_file_range(source: pathlib.Path, destination: pathlib.Path) -> None:
+    """Copy a file within the kernel, which may reflink or offload the copy."""
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range is not supported")
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+
+        while size > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), size)
+
+            if copied == 0:
+                break
+
+            size -= copied
+
+
+def copy(
+    source: pathlib.Path, destination: pathlib.Path, reflinks: bool = True
+) -> None:
+    """Copy a file using the fastest mechanism the filesystem supports.
+
+    Reflinks are attempted first (unless disabled), followed by copy_file_range
+    and finally shutil.copyfile (which uses sendfile where available).
+    """
+    device = os.stat(source).st_dev
+
+    if reflinks and device not in _reflink_unsupported:
+        try:
+            reflink(source, destination)
+            return
+        except OSError as e:
+            # Other errors (e.g. permissions) are specific to this file
+            if e.errno in REFLINK_UNSUPPORTED_ERRORS:
+                _reflink_unsupported.add(device)
+
+    try:
+        copy_file_range(source, destination)
+        return
+    except OSError:
+        pass
+
+    shutil.copyfile(source, destination)
+
+
+def _replace_with(
+    create: Callable[[str, str], None],
+    source: pathlib.Path,
+    destination: pathlib.Path,
+) -> None:
+    # Links can't overwrite an existing (e.g. claimed) file, so create the link
+    # alongside the destination and atomically move it into place
+    temporary = destination.with_name(".%s.%s.tmp" % (destination.name, uuid.uuid4()))
+    create(str(source), str(temporary))
+    os.replace(temporary, destination)
+
+
+def hardlink(source: pathlib.Path, destination: pathlib.Path) -> None:
+    _replace_with(os.link, source, destination)
+
+
+def symlink(source: pathlib.Path, destination: pathlib.Path) -> None:
+    _replace_with(os.symlink, pathlib.Path(os.path.abspath(source)), destination)
+
+
+LINK_FUNCTIONS: Dict[str, Callable[[pathlib.Path, pathlib.Path], None]] = {
+    "hard": hardlink,
+    "sym": symlink,
+    "reflink": reflink,
+}
+
+
+def transfer(
+    source: pathlib.Path,
+    destination: pathlib.Path,
+    move: bool = False,
+    link: Optional[str] = None,
+) -> None:
+    """Place a file at its destination by moving, linking or copying it.
+
+    If the requested type of link can't be created (e.g. because the source
+    and destination are on different filesystems), the file is copied instead.
+    """
+    if move:
+        shutil.move(source, destination)
+        return
+
+    if link is not None:
+        try:
+            LINK_FUNCTIONS[link](source, destination)
+            return
+        except OSError as e:
+            logger.debug("Unable to create %s link to %s, copying: %s", link, source, e)
+
+    # A failed reflink isn't worth attempting again
+    copy(source, destination, reflinks=link != "reflink")
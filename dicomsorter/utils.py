@@ -1,28 +1,107 @@
 import errno
 import os
 import re
+import threading
+from functools import lru_cache
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from typing import Any, Generator
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 RE_INVALID_CHARS = re.compile('[\\\\/:*?"<>|]+')
+RE_TEMPLATE_FIELD = re.compile(r"%\((?P<name>[^)]*)\)")
+RE_FORMAT_FIELD = re.compile(
+    r"%\((?P<name>[^)]*)\)(?P<spec>[#0+ -]*\d*(?:\.\d+)?[hlL]?[diouxXeEfFgGcrsa])"
+)
 
 
 def clean_directory_name(directory: str, replacement: str = "_") -> str:
     """Scrub invalid characters from a filename."""
-    return re.sub(RE_INVALID_CHARS, replacement, directory)
+    return RE_INVALID_CHARS.sub(replacement, directory)
 
 
-def filename_generator(filename: Path) -> Generator[Path, None, None]:
-    """Creates filenames with increasing (version) number suffixes."""
-    yield filename
+class Countable(Protocol):
+    total: Optional[float]
+
+
+def counted(iterable: Iterable[T], counter: Countable) -> Generator[T, None, None]:
+    """Increment the total of a progress bar as items are produced."""
+    for item in iterable:
+        counter.total = (counter.total or 0) + 1
+        yield item
+
+
+class Throttle:
+    """Bound the number of items that are consumed from an iterable but unfinished.
+
+    Wrapping an iterable blocks the consumer once ``limit`` items are in flight.
+    Each call to release marks one item as finished.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self._semaphore = threading.BoundedSemaphore(max(limit, 1))
+
+    def __call__(self, iterable: Iterable[T]) -> Generator[T, None, None]:
+        iterator: Iterator[T] = iter(iterable)
+
+        while True:
+            # Wait before consuming the next item, so at most ``limit`` are held
+            self._semaphore.acquire()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._semaphore.release()
+                return
+
+            yield item
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+
+def numbered_filename(filename: Path, counter: int) -> Path:
+    """Add a (version) number suffix to a filename, leaving the first unchanged."""
+    if counter < 2:
+        return filename
 
     name, extension = os.path.splitext(filename)
     extension = extension or ""
 
-    counter = 2
+    return Path("".join([name, " (", str(counter), ")", extension]))
+
+
+def thread_imap(
+    func: Callable[[T], R],
+    iterable: Iterable[T],
+    threads: int,
+) -> Generator[R, None, None]:
+    """Lazily apply a function to each item in order using a pool of threads."""
+    with ThreadPool(threads) as pool:
+        yield from pool.imap(func, iterable)
+
+
+def filename_generator(filename: Path) -> Generator[Path, None, None]:
+    """Creates filenames with increasing (version) number suffixes."""
+    counter = 1
 
     while True:
-        yield Path("".join([name, " (", str(counter), ")", extension]))
+        yield numbered_filename(filename, counter)
         counter += 1
 
 
@@ -42,6 +121,78 @@ def find_unique_filename(filename: Path, commit: bool = True) -> Path:
     raise Exception("Should never be reached")
 
 
+# Identifies the run that the per-process caches below were populated by
+_cache_scope: Optional[str] = None
+
+
+def cache_scope(scope: str) -> None:
+    """Clear the per-process caches if they were populated by a different run.
+
+    Worker processes may be reused across runs, during which the output
+    directory can change.
+    """
+    global _cache_scope
+
+    if scope != _cache_scope:
+        _claimed_counters.clear()
+        _ensured_directories.clear()
+        _cache_scope = scope
+
+
+# Next version number to try for each filename claimed by this process
+_claimed_counters: Dict[Path, int] = {}
+MAX_CLAIMED_COUNTERS = 100000
+
+
+def claim_filename(filename: Path) -> bool:
+    """Atomically create a file, returning False if it already exists."""
+    try:
+        os.close(os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+    except FileExistsError:
+        return False
+
+    return True
+
+
+def claim_unique_filename(filename: Path) -> Path:
+    """Atomically create an un-used filename without requiring a lock.
+
+    Each candidate is created with O_CREAT | O_EXCL so that concurrent processes
+    (or hosts sharing a filesystem) can never claim the same file. Previously
+    claimed version numbers are remembered so that repeated collisions don't
+    need to probe every earlier candidate again.
+    """
+    counter = _claimed_counters.get(filename, 1)
+
+    while True:
+        candidate = numbered_filename(filename, counter)
+
+        if not claim_filename(candidate):
+            counter += 1
+            continue
+
+        if len(_claimed_counters) >= MAX_CLAIMED_COUNTERS:
+            _claimed_counters.clear()
+
+        _claimed_counters[filename] = counter + 1
+
+        return candidate
+
+
+def release_unique_filename(filename: Path, claimed: Path) -> None:
+    """Remove a file claimed by claim_unique_filename so its name can be reused.
+
+    If it was the last version claimed by this process, the next claim starts
+    from it again rather than leaving a gap in the version numbers.
+    """
+    os.remove(claimed)
+
+    counter = _claimed_counters.get(filename)
+
+    if counter is not None and numbered_filename(filename, counter - 1) == claimed:
+        _claimed_counters[filename] = counter - 1
+
+
 def mkdir_p(path: Path) -> None:
     """Recursively make directories and ignore if they exist."""
     try:
@@ -53,6 +204,27 @@ def mkdir_p(path: Path) -> None:
             raise
 
 
+# Directories which this process has already created or found to exist
+_ensured_directories: Set[Path] = set()
+MAX_ENSURED_DIRECTORIES = 100000
+
+
+def ensure_directory(path: Path) -> None:
+    """Like mkdir_p, but only touches the filesystem the first time a path is seen.
+
+    This assumes that directories aren't removed by others while sorting.
+    """
+    if path in _ensured_directories:
+        return
+
+    mkdir_p(path)
+
+    if len(_ensured_directories) >= MAX_ENSURED_DIRECTORIES:
+        _ensured_directories.clear()
+
+    _ensured_directories.add(path)
+
+
 def recursive_string_interpolation(
     string: str,
     obj: Any,
@@ -68,3 +240,77 @@ def recursive_string_interpolation(
             break
 
     return string
+
+
+def template_fields(string: str) -> List[str]:
+    """List the names of all %(Name)s style fields used in a format string."""
+    fields: List[str] = []
+
+    for match in RE_TEMPLATE_FIELD.finditer(string):
+        if match.group("name") not in fields:
+            fields.append(match.group("name"))
+
+    return fields
+
+
+class Template:
+    """Format string that is tokenized once and can be interpolated repeatedly.
+
+    Calling a template produces the same result as recursive_string_interpolation
+    but resolves each field through a single lookup rather than re-parsing the
+    entire string on every pass. Strings that can not be tokenized (e.g. ones
+    containing literal or positional % specifiers) fall back to
+    recursive_string_interpolation.
+    """
+
+    string: str
+    max_depth: int
+    fields: Optional[Tuple[str, ...]]
+    positional: str
+
+    def __init__(self, string: str, max_depth: int = 5) -> None:
+        self.string = string
+        self.max_depth = max_depth
+
+        # Convert all named fields into positional ones
+        fields = []
+        literals = []
+        position = 0
+
+        for match in RE_FORMAT_FIELD.finditer(string):
+            literals.append(string[position : match.start()])
+            literals.append("%" + match.group("spec"))
+            fields.append(match.group("name"))
+            position = match.end()
+
+        literals.append(string[position:])
+
+        if any("%" in literal for literal in literals[::2]):
+            self.fields = None
+        else:
+            self.fields = tuple(fields)
+
+        self.positional = "".join(literals)
+
+    def __call__(
+        self,
+        obj: Any,
+        lookup: Optional[Callable[[str], Any]] = None,
+    ) -> str:
+        if self.fields is None:
+            return recursive_string_interpolation(self.string, obj, self.max_depth)
+
+        lookup = lookup or obj.__getitem__
+        string = self.positional % tuple(map(lookup, self.fields))
+
+        # Values may themselves contain fields which need further interpolation
+        if "%" in string and self.max_depth > 1:
+            return recursive_string_interpolation(string, obj, self.max_depth - 1)
+
+        return string
+
+
+@lru_cache(maxsize=128)
+def compile_template(string: str) -> Template:
+    """Tokenize a format string, caching the result for subsequent calls."""
+    return Template(string)
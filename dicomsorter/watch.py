@@ -0,0 +1,260 @@
+import abc
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import logger
+from .dicom_utils import scan_directory
+
+# Flags from linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Files are only reported once they have been closed or moved into place
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct("iIII")
+
+Signature = Tuple[int, int]
+
+
+def walk_files(directory: pathlib.Path) -> Set[pathlib.Path]:
+    """Recursively list all files within a directory."""
+    files: Set[pathlib.Path] = set()
+    directories = [directory]
+
+    while directories:
+        found, subdirectories = scan_directory(directories.pop())
+        files.update(found)
+        directories.extend(subdirectories)
+
+    return files
+
+
+def signature(filename: pathlib.Path) -> Optional[Signature]:
+    """Size and modification time of a file, or None if it no longer exists."""
+    try:
+        stat = filename.stat()
+    except OSError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Watcher(abc.ABC):
+    """Reports files within a directory which may have been added or changed.
+
+    All existing files are reported by the first call to ``changes``.
+    """
+
+    directory: pathlib.Path
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+
+    @abc.abstractmethod
+    def changes(self, timeout: float) -> Set[pathlib.Path]:
+        """Wait up to ``timeout`` seconds for files to change."""
+
+    def close(self) -> None:
+        pass
+
+
+class PollingWatcher(Watcher):
+    """Detect changes by periodically listing the directory.
+
+    This works on any filesystem, including network filesystems on which
+    inotify doesn't report changes made by other hosts.
+    """
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        super().__init__(directory)
+        self._snapshot: Optional[Dict[pathlib.Path, Optional[Signature]]] = None
+
+    def changes(self, timeout: float) -> Set[pathlib.Path]:
+        if self._snapshot is not None:
+            time.sleep(timeout)
+
+        previous = self._snapshot or {}
+        self._snapshot = {path: signature(path) for path in walk_files(self.directory)}
+
+        return {
+            path
+            for path, current in self._snapshot.items()
+            if previous.get(path) != current
+        }
+
+
+class InotifyWatcher(Watcher):
+    """Detect changes using inotify (Linux only), with a watch per directory."""
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        super().__init__(directory)
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self._watches: Dict[int, pathlib.Path] = {}
+
+        try:
+            self._initial: Optional[Set[pathlib.Path]] = self._add(directory)
+        except OSError:
+            self.close()
+            raise
+
+    def _add(self, directory: pathlib.Path) -> Set[pathlib.Path]:
+        """Watch a directory tree, returning the files already within it."""
+        files: Set[pathlib.Path] = set()
+        directories = [directory]
+
+        while directories:
+            current = directories.pop()
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(current), WATCH_MASK
+            )
+
+            if wd < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), str(current))
+
+            self._watches[wd] = current
+
+            # Files may have been created before the watch was added
+            found, subdirectories = scan_directory(current)
+            files.update(found)
+            directories.extend(subdirectories)
+
+        return files
+
+    def changes(self, timeout: float) -> Set[pathlib.Path]:
+        if self._initial is not None:
+            files, self._initial = self._initial, None
+            return files
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed: Set[pathlib.Path] = set()
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("Missed inotify events, listing %s", self.directory)
+                changed.update(walk_files(self.directory))
+                continue
+
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            directory = self._watches.get(wd)
+
+            if directory is None or not name:
+                continue
+
+            path = directory.joinpath(name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.update(self._add(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.add(path)
+
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(directory: pathlib.Path, poll: bool = False) -> Watcher:
+    """Use inotify where possible, otherwise fall back to polling."""
+    if not poll:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            logger.debug("Unable to use inotify, polling instead: %s", e)
+
+    return PollingWatcher(directory)
+
+
+class QuiescenceTracker:
+    """Hold back files until they have stopped changing for a period of time.
+
+    This avoids sorting files which are still being written, e.g. over a
+    network share that doesn't report when a file has been closed.
+    """
+
+    window: float
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self._pending: Dict[pathlib.Path, Tuple[Signature, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def update(self, paths: Set[pathlib.Path], now: Optional[float] = None) -> None:
+        """Start (or restart) the quiescence window of files which changed."""
+        now = time.monotonic() if now is None else now
+
+        for path in paths:
+            current = signature(path)
+
+            if current is None:
+                self._pending.pop(path, None)
+            elif path not in self._pending or self._pending[path][0] != current:
+                self._pending[path] = (current, now)
+
+    def ready(self, now: Optional[float] = None) -> List[pathlib.Path]:
+        """Files which haven't changed for at least the quiescence window."""
+        now = time.monotonic() if now is None else now
+        ready = []
+
+        for path, (previous, since) in list(self._pending.items()):
+            if now - since < self.window:
+                continue
+
+            current = signature(path)
+
+            if current is None:
+                del self._pending[path]
+            elif current != previous:
+                self._pending[path] = (current, now)
+            else:
+                del self._pending[path]
+                ready.append(path)
+
+        return ready
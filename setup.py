@@ -32,14 +32,13 @@ setup(
         "Operating System :: OS Independent",
     ],
     keywords="dicom medical images",
-    packages=find_packages(exclude=["contrib", "docs", "tests"]),
+    packages=find_packages(exclude=["benchmarks", "contrib", "docs", "tests"]),
     package_data={
         "dicomsorter": [
             "py.typed",
         ],
     },
     install_requires=[
-        "fasteners>=0.18",
         "pathos>=0.3",
         "pydicom>=2.3.0",
         "tqdm>=4.64",
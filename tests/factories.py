@@ -1,9 +1,12 @@
+from pathlib import Path
 from random import randint
 from typing import Any
 
 from faker import Faker
 from pydicom import Dataset
 from pydicom.dataset import FileMetaDataset
+from pydicom.filebase import DicomFileLike
+from pydicom.filewriter import write_dataset
 from pydicom.uid import generate_uid
 
 faker = Faker()
@@ -63,6 +66,16 @@ class DicomFactory:
 
         return cls.build(**fields)
 
+    @classmethod
+    def save_headerless(
+        cls, dicom: Dataset, filename: Path, implicit_vr: bool = True
+    ) -> None:
+        """Save only the data set, without the preamble or file meta information."""
+        dicom.is_implicit_VR = implicit_vr
+
+        with open(filename, "wb") as fid:
+            write_dataset(DicomFileLike(fid), dicom)
+
 
 class DicomDirFactory:
     """Class for generating an *empty* DICOMDIR dataset"""
@@ -0,0 +1,437 @@
+"""Unit tests for archive module."""
+import pathlib
+import tarfile
+import threading
+import zipfile
+from typing import Any, Callable, Iterator, List
+from unittest.mock import patch
+
+import pytest
+
+from dicomsorter.archive import (
+    ArchiveMember,
+    ArchiveWriter,
+    archive_members,
+    is_archive,
+    output_format,
+    read_member,
+)
+from dicomsorter.config import Config
+from dicomsorter.dicomsorter import DICOMSorter
+from dicomsorter.errors import DicomsorterException
+
+from .conftest import DicomFolderGenerator
+from .factories import DicomFactory
+
+ArchiveMaker = Callable[[pathlib.Path, List[pathlib.Path]], pathlib.Path]
+
+
+def make_zip(filename: pathlib.Path, files: List[pathlib.Path]) -> pathlib.Path:
+    with zipfile.ZipFile(filename, "w") as archive:
+        for f in files:
+            archive.write(f, "study/%s" % f.name)
+
+        archive.writestr("study/report.txt", "not a DICOM file")
+
+    return filename
+
+
+def make_tar(filename: pathlib.Path, files: List[pathlib.Path]) -> pathlib.Path:
+    with tarfile.open(filename, "w:gz") as archive:
+        for f in files:
+            archive.add(f, "study/%s" % f.name)
+
+    return filename
+
+
+class TestIsArchive:
+    def test_zip(self, tmp_path: pathlib.Path) -> None:
+        assert is_archive(make_zip(tmp_path.joinpath("a.zip"), []))
+
+    def test_tar(self, tmp_path: pathlib.Path) -> None:
+        assert is_archive(make_tar(tmp_path.joinpath("a.tar.gz"), []))
+
+    def test_directory(self, tmp_path: pathlib.Path) -> None:
+        assert not is_archive(tmp_path)
+
+    def test_other_file(self, dicom_file: pathlib.Path) -> None:
+        assert not is_archive(dicom_file)
+
+
+class TestArchiveMembers:
+    @pytest.mark.parametrize("make", [make_zip, make_tar])
+    def test_members(self, tmp_path: pathlib.Path, make: ArchiveMaker) -> None:
+        source = tmp_path.joinpath("file")
+        source.write_bytes(b"content")
+
+        archive = make(tmp_path.joinpath("archive"), [source])
+
+        members = {m.name: m.data for m in archive_members(archive)}
+
+        assert members["study/file"] == b"content"
+
+
+class TestReadMember:
+    def test_dicom(self, dicom_file: pathlib.Path) -> None:
+        member = ArchiveMember("dicom", dicom_file.read_bytes())
+
+        dataset = read_member(member, stop_before_pixels=True)
+
+        assert dataset is not None
+        assert "PatientName" in dataset
+
+    def test_specific_tags(self, dicom_file: pathlib.Path) -> None:
+        member = ArchiveMember("dicom", dicom_file.read_bytes())
+
+        dataset = read_member(member, specific_tags=["SeriesNumber"])
+
+        assert dataset is not None
+        assert "SeriesNumber" in dataset
+        assert "PatientName" not in dataset
+
+    def test_not_dicom(self) -> None:
+        assert read_member(ArchiveMember("report.txt", b"x" * 200)) is None
+
+    def test_headerless(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("raw")
+        DicomFactory.save_headerless(
+            DicomFactory.build_with_defaults(SeriesNumber=3), filename
+        )
+
+        dataset = read_member(ArchiveMember("raw", filename.read_bytes()))
+
+        assert dataset is not None
+        assert dataset.SeriesNumber == 3
+
+    def test_dicomdir(self, dicom_folder: DicomFolderGenerator) -> None:
+        dicomdir = dicom_folder(0, True).files[-1]
+        member = ArchiveMember("DICOMDIR", dicomdir.read_bytes())
+
+        assert read_member(member) is None
+        assert read_member(member, ignore_dicomdir=False) is not None
+
+
+class TestOutputFormat:
+    @pytest.mark.parametrize(
+        "name,expected",
+        [
+            ("out.zip", "zip"),
+            ("out.ZIP", "zip"),
+            ("out.tar", "w"),
+            ("out.tar.gz", "w:gz"),
+            ("out.tgz", "w:gz"),
+            ("output", None),
+            ("out.gz", None),
+        ],
+    )
+    def test_output_format(self, name: str, expected: str) -> None:
+        assert output_format(pathlib.Path(name)) == expected
+
+
+class TestArchiveWriter:
+    @pytest.mark.parametrize("name", ["out.zip", "out.tar.gz"])
+    def test_round_trip(self, tmp_path: pathlib.Path, name: str) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"from file")
+
+        writer = ArchiveWriter(tmp_path.joinpath("nested", name))
+        writer.write("a/file.dcm", source=source)
+        writer.write("a/data.dcm", data=b"from memory")
+        writer.close()
+
+        members = {
+            m.name: m.data for m in archive_members(tmp_path.joinpath("nested", name))
+        }
+
+        assert members == {"a/file.dcm": b"from file", "a/data.dcm": b"from memory"}
+
+    def test_unique_names(self, tmp_path: pathlib.Path) -> None:
+        writer = ArchiveWriter(tmp_path.joinpath("out.zip"))
+
+        assert writer.write("a/image.dcm", data=b"1") == "a/image.dcm"
+        assert writer.write("a/image.dcm", data=b"2") == "a/image (2).dcm"
+        assert writer.write("b/image.dcm", data=b"3") == "b/image.dcm"
+
+        writer.close()
+
+    def test_duplicate_keys(self, tmp_path: pathlib.Path) -> None:
+        writer = ArchiveWriter(tmp_path.joinpath("out.zip"))
+
+        assert writer.write("a.dcm", data=b"1", key="1.2.3") == "a.dcm"
+        assert writer.write("b.dcm", data=b"1", key="1.2.3") == "a.dcm"
+        writer.close()
+
+        assert [m.name for m in archive_members(tmp_path.joinpath("out.zip"))] == [
+            "a.dcm"
+        ]
+
+    def test_unsupported_format(self, tmp_path: pathlib.Path) -> None:
+        with pytest.raises(ValueError):
+            ArchiveWriter(tmp_path.joinpath("out.rar"))
+
+    @pytest.mark.parametrize("name", ["out.zip", "out.tar.gz"])
+    def test_existing_archive(self, tmp_path: pathlib.Path, name: str) -> None:
+        filename = tmp_path.joinpath(name)
+        filename.write_bytes(b"existing")
+
+        with pytest.raises(DicomsorterException):
+            ArchiveWriter(filename)
+
+        assert filename.read_bytes() == b"existing"
+
+        writer = ArchiveWriter(filename, overwrite=True)
+        writer.write("a.dcm", data=b"1")
+        writer.close()
+
+        assert [m.name for m in archive_members(filename)] == ["a.dcm"]
+
+
+class TestSortArchive:
+    @pytest.mark.parametrize("make", [make_zip, make_tar])
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    def test_all_members_sorted(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        make: ArchiveMaker,
+        concurrency: int,
+    ) -> None:
+        input_folder = dicom_folder(5, False)
+        archive = make(
+            tmp_path_factory.mktemp("archive").joinpath("archive"),
+            input_folder.files,
+        )
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=archive,
+            output_directory=output_folder,
+            original_filename=True,
+            concurrency=concurrency,
+            queue_size=2,
+        )
+
+        DICOMSorter(config).start()
+
+        sorted_files = [f for f in output_folder.rglob("*") if f.is_file()]
+        assert sorted(f.name for f in sorted_files) == sorted(
+            f.name for f in input_folder.files
+        )
+
+        contents = {f.name: f.read_bytes() for f in sorted_files}
+
+        for f in input_folder.files:
+            assert contents[f.name] == f.read_bytes()
+
+    def test_dry_run(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        archive = make_zip(
+            tmp_path_factory.mktemp("archive").joinpath("a.zip"), input_folder.files
+        )
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=archive,
+            output_directory=output_folder,
+            original_filename=True,
+            dry_run=True,
+        )
+
+        DICOMSorter(config).start()
+
+        assert list(output_folder.iterdir()) == []
+
+    def test_read_ahead_bounded(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(10, False)
+        archive = make_zip(
+            tmp_path_factory.mktemp("archive").joinpath("a.zip"), input_folder.files
+        )
+        config = Config(
+            input_directory=archive,
+            output_directory=tmp_path_factory.mktemp("output"),
+            original_filename=True,
+            concurrency=2,
+        )
+        sorter = DICOMSorter(config)
+        sort_member = sorter.sort_member
+        lock = threading.Lock()
+        read: List[str] = []
+        ahead: List[int] = []
+
+        def reading(filename: pathlib.Path) -> Iterator[ArchiveMember]:
+            for member in archive_members(filename):
+                with lock:
+                    read.append(member.name)
+
+                yield member
+
+        def sorting(member: ArchiveMember) -> Any:
+            # Members which have been read but not yet started
+            with lock:
+                ahead.append(len(read) - len(ahead))
+
+            return sort_member(member)
+
+        with patch(
+            "dicomsorter.dicomsorter.archive_members", side_effect=reading
+        ), patch.object(sorter, "sort_member", side_effect=sorting):
+            sorter.start()
+
+        assert len(ahead) == 11
+        assert max(ahead) <= 2 * config.concurrency
+
+
+class TestSortToArchive:
+    @pytest.mark.parametrize("executor", ["thread", "process", "hybrid"])
+    @pytest.mark.parametrize("name", ["out.zip", "out.tar.gz"])
+    def test_all_files_written(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        executor: str,
+        name: str,
+    ) -> None:
+        input_folder = dicom_folder(5, False)
+        output = tmp_path_factory.mktemp("output").joinpath(name)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output,
+            original_filename=True,
+            executor=executor,
+        )
+
+        sorter = DICOMSorter(config)
+        sorter.start()
+
+        members = {m.name: m.data for m in archive_members(output)}
+        expected = {}
+
+        for f in input_folder.files:
+            destination = sorter.destination(f, sorter.load(f))
+            expected[destination.relative_to(output).as_posix()] = f.read_bytes()
+
+        assert members == expected
+
+    def test_collisions(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output = tmp_path_factory.mktemp("output").joinpath("out.zip")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output,
+            path=[],
+            filename_format="image.dcm",
+            concurrency=1,
+        )
+
+        DICOMSorter(config).start()
+
+        assert sorted(m.name for m in archive_members(output)) == [
+            "image (2).dcm",
+            "image (3).dcm",
+            "image.dcm",
+        ]
+
+    def test_from_archive(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        archive = make_tar(
+            tmp_path_factory.mktemp("archive").joinpath("in.tar"), input_folder.files
+        )
+        output = tmp_path_factory.mktemp("output").joinpath("out.zip")
+        config = Config(
+            input_directory=archive,
+            output_directory=output,
+            path=[],
+            original_filename=True,
+        )
+
+        DICOMSorter(config).start()
+
+        assert sorted(m.name for m in archive_members(output)) == sorted(
+            f.name for f in input_folder.files
+        )
+
+    def test_dry_run(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output = tmp_path_factory.mktemp("output").joinpath("out.zip")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output,
+            original_filename=True,
+            dry_run=True,
+        )
+
+        DICOMSorter(config).start()
+
+        assert not output.exists()
+
+    def test_plan_rejected(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output = tmp_path_factory.mktemp("output").joinpath("out.zip")
+        directory_config = Config(
+            input_directory=input_folder.path,
+            output_directory=output.with_name("out"),
+        )
+        plan = DICOMSorter(directory_config).plan()
+
+        config = Config(input_directory=input_folder.path, output_directory=output)
+
+        with pytest.raises(DicomsorterException):
+            DICOMSorter(config).plan()
+
+        with pytest.raises(DicomsorterException):
+            DICOMSorter(config).execute(plan)
+
+        assert not output.exists()
+
+    def test_closed_on_error(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output = tmp_path_factory.mktemp("output").joinpath("out.zip")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output,
+            original_filename=True,
+            concurrency=1,
+        )
+        sorter = DICOMSorter(config)
+        write = sorter.write
+        written: List[Any] = []
+
+        def write_then_fail(*args: Any) -> None:
+            if written:
+                raise RuntimeError("Interrupted")
+
+            write(*args)
+            written.append(args)
+
+        with patch.object(sorter, "write", side_effect=write_then_fail):
+            with pytest.raises(RuntimeError):
+                sorter.start()
+
+        # The files written before the error can still be read
+        assert len(list(archive_members(output))) == 1
@@ -0,0 +1,115 @@
+import pathlib
+from unittest.mock import patch
+
+import pytest
+
+from dicomsorter.async_sorter import AsyncDICOMSorter
+from dicomsorter.config import Config
+from dicomsorter.index import INDEX_FILENAME
+
+from .conftest import DicomFolderGenerator
+
+
+class TestAsyncDICOMSorter:
+    @pytest.mark.parametrize("inflight", [1, 3, 256])
+    def test_all_files_sorted(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        inflight: int,
+    ) -> None:
+        input_folder = dicom_folder(10, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            original_filename=True,
+            use_async=True,
+            inflight=inflight,
+        )
+
+        AsyncDICOMSorter(config).start()
+
+        sorted_files = sorted(f.name for f in output_folder.rglob("*") if f.is_file())
+        assert sorted_files == sorted(f.name for f in input_folder.files)
+
+    def test_does_not_use_processes(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path.joinpath("output"),
+            original_filename=True,
+            use_async=True,
+        )
+
+        with patch("dicomsorter.dicomsorter.ProcessPool") as mock_pool:
+            AsyncDICOMSorter(config).start()
+
+        mock_pool.assert_not_called()
+
+    def test_stream_with_small_queue(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(10, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            original_filename=True,
+            use_async=True,
+            inflight=8,
+            stream=True,
+            queue_size=2,
+        )
+
+        AsyncDICOMSorter(config).start()
+
+        assert len([f for f in output_folder.rglob("*") if f.is_file()]) == 10
+
+    def test_collisions_get_unique_names(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(10, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            filename_format="image.dcm",
+            path=[],
+            use_async=True,
+            inflight=10,
+        )
+
+        AsyncDICOMSorter(config).start()
+
+        assert len(list(output_folder.glob("image*.dcm"))) == 10
+
+    def test_index(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            original_filename=True,
+            index=True,
+            use_async=True,
+        )
+
+        AsyncDICOMSorter(config).start()
+
+        assert output_folder.joinpath(INDEX_FILENAME).exists()
+
+        with patch.object(AsyncDICOMSorter, "resolve") as resolve:
+            AsyncDICOMSorter(config).start()
+
+        resolve.assert_not_called()
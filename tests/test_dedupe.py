@@ -0,0 +1,81 @@
+"""Unit tests for dedupe module."""
+import hashlib
+import pathlib
+
+from dicomsorter.dedupe import DedupeIndex, content_hash
+
+
+class TestContentHash:
+    def test_matches_sha256(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("file")
+        filename.write_bytes(b"DICM" * 1000)
+
+        expected = hashlib.sha256(b"DICM" * 1000).hexdigest()
+
+        assert content_hash(filename, chunk_size=7) == expected
+
+    def test_different_content(self, tmp_path: pathlib.Path) -> None:
+        first = tmp_path.joinpath("first")
+        second = tmp_path.joinpath("second")
+        first.write_bytes(b"a")
+        second.write_bytes(b"b")
+
+        assert content_hash(first) != content_hash(second)
+
+
+class TestDedupeIndex:
+    def test_first_claim_succeeds(self, tmp_path: pathlib.Path) -> None:
+        index = DedupeIndex(tmp_path.joinpath("index"))
+
+        assert index.claim("1.2.3", tmp_path.joinpath("a")) is None
+
+    def test_duplicate_returns_existing(self, tmp_path: pathlib.Path) -> None:
+        index = DedupeIndex(tmp_path.joinpath("index"))
+        existing = tmp_path.joinpath("a")
+        existing.touch()
+
+        index.claim("1.2.3", existing)
+
+        assert index.claim("1.2.3", tmp_path.joinpath("b")) == existing
+        assert index.claim("1.2.4", tmp_path.joinpath("c")) is None
+
+    def test_shared_between_instances(self, tmp_path: pathlib.Path) -> None:
+        existing = tmp_path.joinpath("a")
+        existing.touch()
+
+        DedupeIndex(tmp_path.joinpath("index")).claim("1.2.3", existing)
+        index = DedupeIndex(tmp_path.joinpath("index"))
+
+        assert index.claim("1.2.3", tmp_path.joinpath("b")) == existing
+
+    def test_removed_destination_is_replaced(self, tmp_path: pathlib.Path) -> None:
+        index = DedupeIndex(tmp_path.joinpath("index"))
+        index.claim("1.2.3", tmp_path.joinpath("missing"))
+
+        replacement = tmp_path.joinpath("b")
+        replacement.touch()
+
+        assert index.claim("1.2.3", replacement) is None
+        assert index.claim("1.2.3", tmp_path.joinpath("c")) == replacement
+
+    def test_release(self, tmp_path: pathlib.Path) -> None:
+        index = DedupeIndex(tmp_path.joinpath("index"))
+        existing = tmp_path.joinpath("a")
+        existing.touch()
+
+        index.claim("1.2.3", existing)
+        index.release("1.2.3")
+        index.release("1.2.3")
+
+        assert index.claim("1.2.3", tmp_path.joinpath("b")) is None
+
+    def test_no_temporary_files_left(self, tmp_path: pathlib.Path) -> None:
+        index = DedupeIndex(tmp_path.joinpath("index"))
+        existing = tmp_path.joinpath("a")
+        existing.touch()
+
+        index.claim("1.2.3", existing)
+        index.claim("1.2.3", tmp_path.joinpath("b"))
+
+        files = [f.name for f in tmp_path.joinpath("index").rglob("*") if f.is_file()]
+        assert files == [index.path("1.2.3").name]
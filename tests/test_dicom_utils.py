@@ -1,16 +1,24 @@
 """Unit tests for dicom_utils module."""
+import io
 import os
 import pathlib
+from typing import Any, List, Optional
+from unittest.mock import patch
 
 import pytest
 from pydicom import Dataset
 
 from dicomsorter.dicom_utils import (
+    DICOM,
+    HEADER_BUFFER_SIZE,
     age_in_years,
     available_fields,
     dicom_list,
     has_dicm_prefix,
     is_dicom,
+    is_headerless,
+    required_tags,
+    scan_directory,
 )
 from dicomsorter.errors import DicomsorterException
 
@@ -39,6 +47,60 @@ class TestDicomList:
         with pytest.raises(DicomsorterException, match=message):
             list(dicom_list(directory))
 
+    def test_with_workers(self, tmp_path: pathlib.Path) -> None:
+        expected = []
+
+        for directory in ["a", "a/b", "a/b/c", "d"]:
+            folder = tmp_path.joinpath(directory)
+            folder.mkdir(parents=True, exist_ok=True)
+            folder.joinpath("notes.txt").write_bytes(b"not a dicom")
+
+            for k in range(3):
+                filename = folder.joinpath("Image%04d" % k)
+                DicomFactory.build_with_defaults().save_as(
+                    filename, write_like_original=False
+                )
+                expected.append(filename)
+
+        # Symlinked directories are not followed
+        tmp_path.joinpath("link").symlink_to(tmp_path.joinpath("a"))
+
+        serial = list(dicom_list(tmp_path, load=False))
+        parallel = list(dicom_list(tmp_path, load=False, workers=4))
+
+        assert sorted(parallel) == sorted(serial) == sorted(expected)
+
+    def test_with_workers_and_load(self, dicom_folder: DicomFolderGenerator) -> None:
+        df = dicom_folder(5, False)
+        dicoms = list(dicom_list(df.path, load=True, workers=2))
+
+        assert len(dicoms) == 5
+        assert all(isinstance(dicom, Dataset) for dicom in dicoms)
+
+    def test_with_workers_when_no_dicoms(
+        self, dicom_folder: DicomFolderGenerator
+    ) -> None:
+        params = dicom_folder(0, False)
+        message = f'No valid DICOMs found in "{params.path}".'
+
+        with pytest.raises(DicomsorterException, match=message):
+            list(dicom_list(params.path, workers=2))
+
+
+class TestScanDirectory:
+    def test_files_and_subdirectories(self, tmp_path: pathlib.Path) -> None:
+        tmp_path.joinpath("file").write_bytes(b"")
+        tmp_path.joinpath("subdirectory").mkdir()
+        tmp_path.joinpath("link").symlink_to(tmp_path.joinpath("subdirectory"))
+
+        files, subdirectories = scan_directory(tmp_path)
+
+        assert files == [tmp_path.joinpath("file")]
+        assert subdirectories == [tmp_path.joinpath("subdirectory")]
+
+    def test_missing_directory(self, tmp_path: pathlib.Path) -> None:
+        assert scan_directory(tmp_path.joinpath("missing")) == ([], [])
+
 
 class TestAvailableFields:
     def test_when_is_dicom(self, tmpdir: pathlib.Path) -> None:
@@ -81,6 +143,24 @@ class TestAgeInYears:
         assert age_in_years(dicom) == ""
 
 
+class TestRequiredTags:
+    def test_includes_derived_dependencies(self) -> None:
+        tags = required_tags([])
+
+        assert tags is not None
+        assert {"ImageType", "PatientBirthDate", "SeriesNumber"} <= tags
+
+    def test_with_keywords(self) -> None:
+        tags = required_tags(["PatientName", "InstanceNumber", "Extension"])
+
+        assert tags is not None
+        assert {"PatientName", "InstanceNumber"} <= tags
+        assert "Extension" not in tags
+
+    def test_with_unknown_field(self) -> None:
+        assert required_tags(["PatientName", "NotAKeyword"]) is None
+
+
 class TestIsDicom:
     def test_non_dicom(self, tmp_path: pathlib.Path) -> None:
         filename = tmp_path.joinpath("invalid")
@@ -108,6 +188,180 @@ class TestIsDicom:
 
         assert is_dicom(filename, ignore_dicomdir=False)
 
+    def test_stop_before_pixels(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("image")
+        dicom = DicomFactory.build_with_defaults(
+            BitsAllocated=8, PixelRepresentation=0, PixelData=b"\x00" * 1024
+        )
+        dicom.save_as(filename, write_like_original=False)
+
+        full = is_dicom(filename)
+        header = is_dicom(filename, stop_before_pixels=True)
+
+        assert isinstance(full, Dataset) and "PixelData" in full
+        assert isinstance(header, Dataset) and "PixelData" not in header
+        assert header.SeriesDescription == full.SeriesDescription
+
+    def test_specific_tags(self, dicom_file: pathlib.Path) -> None:
+        dicom = is_dicom(dicom_file, specific_tags=["PatientName"])
+
+        assert isinstance(dicom, Dataset)
+        assert "PatientName" in dicom
+        assert "SeriesDescription" not in dicom
+
+    def test_specific_tags_with_dicomdir(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("DICOMDIR")
+        dicomdir = DicomDirFactory.build()
+        dicomdir.save_as(filename, write_like_original=False)
+
+        assert is_dicom(filename, specific_tags=["PatientName"]) is False
+
+    def test_skip_extensions(self, dicom_file: pathlib.Path) -> None:
+        filename = dicom_file.rename(dicom_file.with_suffix(".TXT"))
+
+        assert is_dicom(filename, load=False) is False
+        assert is_dicom(filename, load=False, skip_extensions=[])
+
+    @pytest.mark.parametrize("implicit_vr", [True, False])
+    def test_headerless(self, tmp_path: pathlib.Path, implicit_vr: bool) -> None:
+        filename = tmp_path.joinpath("headerless")
+        DicomFactory.save_headerless(
+            DicomFactory.build_with_defaults(SeriesDescription="Headerless"),
+            filename,
+            implicit_vr,
+        )
+
+        dicom = is_dicom(filename)
+
+        assert is_dicom(filename, load=False) is True
+        assert isinstance(dicom, Dataset)
+        assert dicom.SeriesDescription == "Headerless"
+
+    @pytest.mark.parametrize(
+        "memory_map,threshold,expected",
+        [
+            (False, 0, [HEADER_BUFFER_SIZE]),
+            (True, 1024**3, [HEADER_BUFFER_SIZE]),
+            # The header is read from a memory mapping rather than any reads
+            (True, 0, []),
+        ],
+    )
+    def test_header_reads(
+        self,
+        tmp_path: pathlib.Path,
+        memory_map: bool,
+        threshold: int,
+        expected: List[int],
+    ) -> None:
+        filename = tmp_path.joinpath("image")
+        dicom = DicomFactory.build_with_defaults(
+            BitsAllocated=8, PixelRepresentation=0, PixelData=b"\x00" * 1024**2
+        )
+        dicom.save_as(filename, write_like_original=False)
+        reads: List[int] = []
+
+        class CountingFileIO(io.FileIO):
+            def readinto(self, buffer: Any) -> Optional[int]:
+                reads.append(len(buffer))
+                return super().readinto(buffer)
+
+        with patch("dicomsorter.dicom_utils.io.FileIO", CountingFileIO), patch(
+            "dicomsorter.dicom_utils.MMAP_THRESHOLD", threshold
+        ):
+            header = is_dicom(filename, stop_before_pixels=True, memory_map=memory_map)
+
+        # The probe and header were both read from a single block (or mapping)
+        assert isinstance(header, Dataset)
+        assert header.SeriesDescription == dicom.SeriesDescription
+        assert "PixelData" not in header
+        assert reads == expected
+
+    def test_memory_map_with_pixels(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("image")
+        dicom = DicomFactory.build_with_defaults(
+            BitsAllocated=8, PixelRepresentation=0, PixelData=b"\x00" * 1024**2
+        )
+        dicom.save_as(filename, write_like_original=False)
+        reads: List[int] = []
+
+        class CountingFileIO(io.FileIO):
+            def readinto(self, buffer: Any) -> Optional[int]:
+                reads.append(len(buffer))
+                return super().readinto(buffer)
+
+        with patch("dicomsorter.dicom_utils.io.FileIO", CountingFileIO), patch(
+            "dicomsorter.dicom_utils.MMAP_THRESHOLD", 0
+        ):
+            loaded = is_dicom(filename, memory_map=True)
+
+        # Files read in full are read sequentially rather than mapped
+        assert isinstance(loaded, Dataset)
+        assert "PixelData" in loaded
+        assert reads
+
+    def test_memory_map_headerless(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("headerless")
+        DicomFactory.save_headerless(
+            DicomFactory.build_with_defaults(SeriesDescription="Headerless"), filename
+        )
+
+        with patch("dicomsorter.dicom_utils.MMAP_THRESHOLD", 0):
+            dicom = is_dicom(filename, stop_before_pixels=True, memory_map=True)
+
+        assert isinstance(dicom, Dataset)
+        assert dicom.SeriesDescription == "Headerless"
+
+    def test_text_starting_like_an_element(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("report")
+        filename.write_bytes(b"\x08\x00hello, this is not DICOM" * 10)
+
+        assert is_dicom(filename, load=False) is False
+        assert is_dicom(filename) is False
+
+
+class TestIsHeaderless:
+    def test_implicit_vr(self) -> None:
+        # (0008,0020) StudyDate followed by (0008,0030) StudyTime
+        data = (
+            b"\x08\x00\x20\x00\x08\x00\x00\x0019941001"
+            b"\x08\x00\x30\x00\x06\x00\x00\x00120000"
+        )
+
+        assert is_headerless(data) is True
+
+    def test_explicit_vr(self) -> None:
+        data = b"\x08\x00\x20\x00DA\x08\x0019941001\x08\x00\x30\x00TM\x06\x00120000"
+
+        assert is_headerless(data) is True
+
+    def test_length_exceeds_probe(self) -> None:
+        data = b"\x08\x00\x20\x00\xff\x00\x00\x00"
+
+        assert is_headerless(data) is False
+
+    def test_tags_out_of_order(self) -> None:
+        data = b"\x08\x00\x30\x00\x02\x00\x00\x0000\x08\x00\x20\x00\x00\x00\x00\x00"
+
+        assert is_headerless(data) is False
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            # Only a single element
+            b"\x08\x00\x20\x00\x08\x00\x00\x0019941001",
+            # The second element is cut off by the end of the probe
+            b"\x08\x00\x20\x00\x08\x00\x00\x0019941001\x08\x00\x30\x00",
+            # The length of the second element exceeds the probe
+            b"\x08\x00\x20\x00\x08\x00\x00\x0019941001\x08\x00\x30\x00\xff\x00\x00\x00",
+        ],
+    )
+    def test_second_element_required(self, data: bytes) -> None:
+        assert is_headerless(data) is False
+
+    @pytest.mark.parametrize("data", [b"", b"\x08\x00", b"\x10\x00" + b"\x00" * 10])
+    def test_invalid(self, data: bytes) -> None:
+        assert is_headerless(data) is False
+
 
 class TestHasDICMPrefix:
     def test_no_prefix(self, tmp_path: pathlib.Path) -> None:
@@ -127,3 +381,22 @@ class TestHasDICMPrefix:
 
     def test_with_valid_dicom(self, dicom_file: pathlib.Path) -> None:
         assert has_dicm_prefix(dicom_file) is True
+
+
+class TestDICOMGet:
+    @pytest.mark.parametrize(
+        "attribute",
+        [
+            "ImageType",
+            "Extension",
+            "SeriesDescription",
+            "PatientName",
+            "InstanceNumber",
+            "NotAKeyword",
+            "filename",
+        ],
+    )
+    def test_matches_getitem(self, dicom_file: pathlib.Path, attribute: str) -> None:
+        dicom = DICOM(dicom_file)
+
+        assert dicom.get(attribute) == dicom[attribute]
@@ -1,13 +1,63 @@
 """Unit tests for DICOMSorter class."""
+import json
 import pathlib
+import shutil
+import sqlite3
+import threading
+import time
+import zipfile
+from typing import Any, Dict, Generator, List, Tuple
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from dicomsorter.config import Config
+from dicomsorter.dicom_utils import DICOM
 from dicomsorter.dicomsorter import DICOMSorter
+from dicomsorter.index import INDEX_FILENAME
+from dicomsorter.journal import JOURNAL_FILENAME, Journal
+from dicomsorter.transfer import transfer
 
 from .conftest import DicomFolderGenerator
+from .factories import DicomFactory
+
+
+def make_zip(
+    tmp_path_factory: pytest.TempPathFactory, files: List[pathlib.Path]
+) -> pathlib.Path:
+    filename = tmp_path_factory.mktemp("archive").joinpath("in.zip")
+
+    with zipfile.ZipFile(filename, "w") as archive:
+        for f in files:
+            archive.write(f, f.name)
+
+    return filename
+
+
+def run_sorter(sorter: DICOMSorter, run: str, count: int) -> None:
+    """Sort by starting, applying a plan or watching until ``count`` files are sorted."""
+    if run == "plan":
+        sorter.execute(sorter.plan())
+        return
+
+    if run != "watch":
+        sorter.start()
+        return
+
+    output_folder = sorter.config.output_directory
+    stop = threading.Event()
+    thread = threading.Thread(target=sorter.watch, args=(stop,))
+    thread.start()
+
+    deadline = time.monotonic() + 10
+
+    while time.monotonic() < deadline and (
+        sum(f.is_file() for f in output_folder.rglob("*")) < count
+    ):
+        time.sleep(0.05)
+
+    stop.set()
+    thread.join()
 
 
 class TestDICOMSorterConcurrency:
@@ -63,7 +113,7 @@ class TestDICOMSorterConcurrency:
             # Create a mock pool instance
             mock_pool_instance = MagicMock()
             mock_pool.return_value = mock_pool_instance
-            mock_pool_instance.imap.return_value = iter([None] * 5)
+            mock_pool_instance.imap.return_value = iter([])
 
             sorter.start()
 
@@ -110,14 +160,1060 @@ class TestDICOMSorterConcurrency:
         sorter_2.start()
 
         # Get sorted files from both outputs
-        files_1 = sorted(
-            [f.name for f in output_folder_1.rglob("*") if f.is_file()]
-        )
-        files_2 = sorted(
-            [f.name for f in output_folder_2.rglob("*") if f.is_file()]
-        )
+        files_1 = sorted([f.name for f in output_folder_1.rglob("*") if f.is_file()])
+        files_2 = sorted([f.name for f in output_folder_2.rglob("*") if f.is_file()])
 
         # Both should have the same files
         assert len(files_1) == 3
         assert len(files_2) == 3
         assert files_1 == files_2
+
+
+class TestDICOMSorterExecutor:
+    """Test DICOMSorter with different executors."""
+
+    @pytest.mark.parametrize("executor", ["thread", "process", "hybrid"])
+    def test_all_files_sorted(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        executor: str,
+    ) -> None:
+        input_folder = dicom_folder(5, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=2,
+            original_filename=True,
+            executor=executor,
+        )
+
+        DICOMSorter(config).start()
+
+        sorted_files = sorted(f.name for f in output_folder.rglob("*") if f.is_file())
+        assert sorted_files == sorted(f.name for f in input_folder.files)
+
+    def test_thread_executor_does_not_use_processes(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path.joinpath("output"),
+            concurrency=2,
+            original_filename=True,
+            executor="thread",
+        )
+
+        with patch("dicomsorter.dicomsorter.ProcessPool") as mock_pool:
+            DICOMSorter(config).start()
+
+        mock_pool.assert_not_called()
+
+    @pytest.mark.parametrize("stream", [False, True])
+    @pytest.mark.parametrize("chunk_size", [0, 1, 3])
+    def test_chunk_size(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        chunk_size: int,
+        stream: bool,
+    ) -> None:
+        input_folder = dicom_folder(7, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=2,
+            chunk_size=chunk_size,
+            original_filename=True,
+            executor="thread",
+            stream=stream,
+            queue_size=2,
+        )
+
+        DICOMSorter(config).start()
+
+        sorted_files = sorted(f.name for f in output_folder.rglob("*") if f.is_file())
+        assert sorted_files == sorted(f.name for f in input_folder.files)
+
+    @pytest.mark.parametrize("executor", ["thread", "process", "hybrid"])
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    def test_stats_file(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        executor: str,
+        concurrency: int,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        stats_file = tmp_path_factory.mktemp("stats").joinpath("stats.json")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=concurrency,
+            original_filename=True,
+            executor=executor,
+            stats_file=stats_file,
+        )
+
+        DICOMSorter(config).start()
+
+        report = json.loads(stats_file.read_text())
+        size = sum(f.stat().st_size for f in input_folder.files)
+
+        assert report["counters"]["files"] == 4
+        assert report["counters"]["bytes_transferred"] == size
+
+        for stage in ["discovery", "parse", "format", "mkdir", "claim", "transfer"]:
+            assert report["stages"][stage]["count"] == 4
+
+    @pytest.mark.parametrize(
+        "options, counter",
+        [({"move": True}, "files_moved"), ({"link": "sym"}, "files_linked")],
+    )
+    def test_stats_file_without_copies(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        options: Dict[str, Any],
+        counter: str,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        stats_file = tmp_path_factory.mktemp("stats").joinpath("stats.json")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=1,
+            original_filename=True,
+            stats_file=stats_file,
+            **options,
+        )
+
+        DICOMSorter(config).start()
+
+        report = json.loads(stats_file.read_text())
+
+        assert report["counters"][counter] == 3
+        assert "bytes_transferred" not in report["counters"]
+
+    def test_stats_file_failed_transfers(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        failed = input_folder.files[0]
+        stats_file = tmp_path_factory.mktemp("stats").joinpath("stats.json")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=1,
+            original_filename=True,
+            stats_file=stats_file,
+        )
+
+        def failing(source: pathlib.Path, *args: Any, **kwargs: Any) -> None:
+            if source == failed:
+                raise OSError("Failed")
+
+            transfer(source, *args, **kwargs)
+
+        with patch("dicomsorter.dicomsorter.transfer", side_effect=failing):
+            DICOMSorter(config).start()
+
+        report = json.loads(stats_file.read_text())
+
+        assert report["counters"]["bytes_transferred"] == (
+            input_folder.files[1].stat().st_size
+        )
+
+    @pytest.mark.parametrize("run", ["archive", "plan", "watch"])
+    def test_stats_file_of_other_runs(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        run: str,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        input_path = input_folder.path
+
+        if run == "archive":
+            input_path = make_zip(tmp_path_factory, input_folder.files)
+
+        stats_file = tmp_path_factory.mktemp("stats").joinpath("stats.json")
+        config = Config(
+            input_directory=input_path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=2,
+            original_filename=True,
+            executor="process",
+            stats_file=stats_file,
+            settle=0.0,
+            poll=True,
+            poll_interval=0.05,
+        )
+        run_sorter(DICOMSorter(config), run, 4)
+
+        report = json.loads(stats_file.read_text())
+
+        assert report["counters"]["files"] == 4
+        assert report["stages"]["transfer"]["count"] == 4
+
+    def test_stats_file_on_error(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        stats_file = tmp_path_factory.mktemp("stats").joinpath("stats.json")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=1,
+            stats_file=stats_file,
+        )
+        sorter = DICOMSorter(config)
+
+        with patch.object(sorter, "dispatch", side_effect=RuntimeError("Failed")):
+            with pytest.raises(RuntimeError):
+                sorter.start()
+
+        assert json.loads(stats_file.read_text())["stages"]["discovery"]["count"] == 2
+
+    @pytest.mark.parametrize("profile_mode", ["cprofile", "sample"])
+    def test_profile(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        profile_mode: str,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        profile = tmp_path_factory.mktemp("profile")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=2,
+            chunk_size=1,
+            original_filename=True,
+            executor="process",
+            profile=profile,
+            profile_mode=profile_mode,
+        )
+
+        DICOMSorter(config).start()
+
+        names = {f.name.split("-")[0] for f in profile.iterdir()}
+
+        assert {"main", "worker", "summary.txt"} <= names
+
+    @pytest.mark.parametrize("run", ["archive", "plan", "watch"])
+    def test_profile_of_other_runs(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        run: str,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        input_path = input_folder.path
+
+        if run == "archive":
+            input_path = make_zip(tmp_path_factory, input_folder.files)
+
+        profile = tmp_path_factory.mktemp("profile")
+        profile.joinpath("unrelated.pstats").touch()
+        config = Config(
+            input_directory=input_path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=2,
+            original_filename=True,
+            executor="process",
+            profile=profile,
+            settle=0.0,
+            poll=True,
+            poll_interval=0.05,
+        )
+
+        run_sorter(DICOMSorter(config), run, 4)
+
+        names = {f.name.split("-")[0] for f in profile.iterdir()}
+
+        assert {"worker", "summary.txt", "unrelated.pstats"} <= names
+        assert "Merged profiles" in profile.joinpath("summary.txt").read_text()
+
+
+class TestDICOMSorterHeaderOnly:
+    """Test that DICOMSorter only reads the header by default."""
+
+    def test_sort_stops_before_pixels(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        input_folder = dicom_folder(1, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path.joinpath("output"),
+        )
+        sorter = DICOMSorter(config)
+
+        with patch("dicomsorter.dicomsorter.DICOM", wraps=DICOM) as mock_dicom:
+            sorter.sort(input_folder.files[0])
+
+        mock_dicom.assert_called_once_with(
+            input_folder.files[0],
+            stop_before_pixels=True,
+            specific_tags=sorter.tags,
+            memory_map=False,
+        )
+        assert sorter.tags is not None
+        assert {"SeriesDescription", "InstanceNumber"} <= sorter.tags
+
+    def test_sort_reads_pixels_when_disabled(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        input_folder = dicom_folder(1, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path.joinpath("output"),
+            header_only=False,
+        )
+
+        with patch("dicomsorter.dicomsorter.DICOM", wraps=DICOM) as mock_dicom:
+            DICOMSorter(config).sort(input_folder.files[0])
+
+        mock_dicom.assert_called_once_with(
+            input_folder.files[0],
+            stop_before_pixels=False,
+            specific_tags=None,
+            memory_map=False,
+        )
+
+    def test_sort_reads_everything_for_unknown_fields(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        input_folder = dicom_folder(1, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path.joinpath("output"),
+            path=["NotAKeyword"],
+        )
+
+        assert DICOMSorter(config).tags is None
+
+
+class TestDICOMSorterDetection:
+    @pytest.mark.parametrize("skip_extensions", [[], [".txt"]])
+    def test_headerless_and_skipped(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        skip_extensions: List[str],
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output_folder = tmp_path_factory.mktemp("output")
+
+        DicomFactory.save_headerless(
+            DicomFactory.build_with_defaults(), input_folder.path.joinpath("raw")
+        )
+        shutil.copy(input_folder.files[0], input_folder.path.joinpath("named.txt"))
+
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            original_filename=True,
+            concurrency=1,
+            skip_extensions=skip_extensions,
+        )
+
+        with patch("dicomsorter.dicom_utils.pydicom.dcmread") as dcmread:
+            dcmread.side_effect = AssertionError("Discovery shouldn't parse files")
+            files = list(DICOMSorter(config).discover())
+
+        expected = {"Image0000", "Image0001", "raw"}
+
+        if not skip_extensions:
+            expected.add("named.txt")
+
+        assert {f.name for f in files} == expected
+
+        DICOMSorter(config).start()
+
+        assert {f.name for f in output_folder.rglob("*") if f.is_file()} == expected
+
+    @pytest.mark.parametrize("executor", ["thread", "process"])
+    def test_single_open(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        executor: str,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        input_folder.path.joinpath("notes").write_bytes(b"not DICOM")
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            original_filename=True,
+            executor=executor,
+            single_open=True,
+        )
+
+        # Discovery no longer opens any files
+        with patch("dicomsorter.dicom_utils.io.FileIO") as file_io:
+            files = list(DICOMSorter(config).discover())
+
+        file_io.assert_not_called()
+        assert len(files) == 4
+
+        with patch("dicomsorter.dicomsorter.logger") as logger:
+            DICOMSorter(config).start()
+
+        logger.error.assert_not_called()
+        assert sorted(f.name for f in output_folder.rglob("*") if f.is_file()) == [
+            f.name for f in input_folder.files
+        ]
+
+    def test_memory_map(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=1,
+            original_filename=True,
+            move=True,
+            memory_map=True,
+        )
+
+        with patch("dicomsorter.dicom_utils.MMAP_THRESHOLD", 0):
+            DICOMSorter(config).start()
+
+        assert sorted(f.name for f in output_folder.rglob("*") if f.is_file()) == [
+            f.name for f in input_folder.files
+        ]
+
+
+class TestDICOMSorterIndex:
+    """Test skipping of previously sorted files."""
+
+    def test_rerun_skips_unchanged_files(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=1,
+            original_filename=True,
+            index=True,
+        )
+
+        DICOMSorter(config).start()
+        assert output_folder.joinpath(INDEX_FILENAME).exists()
+
+        with patch("dicomsorter.dicomsorter.DICOM", wraps=DICOM) as mock_dicom:
+            DICOMSorter(config).start()
+
+        mock_dicom.assert_not_called()
+
+        # Modified files are sorted again
+        modified = input_folder.files[0]
+        modified.write_bytes(modified.read_bytes() + b"\x00\x00")
+
+        with patch("dicomsorter.dicomsorter.DICOM", wraps=DICOM) as mock_dicom:
+            DICOMSorter(config).start()
+
+        mock_dicom.assert_called_once()
+        assert mock_dicom.call_args[0][0] == modified
+
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    def test_missing_files(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        concurrency: int,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        input_folder.path.joinpath("dangling.dcm").symlink_to(
+            input_folder.path.joinpath("missing.dcm")
+        )
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=concurrency,
+            original_filename=True,
+            index=True,
+            single_open=True,
+        )
+
+        DICOMSorter(config).start()
+
+        sorted_files = sorted(
+            f.name for f in output_folder.rglob("Image*") if f.is_file()
+        )
+        assert sorted_files == sorted(f.name for f in input_folder.files)
+
+    def test_moved_files_are_recorded(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=2,
+            executor="process",
+            original_filename=True,
+            index=True,
+            move=True,
+        )
+
+        DICOMSorter(config).start()
+
+        connection = sqlite3.connect(str(output_folder.joinpath(INDEX_FILENAME)))
+        paths = [row[0] for row in connection.execute("SELECT path FROM files")]
+        connection.close()
+
+        assert sorted(paths) == sorted(str(f) for f in input_folder.files)
+
+    def test_rerun_with_different_layout(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=1,
+            original_filename=True,
+            index=True,
+        )
+
+        DICOMSorter(config).start()
+
+        config.original_filename = False
+
+        with patch("dicomsorter.dicomsorter.DICOM", wraps=DICOM) as mock_dicom:
+            DICOMSorter(config).start()
+
+        assert mock_dicom.call_count == 2
+
+    def test_index_closed_on_error(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path_factory.mktemp("output"),
+            concurrency=1,
+            original_filename=True,
+            index=True,
+        )
+        sorter = DICOMSorter(config)
+
+        with patch.object(sorter, "dispatch", side_effect=RuntimeError), patch(
+            "dicomsorter.dicomsorter.ScanIndex"
+        ) as index:
+            with pytest.raises(RuntimeError):
+                sorter.start()
+
+        index.return_value.close.assert_called_once()
+
+
+class TestDICOMSorterStream:
+    """Test sorting while files are being discovered."""
+
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    def test_stream(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        concurrency: int,
+    ) -> None:
+        input_folder = dicom_folder(5, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=concurrency,
+            original_filename=True,
+            stream=True,
+            queue_size=2,
+        )
+
+        DICOMSorter(config).start()
+
+        sorted_files = sorted(f.name for f in output_folder.rglob("*") if f.is_file())
+        assert sorted_files == sorted(f.name for f in input_folder.files)
+
+    def test_stream_sorts_before_discovery_completes(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=tmp_path.joinpath("output"),
+            concurrency=1,
+            stream=True,
+        )
+        sorter = DICOMSorter(config)
+        events: List[Tuple[str, pathlib.Path]] = []
+
+        def discover() -> Generator[pathlib.Path, None, None]:
+            for filename in input_folder.files:
+                events.append(("found", filename))
+                yield filename
+
+        def sort(filename: pathlib.Path) -> None:
+            events.append(("sorted", filename))
+
+        with patch.object(sorter, "discover", side_effect=discover), patch.object(
+            sorter, "sort", side_effect=sort
+        ):
+            sorter.start()
+
+        expected = []
+        for filename in input_folder.files:
+            expected.extend([("found", filename), ("sorted", filename)])
+
+        assert events == expected
+
+
+class TestDICOMSorterCollisions:
+    """Test handling of files which result in the same destination."""
+
+    def test_directory_created_once(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=1,
+            original_filename=True,
+            path=[],
+        )
+
+        with patch("dicomsorter.utils.mkdir_p") as mock_mkdir_p:
+            DICOMSorter(config).start()
+
+        mock_mkdir_p.assert_called_once_with(output_folder)
+        assert len(list(output_folder.iterdir())) == 4
+
+    @pytest.mark.parametrize("concurrency", [1, 3])
+    def test_all_files_preserved(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        concurrency: int,
+    ) -> None:
+        input_folder = dicom_folder(6, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=concurrency,
+            path=[],
+            filename_format="image.dcm",
+        )
+
+        DICOMSorter(config).start()
+
+        sorted_files = sorted(f.name for f in output_folder.iterdir())
+        expected = ["image.dcm"] + ["image (%d).dcm" % k for k in range(2, 7)]
+
+        assert sorted_files == sorted(expected)
+
+
+class TestDICOMSorterPlan:
+    """Test planning a sort and executing it separately."""
+
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    def test_plan_and_execute(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        concurrency: int,
+    ) -> None:
+        input_folder = dicom_folder(4, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            concurrency=concurrency,
+            path=["StudyDate"],
+            filename_format="image.dcm",
+        )
+        sorter = DICOMSorter(config)
+
+        plan = sorter.plan()
+
+        # Nothing is written while planning
+        assert list(output_folder.iterdir()) == []
+        assert sorted(op.source for op in plan.operations) == sorted(input_folder.files)
+        assert len({op.destination for op in plan.operations}) == 4
+
+        sorter.execute(plan)
+
+        assert all(op.destination.exists() for op in plan.operations)
+        assert all(op.source.exists() for op in plan.operations)
+
+    @pytest.mark.parametrize("overwrite", [False, True])
+    def test_existing_destinations(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        overwrite: bool,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder.path,
+            output_directory=output_folder,
+            path=["StudyDate"],
+            filename_format="image.dcm",
+            overwrite=overwrite,
+        )
+        sorter = DICOMSorter(config)
+
+        plan = sorter.plan()
+
+        # Destinations created after planning (e.g. by a previous run)
+        for op in plan.operations:
+            op.destination.parent.mkdir(parents=True, exist_ok=True)
+            op.destination.write_bytes(b"existing")
+
+        sorter.execute(plan)
+
+        for op in plan.operations:
+            if overwrite:
+                assert op.destination.read_bytes() == op.source.read_bytes()
+            else:
+                assert op.destination.read_bytes() == b"existing"
+
+
+class TestDICOMSorterDedupe:
+    """Test skipping duplicate instances."""
+
+    @pytest.fixture
+    def duplicates(self, tmp_path: pathlib.Path) -> pathlib.Path:
+        """Two copies of one instance, plus a different instance with the same name."""
+        input_folder = tmp_path.joinpath("input")
+        input_folder.mkdir()
+
+        dicom = DicomFactory.build_with_defaults(SOPInstanceUID="1.2.3")
+
+        for name in ("a", "b"):
+            dicom.save_as(input_folder.joinpath(name), write_like_original=False)
+
+        other = DicomFactory.build_with_defaults(SOPInstanceUID="1.2.4")
+        other.save_as(input_folder.joinpath("c"), write_like_original=False)
+
+        return input_folder
+
+    @pytest.mark.parametrize("dedupe", ["uid", "content"])
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    def test_duplicates_skipped(
+        self,
+        duplicates: pathlib.Path,
+        tmp_path_factory: pytest.TempPathFactory,
+        dedupe: str,
+        concurrency: int,
+    ) -> None:
+        output_folder = tmp_path_factory.mktemp("output")
+
+        # The duplicate is sorted between the two different instances
+        file_list = tmp_path_factory.mktemp("list").joinpath("files.txt")
+        file_list.write_text("a\nb\nc\n")
+
+        config = Config(
+            input_directory=duplicates,
+            output_directory=output_folder,
+            filename_format="image.dcm",
+            path=[],
+            concurrency=concurrency,
+            dedupe=dedupe,
+            file_list=file_list,
+        )
+
+        DICOMSorter(config).start()
+
+        # The name claimed for the duplicate is reused, leaving no gap
+        assert sorted(f.name for f in output_folder.glob("*.dcm")) == [
+            "image (2).dcm",
+            "image.dcm",
+        ]
+        assert (
+            output_folder.joinpath("image.dcm").read_bytes()
+            == duplicates.joinpath("a").read_bytes()
+        )
+
+    def test_without_dedupe(
+        self, duplicates: pathlib.Path, tmp_path_factory: pytest.TempPathFactory
+    ) -> None:
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=duplicates,
+            output_directory=output_folder,
+            filename_format="image.dcm",
+            path=[],
+            concurrency=1,
+        )
+
+        DICOMSorter(config).start()
+
+        assert len(list(output_folder.glob("*.dcm"))) == 3
+
+    def test_duplicates_of_previous_run_skipped(
+        self, duplicates: pathlib.Path, tmp_path_factory: pytest.TempPathFactory
+    ) -> None:
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=duplicates,
+            output_directory=output_folder,
+            original_filename=True,
+            path=[],
+            concurrency=1,
+            dedupe="uid",
+        )
+
+        DICOMSorter(config).start()
+        DICOMSorter(config).start()
+
+        assert len([f for f in output_folder.iterdir() if f.is_file()]) == 2
+
+    def test_header_only_reads_uid(self, tmp_path: pathlib.Path) -> None:
+        config = Config(
+            input_directory=tmp_path,
+            output_directory=tmp_path,
+            path=["PatientName"],
+            dedupe="uid",
+        )
+
+        sorter = DICOMSorter(config)
+
+        assert sorter.tags is not None
+        assert "SOPInstanceUID" in sorter.tags
+
+
+class TestDICOMSorterJournal:
+    """Test resuming interrupted runs."""
+
+    def config(
+        self, input_folder: pathlib.Path, output_folder: pathlib.Path, **kwargs: Any
+    ) -> Config:
+        return Config(
+            input_directory=input_folder,
+            output_directory=output_folder,
+            original_filename=True,
+            path=[],
+            concurrency=1,
+            **kwargs,
+        )
+
+    def test_journal_records_operations(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output_folder = tmp_path_factory.mktemp("output")
+
+        DICOMSorter(self.config(input_folder.path, output_folder, journal=True)).start()
+
+        journal = Journal(output_folder.joinpath(JOURNAL_FILENAME), "")
+        state = journal.load()
+
+        assert sorted(state.completed) == sorted(input_folder.files)
+        assert state.incomplete == {}
+
+    def test_no_journal_by_default(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(1, False)
+        output_folder = tmp_path_factory.mktemp("output")
+
+        DICOMSorter(self.config(input_folder.path, output_folder)).start()
+
+        assert not output_folder.joinpath(JOURNAL_FILENAME).exists()
+
+    def test_resume_skips_completed(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        done, interrupted, remaining = input_folder.files
+
+        # Simulate a run which copied one file and was interrupted copying another
+        journal = Journal(output_folder.joinpath(JOURNAL_FILENAME), "previous")
+        journal.begin(done, output_folder.joinpath(done.name))
+        shutil.copy(done, output_folder.joinpath(done.name))
+        journal.done(done, output_folder.joinpath(done.name))
+        journal.begin(interrupted, output_folder.joinpath(interrupted.name))
+        output_folder.joinpath(interrupted.name).write_bytes(b"partial")
+        journal.close()
+
+        sorter = DICOMSorter(self.config(input_folder.path, output_folder, resume=True))
+
+        with patch.object(sorter, "resolve", wraps=sorter.resolve) as resolve:
+            sorter.start()
+
+        assert sorted(call.args[0] for call in resolve.call_args_list) == sorted(
+            [interrupted, remaining]
+        )
+
+        # The partial copy was replaced rather than being kept alongside
+        assert sorted(f.name for f in output_folder.glob("Image*")) == sorted(
+            f.name for f in input_folder.files
+        )
+        assert output_folder.joinpath(interrupted.name).read_bytes() == (
+            interrupted.read_bytes()
+        )
+
+    def test_resume_completed_move(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        moved = input_folder.files[0]
+        destination = output_folder.joinpath(moved.name)
+
+        # The move finished, but was not recorded as done
+        journal = Journal(output_folder.joinpath(JOURNAL_FILENAME), "previous")
+        journal.begin(moved, destination)
+        shutil.move(str(moved), destination)
+        journal.close()
+
+        config = self.config(input_folder.path, output_folder, resume=True, move=True)
+        DICOMSorter(config).start()
+
+        assert sorted(f.name for f in output_folder.glob("Image*")) == sorted(
+            f.name for f in input_folder.files
+        )
+        assert Journal(journal.filename, "").load().incomplete == {}
+
+    def test_resume_failed_transfer(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        failed = input_folder.files[0]
+        config = self.config(input_folder.path, output_folder, journal=True)
+
+        transfer = DICOMSorter.transfer
+
+        def failing(sorter: DICOMSorter, source: pathlib.Path, *args: Any) -> None:
+            if source == failed:
+                raise OSError("Interrupted")
+
+            transfer(sorter, source, *args)
+
+        with patch.object(DICOMSorter, "transfer", failing):
+            DICOMSorter(config).start()
+
+        # The claimed placeholder was journalled before it was transferred
+        placeholder = output_folder.joinpath(failed.name)
+        state = Journal(output_folder.joinpath(JOURNAL_FILENAME), "").load()
+
+        assert state.incomplete == {failed: placeholder}
+        assert placeholder.read_bytes() == b""
+
+        config = self.config(input_folder.path, output_folder, resume=True)
+        DICOMSorter(config).start()
+
+        # The placeholder was replaced rather than being kept alongside
+        assert sorted(f.name for f in output_folder.glob("Image*")) == sorted(
+            f.name for f in input_folder.files
+        )
+        assert placeholder.read_bytes() == failed.read_bytes()
+
+    def test_resume_watch(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(3, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        done = input_folder.files[0]
+
+        journal = Journal(output_folder.joinpath(JOURNAL_FILENAME), "previous")
+        journal.begin(done, output_folder.joinpath(done.name))
+        shutil.copy(done, output_folder.joinpath(done.name))
+        journal.done(done, output_folder.joinpath(done.name))
+        journal.close()
+
+        config = self.config(input_folder.path, output_folder, resume=True, settle=0)
+        sorter = DICOMSorter(config)
+
+        with patch.object(sorter, "resolve", wraps=sorter.resolve) as resolve:
+            run_sorter(sorter, "watch", 4)
+
+        assert done not in [call.args[0] for call in resolve.call_args_list]
+        assert sorted(f.name for f in output_folder.glob("Image*")) == sorted(
+            f.name for f in input_folder.files
+        )
+
+    def test_journal_closed_on_error(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(1, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        sorter = DICOMSorter(
+            self.config(input_folder.path, output_folder, journal=True)
+        )
+
+        with patch.object(sorter, "dispatch", side_effect=RuntimeError), patch.object(
+            Journal, "close"
+        ) as close:
+            with pytest.raises(RuntimeError):
+                sorter.start()
+
+        close.assert_called_once_with()
+
+    def test_resume_plan(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        input_folder = dicom_folder(2, False)
+        output_folder = tmp_path_factory.mktemp("output")
+        config = self.config(input_folder.path, output_folder, resume=True)
+
+        sorter = DICOMSorter(config)
+        plan = sorter.plan()
+        sorter.execute(plan)
+
+        sorter = DICOMSorter(config)
+
+        with patch.object(sorter, "transfer") as transfer:
+            sorter.execute(plan)
+
+        transfer.assert_not_called()
@@ -0,0 +1,120 @@
+"""Unit tests for index module."""
+import json
+import os
+import pathlib
+import sqlite3
+
+from dicomsorter.index import ScanIndex
+
+
+class TestScanIndex:
+    def test_new_file_is_not_sorted(self, tmp_path: pathlib.Path) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+
+        index = ScanIndex(tmp_path.joinpath("index.sqlite"))
+
+        assert index.is_sorted(source, source.stat()) is False
+        assert list(index.changed([source])) == [source]
+
+    def test_missing_files_are_skipped(self, tmp_path: pathlib.Path) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+        dangling = tmp_path.joinpath("dangling")
+        dangling.symlink_to(tmp_path.joinpath("missing"))
+
+        index = ScanIndex(tmp_path.joinpath("index.sqlite"))
+        paths = [tmp_path.joinpath("removed"), dangling, source]
+
+        assert list(index.changed(paths)) == [source]
+
+    def test_recorded_file_is_sorted(self, tmp_path: pathlib.Path) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+        destination = tmp_path.joinpath("destination")
+        destination.write_bytes(b"data")
+
+        index = ScanIndex(tmp_path.joinpath("index.sqlite"))
+        list(index.changed([source]))
+        index.record(source, destination, {"PatientID": "1234"})
+
+        assert index.is_sorted(source, source.stat()) is True
+        assert list(index.changed([source])) == []
+
+    def test_modified_file_is_not_sorted(self, tmp_path: pathlib.Path) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+        destination = tmp_path.joinpath("destination")
+        destination.write_bytes(b"data")
+
+        index = ScanIndex(tmp_path.joinpath("index.sqlite"))
+        index.record(source, destination, {})
+
+        source.write_bytes(b"modified data")
+
+        assert list(index.changed([source])) == [source]
+
+    def test_missing_destination_is_not_sorted(self, tmp_path: pathlib.Path) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+
+        index = ScanIndex(tmp_path.joinpath("index.sqlite"))
+        index.record(source, tmp_path.joinpath("destination"), {})
+
+        assert list(index.changed([source])) == [source]
+
+    def test_persisted_after_close(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("index.sqlite")
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+        destination = tmp_path.joinpath("destination")
+        destination.write_bytes(b"data")
+
+        index = ScanIndex(filename)
+        index.record(source, destination, {"PatientID": "1234"})
+        index.close()
+
+        connection = sqlite3.connect(filename)
+        row = connection.execute(
+            "SELECT fields, destination, mtime FROM files"
+        ).fetchone()
+
+        assert json.loads(row[0]) == {"PatientID": "1234"}
+        assert row[1] == str(destination)
+        assert row[2] == os.stat(source).st_mtime_ns
+        assert list(ScanIndex(filename).changed([source])) == []
+
+    def test_different_layout_is_not_sorted(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("index.sqlite")
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+        destination = tmp_path.joinpath("destination")
+        destination.write_bytes(b"data")
+
+        index = ScanIndex(filename, layout="a")
+        index.record(source, destination, {})
+        index.close()
+
+        assert list(ScanIndex(filename, layout="a").changed([source])) == []
+        assert list(ScanIndex(filename, layout="b").changed([source])) == [source]
+
+    def test_upgrades_existing_index(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("index.sqlite")
+        connection = sqlite3.connect(filename)
+        connection.execute(
+            "CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "mtime INTEGER NOT NULL, inode INTEGER NOT NULL, fields TEXT NOT NULL, "
+            "destination TEXT NOT NULL)"
+        )
+        connection.commit()
+        connection.close()
+
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+        destination = tmp_path.joinpath("destination")
+        destination.write_bytes(b"data")
+
+        index = ScanIndex(filename, layout="a")
+        index.record(source, destination, {})
+
+        assert list(index.changed([source])) == []
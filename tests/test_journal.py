@@ -0,0 +1,80 @@
+"""Unit tests for journal module."""
+import pathlib
+
+from dicomsorter.journal import Journal, repair
+
+
+class TestJournal:
+    def test_load_missing(self, tmp_path: pathlib.Path) -> None:
+        state = Journal(tmp_path.joinpath("journal"), "run").load()
+
+        assert state.completed == {}
+        assert state.incomplete == {}
+
+    def test_round_trip(self, tmp_path: pathlib.Path) -> None:
+        journal = Journal(tmp_path.joinpath("journal"), "run")
+        a, b, c = (tmp_path.joinpath(name) for name in "abc")
+
+        journal.begin(a, b)
+        journal.done(a, b)
+        journal.begin(b, c)
+        journal.close()
+
+        state = journal.load()
+
+        assert state.completed == {a: b}
+        assert state.incomplete == {b: c}
+
+    def test_partial_line_ignored(self, tmp_path: pathlib.Path) -> None:
+        journal = Journal(tmp_path.joinpath("journal"), "run")
+        journal.begin(tmp_path.joinpath("a"), tmp_path.joinpath("b"))
+        journal.close()
+
+        with open(journal.filename, "a") as fid:
+            fid.write('{"status": "do')
+
+        assert len(journal.load().incomplete) == 1
+
+    def test_reset(self, tmp_path: pathlib.Path) -> None:
+        journal = Journal(tmp_path.joinpath("journal"), "run")
+        journal.begin(tmp_path.joinpath("a"), tmp_path.joinpath("b"))
+        journal.reset()
+        journal.done(tmp_path.joinpath("c"), tmp_path.joinpath("d"))
+        journal.close()
+
+        state = journal.load()
+
+        assert list(state.completed) == [tmp_path.joinpath("c")]
+        assert state.incomplete == {}
+
+    def test_later_run_appends(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("journal")
+        a, b = tmp_path.joinpath("a"), tmp_path.joinpath("b")
+
+        Journal(filename, "first").begin(a, b)
+        Journal(filename, "second").done(a, b)
+
+        assert Journal(filename, "third").load().completed == {a: b}
+
+
+class TestRepair:
+    def test_partial_copy_removed(self, tmp_path: pathlib.Path) -> None:
+        source, destination = tmp_path.joinpath("source"), tmp_path.joinpath("dest")
+        source.write_bytes(b"data")
+        destination.write_bytes(b"da")
+
+        assert not repair(source, destination)
+        assert not destination.exists()
+
+    def test_not_started(self, tmp_path: pathlib.Path) -> None:
+        source = tmp_path.joinpath("source")
+        source.write_bytes(b"data")
+
+        assert not repair(source, tmp_path.joinpath("dest"))
+
+    def test_completed_move(self, tmp_path: pathlib.Path) -> None:
+        destination = tmp_path.joinpath("dest")
+        destination.write_bytes(b"data")
+
+        assert repair(tmp_path.joinpath("source"), destination)
+        assert destination.exists()
@@ -0,0 +1,73 @@
+"""Unit tests for plan module."""
+import pathlib
+
+from dicomsorter.plan import Operation, SortPlan, build_plan
+
+
+class TestBuildPlan:
+    def test_unique_destinations(self, tmp_path: pathlib.Path) -> None:
+        operations = [
+            (pathlib.Path("a"), tmp_path.joinpath("x", "a.dcm")),
+            (pathlib.Path("b"), tmp_path.joinpath("y", "b.dcm")),
+        ]
+
+        plan = build_plan(operations)
+
+        assert plan.operations == [Operation(*op) for op in operations]
+        assert plan.directories == [tmp_path.joinpath("x"), tmp_path.joinpath("y")]
+        assert plan.duplicates == {}
+
+    def test_collisions_between_sources(self, tmp_path: pathlib.Path) -> None:
+        destination = tmp_path.joinpath("image.dcm")
+        sources = [pathlib.Path("a"), pathlib.Path("b"), pathlib.Path("c")]
+
+        plan = build_plan((source, destination) for source in sources)
+
+        assert [op.destination for op in plan.operations] == [
+            destination,
+            tmp_path.joinpath("image (2).dcm"),
+            tmp_path.joinpath("image (3).dcm"),
+        ]
+        assert plan.directories == [tmp_path]
+        assert plan.duplicates == {destination: sources}
+
+    def test_collisions_with_existing_files(self, tmp_path: pathlib.Path) -> None:
+        destination = tmp_path.joinpath("image.dcm")
+        destination.touch()
+
+        plan = build_plan([(pathlib.Path("a"), destination)])
+
+        assert plan.operations[0].destination == tmp_path.joinpath("image (2).dcm")
+        assert plan.duplicates == {}
+
+    def test_overwrite(self, tmp_path: pathlib.Path) -> None:
+        destination = tmp_path.joinpath("image.dcm")
+        destination.touch()
+
+        plan = build_plan(
+            [(pathlib.Path("a"), destination), (pathlib.Path("b"), destination)],
+            overwrite=True,
+        )
+
+        assert [op.destination for op in plan.operations] == [destination] * 2
+
+    def test_repeated_source(self, tmp_path: pathlib.Path) -> None:
+        source = pathlib.Path("a")
+        destination = tmp_path.joinpath("image.dcm")
+
+        plan = build_plan([(source, destination), (source, destination)])
+
+        assert plan.operations == [Operation(source, destination)]
+
+
+class TestSortPlan:
+    def test_save_and_load(self, tmp_path: pathlib.Path) -> None:
+        destination = tmp_path.joinpath("image.dcm")
+        plan = build_plan(
+            [(pathlib.Path("a"), destination), (pathlib.Path("b"), destination)]
+        )
+
+        filename = tmp_path.joinpath("plan.json")
+        plan.save(filename)
+
+        assert SortPlan.load(filename) == plan
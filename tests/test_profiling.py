@@ -0,0 +1,137 @@
+import pathlib
+import pstats
+import sys
+import time
+
+import pytest
+
+from dicomsorter.profiling import (
+    Profiler,
+    fold,
+    get_profiler,
+    load_samples,
+    prepare,
+    save_samples,
+    stage_of,
+    summarize,
+)
+
+
+def busy(duration: float) -> None:
+    end = time.perf_counter() + duration
+
+    while time.perf_counter() < end:
+        pass
+
+
+class TestStacks:
+    def test_fold(self) -> None:
+        stack = fold(sys._getframe())
+
+        assert stack.endswith("test_profiling:test_fold")
+        assert stack.count(";") > 0
+
+    @pytest.mark.parametrize(
+        "stack,stage",
+        [
+            ("a:main;dicomsorter.dicomsorter:load;pydicom.filereader:read", "parse"),
+            (
+                "dicomsorter.dicomsorter:transfer;dicomsorter.utils:ensure_directory",
+                "mkdir",
+            ),
+            ("a:main;shutil:transfer", "other"),
+            ("", "other"),
+        ],
+    )
+    def test_stage_of(self, stack: str, stage: str) -> None:
+        assert stage_of(stack) == stage
+
+    def test_samples_round_trip(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("test.samples")
+        save_samples(filename, [("a:main;b:c d", 3), ("a:main", 1)])
+
+        assert load_samples(filename) == {"a:main;b:c d": 3, "a:main": 1}
+
+
+class TestProfiler:
+    def test_cprofile(self, tmp_path: pathlib.Path) -> None:
+        profiler = Profiler(tmp_path, "worker", "cprofile")
+
+        with profiler.profile():
+            # Nested blocks use the outermost profile
+            with profiler.profile():
+                busy(0.01)
+
+        profiler.save()
+        (filename,) = tmp_path.glob("worker-*.pstats")
+        functions = {f[2] for f in pstats.Stats(str(filename)).stats}  # type: ignore
+
+        assert "busy" in functions
+
+    def test_sample(self, tmp_path: pathlib.Path) -> None:
+        profiler = Profiler(tmp_path, "worker", "sample")
+
+        with profiler.profile():
+            busy(0.2)
+
+        profiler.close()
+        profiler.save()
+        (filename,) = tmp_path.glob("worker-*.samples")
+        samples = load_samples(filename)
+
+        assert any(stack.endswith("test_profiling:busy") for stack in samples)
+
+    def test_profiled(self, tmp_path: pathlib.Path) -> None:
+        profiler = Profiler(tmp_path, "main", "cprofile")
+
+        def generate() -> pathlib.Path:
+            busy(0.01)
+            return tmp_path
+
+        assert list(profiler.profiled(generate() for _ in range(2))) == [tmp_path] * 2
+
+        profiler.save()
+        assert len(list(tmp_path.glob("main-*.pstats"))) == 1
+
+    def test_get_profiler(self, tmp_path: pathlib.Path) -> None:
+        first = get_profiler(tmp_path, "worker", "cprofile", "a")
+
+        assert get_profiler(tmp_path, "worker", "cprofile", "a") is first
+        assert get_profiler(tmp_path, "worker", "cprofile", "b") is not first
+
+
+class TestSummary:
+    def test_summarize(self, tmp_path: pathlib.Path) -> None:
+        for name, mode in [("main", "cprofile"), ("worker", "sample")]:
+            profiler = Profiler(tmp_path, name, mode)
+
+            with profiler.profile():
+                busy(0.05)
+
+            profiler.close()
+            profiler.save()
+
+        summary = summarize(tmp_path).read_text()
+
+        assert "Merged profiles of 1 threads" in summary
+        assert "samples by stage" in summary
+        assert tmp_path.joinpath("summary.pstats").exists()
+        assert tmp_path.joinpath("summary.samples").exists()
+
+    def test_prepare(self, tmp_path: pathlib.Path) -> None:
+        directory = tmp_path.joinpath("profile")
+        prepare(directory)
+
+        for name in ["main-1.samples", "worker-2-3.pstats", "summary.txt"]:
+            directory.joinpath(name).touch()
+
+        # Files which weren't written by a previous run are kept
+        for name in ["other.pstats", "other.txt"]:
+            directory.joinpath(name).touch()
+
+        prepare(directory)
+
+        assert sorted(f.name for f in directory.iterdir()) == [
+            "other.pstats",
+            "other.txt",
+        ]
@@ -0,0 +1,77 @@
+import pathlib
+from typing import List
+
+from dicomsorter.scheduling import BatchScheduler, run_batch
+
+
+def paths(directory: str, count: int) -> List[pathlib.Path]:
+    return [pathlib.Path(directory, "%d.dcm" % i) for i in range(count)]
+
+
+class TestRunBatch:
+    def test_results_in_order(self) -> None:
+        batch = run_batch(lambda x: x * 2, [1, 2, 3])
+
+        assert batch.results == [2, 4, 6]
+        assert batch.elapsed >= 0
+
+    def test_empty(self) -> None:
+        assert run_batch(str, []).results == []
+
+
+class TestBatchScheduler:
+    def test_fixed_size(self) -> None:
+        scheduler = BatchScheduler(size=2)
+        batches = list(scheduler.batches(paths("a", 5)))
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+
+    def test_all_files_included_once(self) -> None:
+        files = paths("a", 10) + paths("b", 7) + paths("c", 1)
+        scheduler = BatchScheduler(size=4)
+        batches = list(scheduler.batches(files))
+
+        assert sorted(f for batch in batches for f in batch) == sorted(files)
+        assert all(len(batch) <= 4 for batch in batches)
+
+    def test_grouped_by_directory(self) -> None:
+        # Interleave the files from two directories
+        files = [f for pair in zip(paths("a", 4), paths("b", 4)) for f in pair]
+        scheduler = BatchScheduler(size=4)
+        batches = list(scheduler.batches(files))
+
+        assert len(batches) == 2
+        assert all(len({f.parent for f in batch}) == 1 for batch in batches)
+
+    def test_max_pending(self) -> None:
+        # Every file is in a different directory so no group ever fills up
+        files = [pathlib.Path(str(i), "file.dcm") for i in range(10)]
+        scheduler = BatchScheduler(size=8, max_pending=3)
+
+        for batch in scheduler.batches(files):
+            assert len(batch) == 1
+            break
+
+    def test_adaptive_size_grows_for_fast_files(self) -> None:
+        scheduler = BatchScheduler(target_duration=1.0, initial_size=8)
+        scheduler.record(8, 0.08)
+
+        assert scheduler.size == 100
+
+    def test_adaptive_size_shrinks_for_slow_files(self) -> None:
+        scheduler = BatchScheduler(target_duration=1.0, initial_size=8)
+        scheduler.record(8, 16.0)
+
+        assert scheduler.size == 1
+
+    def test_adaptive_size_is_limited(self) -> None:
+        scheduler = BatchScheduler(target_duration=1.0, max_size=64)
+        scheduler.record(8, 0.0)
+
+        assert scheduler.size == 64
+
+    def test_fixed_size_ignores_timings(self) -> None:
+        scheduler = BatchScheduler(size=5)
+        scheduler.record(5, 100.0)
+
+        assert scheduler.size == 5
@@ -0,0 +1,220 @@
+"""Unit tests for sharding module."""
+import argparse
+import pathlib
+import subprocess
+import sys
+from typing import List
+
+import pytest
+
+from dicomsorter.config import Config
+from dicomsorter.dicom_utils import dicom_list
+from dicomsorter.dicomsorter import DICOMSorter
+from dicomsorter.index import INDEX_FILENAME
+from dicomsorter.journal import JOURNAL_FILENAME
+from dicomsorter.sharding import (
+    ShardFilter,
+    parse_shard,
+    read_file_list,
+    shard_filename,
+    shard_of,
+)
+
+from .factories import DicomFactory
+
+
+def make_tree(root: pathlib.Path, directories: int, files: int) -> List[pathlib.Path]:
+    paths = []
+
+    for d in range(directories):
+        directory = root.joinpath("series%02d" % d)
+        directory.mkdir(parents=True)
+
+        for f in range(files):
+            filename = directory.joinpath("image%02d.dcm" % f)
+            dicom = DicomFactory.build_with_defaults()
+            dicom.save_as(filename, write_like_original=False)
+            paths.append(filename)
+
+    return paths
+
+
+class TestParseShard:
+    def test_valid(self) -> None:
+        assert parse_shard("0/4") == (0, 4)
+        assert parse_shard("3/4") == (3, 4)
+
+    @pytest.mark.parametrize("value", ["4/4", "-1/4", "0/0", "1", "a/b", "1/2/3"])
+    def test_invalid(self, value: str) -> None:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+
+
+class TestShardOf:
+    def test_independent_of_root(self) -> None:
+        first = shard_of(pathlib.Path("/mnt/a/series/1.dcm"), pathlib.Path("/mnt/a"), 8)
+        second = shard_of(pathlib.Path("/data/series/1.dcm"), pathlib.Path("/data"), 8)
+
+        assert first == second
+
+    def test_same_directory_same_shard(self) -> None:
+        root = pathlib.Path("/data")
+        shards = {shard_of(root.joinpath("series", str(i)), root, 8) for i in range(20)}
+
+        assert len(shards) == 1
+
+    def test_every_file_in_one_shard(self) -> None:
+        root = pathlib.Path("/data")
+        files = [root.joinpath("series%d" % i, "image") for i in range(100)]
+        filters = [ShardFilter(root, index, 4) for index in range(4)]
+
+        for f in files:
+            assert sum(select(f) for select in filters) == 1
+
+        # Directories are spread across all of the shards
+        assert all(any(select(f) for f in files) for select in filters)
+
+
+class TestShardFilename:
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            (".dicomsorter-journal", ".dicomsorter-journal-1-of-4"),
+            (".dicomsorter.sqlite", ".dicomsorter-1-of-4.sqlite"),
+        ],
+    )
+    def test_shard(self, name: str, expected: str) -> None:
+        filename = pathlib.Path("output", name)
+
+        assert shard_filename(filename, (1, 4)) == pathlib.Path("output", expected)
+
+    def test_no_shard(self) -> None:
+        filename = pathlib.Path("output", ".dicomsorter.sqlite")
+
+        assert shard_filename(filename, None) == filename
+
+
+class TestReadFileList:
+    def test_read(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("files.txt")
+        filename.write_text("a/1.dcm\n\n/abs/2.dcm\r\nname with spaces.dcm\n")
+
+        assert list(read_file_list(filename)) == [
+            pathlib.Path("a/1.dcm"),
+            pathlib.Path("/abs/2.dcm"),
+            pathlib.Path("name with spaces.dcm"),
+        ]
+
+
+class TestSelect:
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_dicom_list_select(self, tmp_path: pathlib.Path, workers: int) -> None:
+        files = make_tree(tmp_path, 2, 2)
+
+        found = list(
+            dicom_list(
+                tmp_path,
+                load=False,
+                workers=workers,
+                select=lambda path: path.parent.name == "series00",
+            )
+        )
+
+        assert sorted(found) == sorted(files[:2])
+
+    def test_empty_selection(self, tmp_path: pathlib.Path) -> None:
+        make_tree(tmp_path, 1, 1)
+
+        assert list(dicom_list(tmp_path, load=False, select=lambda path: False)) == []
+
+
+class TestDICOMSorterShard:
+    def test_file_list(
+        self, tmp_path: pathlib.Path, tmp_path_factory: pytest.TempPathFactory
+    ) -> None:
+        files = make_tree(tmp_path.joinpath("input"), 2, 2)
+        file_list = tmp_path.joinpath("files.txt")
+        file_list.write_text(
+            "\n".join(
+                [str(files[0]), str(files[1].relative_to(tmp_path.joinpath("input")))]
+            )
+        )
+
+        config = Config(
+            input_directory=tmp_path.joinpath("input"),
+            output_directory=tmp_path_factory.mktemp("output"),
+            file_list=file_list,
+        )
+
+        assert list(DICOMSorter(config).discover()) == files[:2]
+
+    def test_journal_and_index_per_shard(
+        self, tmp_path: pathlib.Path, tmp_path_factory: pytest.TempPathFactory
+    ) -> None:
+        make_tree(tmp_path, 4, 2)
+        output_folder = tmp_path_factory.mktemp("output")
+
+        for index in range(2):
+            config = Config(
+                input_directory=tmp_path,
+                output_directory=output_folder,
+                shard=(index, 2),
+                journal=True,
+                index=True,
+            )
+            DICOMSorter(config).start()
+
+        names = {f.name for f in output_folder.iterdir()}
+
+        for index in range(2):
+            suffix = "-%d-of-2" % index
+            assert JOURNAL_FILENAME + suffix in names
+            assert INDEX_FILENAME.replace(".sqlite", suffix + ".sqlite") in names
+
+        assert JOURNAL_FILENAME not in names
+        assert INDEX_FILENAME not in names
+
+    def test_shards_in_separate_processes(
+        self, tmp_path: pathlib.Path, tmp_path_factory: pytest.TempPathFactory
+    ) -> None:
+        """Simulate hosts sorting each shard into a shared output directory."""
+        files = make_tree(tmp_path, 6, 3)
+        output_folder = tmp_path_factory.mktemp("output")
+        count = 3
+
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "dicomsorter.cli",
+                    str(tmp_path),
+                    str(output_folder),
+                    "--shard",
+                    "%d/%d" % (index, count),
+                    # Every file collides with every other file
+                    "--path",
+                    "Modality",
+                    "--filename-format",
+                    "image.dcm",
+                    "--concurrency",
+                    "2",
+                    "--executor",
+                    "thread",
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+            for index in range(count)
+        ]
+
+        for process in processes:
+            output, _ = process.communicate(timeout=60)
+            assert process.returncode == 0, output.decode()
+
+        sorted_files = [f for f in output_folder.rglob("*") if f.is_file()]
+
+        assert len(sorted_files) == len(files)
+        assert sorted(f.read_bytes() for f in sorted_files) == sorted(
+            f.read_bytes() for f in files
+        )
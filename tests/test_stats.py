@@ -0,0 +1,159 @@
+import json
+import pathlib
+import pickle
+import threading
+
+import pytest
+
+from dicomsorter.stats import (
+    Histogram,
+    Stats,
+    collect,
+    collecting,
+    current,
+    increment,
+    install,
+    timed,
+    timer,
+)
+
+
+@pytest.fixture(autouse=True)
+def uninstall() -> None:
+    install(None)
+
+
+class TestHistogram:
+    def test_record(self) -> None:
+        histogram = Histogram()
+
+        for seconds in [0.001, 0.002, 0.003]:
+            histogram.record(seconds)
+
+        assert histogram.count == 3
+        assert histogram.mean == pytest.approx(0.002)
+        assert histogram.minimum == 0.001
+        assert histogram.maximum == 0.003
+
+    def test_percentile(self) -> None:
+        histogram = Histogram()
+
+        for _ in range(99):
+            histogram.record(0.000_01)
+
+        histogram.record(1.0)
+
+        # Percentiles are reported as the upper bound of the bucket
+        assert histogram.percentile(50) == pytest.approx(16e-6)
+        assert histogram.percentile(99) == pytest.approx(16e-6)
+        assert histogram.percentile(100) == 1.0
+
+    def test_merge(self) -> None:
+        first, second = Histogram(), Histogram()
+        first.record(0.001)
+        second.record(0.1)
+        first.merge(second)
+
+        assert first.count == 2
+        assert first.minimum == 0.001
+        assert first.maximum == 0.1
+        assert sum(first.buckets.values()) == 2
+
+    def test_empty(self) -> None:
+        report = Histogram().to_dict()
+
+        assert report["count"] == 0
+        assert report["mean"] == 0.0
+        assert report["min"] == 0.0
+
+
+class TestStats:
+    def test_merge(self) -> None:
+        first, second = Stats(), Stats()
+        first.record("parse", 0.01)
+        first.increment("files")
+        second.record("parse", 0.02)
+        second.record("transfer", 0.03)
+        second.increment("files", 2)
+        first.merge(second)
+
+        assert first.stages["parse"].count == 2
+        assert first.stages["transfer"].count == 1
+        assert first.counters == {"files": 3}
+
+    def test_pickle(self) -> None:
+        stats = Stats()
+        stats.record("parse", 0.01)
+        copy = pickle.loads(pickle.dumps(stats))
+
+        assert copy.stages["parse"].count == 1
+
+        # The lock must have been recreated
+        copy.increment("files")
+        assert copy.counters == {"files": 1}
+
+    def test_save(self, tmp_path: pathlib.Path) -> None:
+        stats = Stats()
+        stats.record("transfer", 0.5)
+        stats.increment("files", 10)
+        stats.increment("bytes_transferred", 2048)
+        stats.save(tmp_path.joinpath("stats.json"), 2.0)
+
+        report = json.loads(tmp_path.joinpath("stats.json").read_text())
+
+        assert report["files_per_second"] == 5.0
+        assert report["bytes_per_second"] == 1024.0
+        assert report["stages"]["transfer"]["count"] == 1
+        assert set(report["stages"]["transfer"]) >= {"p50", "p90", "p99"}
+
+    def test_summary(self) -> None:
+        stats = Stats()
+        stats.record("parse", 0.002)
+
+        assert stats.summary(1.0) == "parse 2.0ms, 0.0MB/s"
+
+
+class TestCollection:
+    def test_noop_without_stats(self) -> None:
+        with timer("parse"):
+            pass
+
+        increment("files")
+
+        assert current() is None
+
+    def test_installed(self) -> None:
+        stats = Stats()
+        install(stats)
+
+        with timer("parse"):
+            pass
+
+        # Other threads record into the installed statistics
+        thread = threading.Thread(target=increment, args=("files",))
+        thread.start()
+        thread.join()
+
+        assert stats.stages["parse"].count == 1
+        assert stats.counters == {"files": 1}
+
+    def test_collecting(self) -> None:
+        stats = Stats()
+        install(stats)
+
+        with collecting() as batch:
+            with timer("parse"):
+                pass
+
+        assert batch.stages["parse"].count == 1
+        assert stats.stages == {}
+
+        collect(batch)
+        assert stats.stages["parse"].count == 1
+
+    def test_timed(self) -> None:
+        stats = Stats()
+        install(stats)
+
+        assert list(timed(range(3), "discovery")) == [0, 1, 2]
+        assert stats.stages["discovery"].count == 3
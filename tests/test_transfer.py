@@ -0,0 +1,155 @@
+"""Unit tests for transfer module."""
+import errno
+import os
+import pathlib
+from typing import Set
+from unittest.mock import patch
+
+import pytest
+
+from dicomsorter import transfer as transfer_module
+from dicomsorter.transfer import copy, copy_file_range, reflink, transfer
+
+
+@pytest.fixture
+def source(tmp_path: pathlib.Path) -> pathlib.Path:
+    filename = tmp_path.joinpath("source")
+    filename.write_bytes(b"DICM" * 1024)
+    return filename
+
+
+class TestCopy:
+    def test_copies_content(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+
+        copy(source, destination)
+
+        assert destination.read_bytes() == source.read_bytes()
+
+    def test_without_reflink_or_copy_file_range(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+        unsupported = OSError(errno.EOPNOTSUPP, "Not supported")
+
+        with patch.object(
+            transfer_module, "reflink", side_effect=unsupported
+        ), patch.object(transfer_module, "copy_file_range", side_effect=unsupported):
+            copy(source, destination)
+
+        assert destination.read_bytes() == source.read_bytes()
+
+    def test_overwrites_existing_file(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+        destination.write_bytes(b"existing content that is longer" * 1024)
+
+        copy(source, destination)
+
+        assert destination.read_bytes() == source.read_bytes()
+
+    @pytest.mark.parametrize(
+        "error, unsupported",
+        [(errno.EOPNOTSUPP, True), (errno.EXDEV, True), (errno.EACCES, False)],
+    )
+    def test_disables_reflink_when_unsupported(
+        self, source: pathlib.Path, error: int, unsupported: bool
+    ) -> None:
+        destination = source.with_name("destination")
+        device = os.stat(source).st_dev
+        disabled: Set[int] = set()
+
+        with patch.object(
+            transfer_module, "reflink", side_effect=OSError(error, "Failed")
+        ), patch.object(transfer_module, "_reflink_unsupported", disabled):
+            copy(source, destination)
+
+            assert (device in disabled) == unsupported
+
+        assert destination.read_bytes() == source.read_bytes()
+
+
+class TestReflink:
+    def test_failure_leaves_destination(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+        destination.write_bytes(b"existing")
+
+        with patch("fcntl.ioctl", side_effect=OSError(errno.EOPNOTSUPP, "Failed")):
+            with pytest.raises(OSError):
+                reflink(source, destination)
+
+        assert destination.read_bytes() == b"existing"
+
+        # No temporary files are left behind
+        assert len(list(source.parent.iterdir())) == 2
+
+
+class TestCopyFileRange:
+    @pytest.mark.skipif(
+        not hasattr(os, "copy_file_range"), reason="copy_file_range unavailable"
+    )
+    def test_copies_content(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+
+        copy_file_range(source, destination)
+
+        assert destination.read_bytes() == source.read_bytes()
+
+
+class TestTransfer:
+    def test_move(self, source: pathlib.Path) -> None:
+        content = source.read_bytes()
+        destination = source.with_name("destination")
+
+        transfer(source, destination, move=True)
+
+        assert not source.exists()
+        assert destination.read_bytes() == content
+
+    def test_hard_link(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+        destination.touch()
+
+        transfer(source, destination, link="hard")
+
+        assert os.path.samefile(source, destination)
+
+        # No temporary files are left behind
+        assert len(list(source.parent.iterdir())) == 2
+
+    def test_symbolic_link(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+
+        transfer(source, destination, link="sym")
+
+        assert destination.is_symlink()
+        assert os.readlink(destination) == str(source)
+
+    def test_reflink(self, source: pathlib.Path) -> None:
+        # Falls back to a regular copy on filesystems without reflink support
+        destination = source.with_name("destination")
+
+        transfer(source, destination, link="reflink")
+
+        assert not destination.is_symlink()
+        assert destination.read_bytes() == source.read_bytes()
+
+    def test_link_falls_back_to_copy(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+        cross_device = OSError(errno.EXDEV, "Invalid cross-device link")
+
+        with patch("os.link", side_effect=cross_device):
+            transfer(source, destination, link="hard")
+
+        assert not os.path.samefile(source, destination)
+        assert destination.read_bytes() == source.read_bytes()
+
+    def test_reflink_is_not_retried(self, source: pathlib.Path) -> None:
+        destination = source.with_name("destination")
+        unsupported = OSError(errno.EOPNOTSUPP, "Not supported")
+
+        with patch.object(
+            transfer_module, "reflink", side_effect=unsupported
+        ) as mock_reflink:
+            with patch.dict(transfer_module.LINK_FUNCTIONS, reflink=mock_reflink):
+                transfer(source, destination, link="reflink")
+
+        mock_reflink.assert_called_once()
+        assert destination.read_bytes() == source.read_bytes()
@@ -1,16 +1,28 @@
 """Unit tests for utils module."""
 
 import os
+import threading
 from pathlib import Path
+from typing import Generator, List, Optional
+from unittest.mock import patch
 
 import pytest
 
 from dicomsorter.utils import (
+    Template,
+    Throttle,
+    cache_scope,
+    claim_unique_filename,
     clean_directory_name,
+    compile_template,
+    counted,
+    ensure_directory,
     filename_generator,
     find_unique_filename,
     mkdir_p,
     recursive_string_interpolation,
+    release_unique_filename,
+    template_fields,
 )
 
 
@@ -49,6 +61,50 @@ class TestRecursiveMakeDirectory:
         assert nested.exists()
 
 
+class TestEnsureDirectory:
+    """Test cached directory creation"""
+
+    def test_creates_nested_directory(self, tmp_path: Path) -> None:
+        """Missing directories are created."""
+        nested = tmp_path.joinpath("folder1", "folder2")
+
+        ensure_directory(nested)
+
+        assert nested.is_dir()
+
+    def test_only_created_once(self, tmp_path: Path) -> None:
+        """The filesystem is only accessed the first time a directory is seen."""
+        directory = tmp_path.joinpath("folder")
+
+        with patch("dicomsorter.utils.mkdir_p", wraps=mkdir_p) as mock_mkdir_p:
+            ensure_directory(directory)
+            ensure_directory(directory)
+
+        mock_mkdir_p.assert_called_once_with(directory)
+
+
+class TestCacheScope:
+    """Test resetting per-process caches between runs"""
+
+    def test_new_scope_clears_caches(self, tmp_path: Path) -> None:
+        """Caches from a previous run are not used in a new one."""
+        directory = tmp_path.joinpath("folder")
+        filename = directory.joinpath("image.dcm")
+
+        cache_scope("first")
+        ensure_directory(directory)
+        claim_unique_filename(filename)
+
+        filename.unlink()
+        directory.rmdir()
+
+        cache_scope("second")
+        ensure_directory(directory)
+
+        assert directory.is_dir()
+        assert claim_unique_filename(filename) == filename
+
+
 class TestFindUniqueFilename:
     """Test unique filename generator"""
 
@@ -96,6 +152,76 @@ class TestFindUniqueFilename:
         assert expected.exists()
 
 
+class TestClaimUniqueFilename:
+    """Test lock-free claiming of unique filenames"""
+
+    def test_when_file_does_not_exist(self, tmp_path: Path) -> None:
+        """The original filename is claimed if it is unique."""
+        filename = tmp_path.joinpath("does_not_exist.output")
+
+        assert claim_unique_filename(filename) == filename
+        assert filename.exists()
+
+    def test_when_files_exist(self, tmp_path: Path) -> None:
+        """The first un-used suffix is claimed when files exist."""
+        filename = tmp_path.joinpath("exists.output")
+        filename.touch()
+        tmp_path.joinpath("exists (2).output").touch()
+
+        expected = tmp_path.joinpath("exists (3).output")
+
+        assert claim_unique_filename(filename) == expected
+        assert expected.exists()
+
+    def test_repeated_claims(self, tmp_path: Path) -> None:
+        """Each claim of the same filename returns a new file."""
+        filename = tmp_path.joinpath("repeated.output")
+        claims = [claim_unique_filename(filename) for _ in range(4)]
+
+        assert claims == [
+            filename,
+            tmp_path.joinpath("repeated (2).output"),
+            tmp_path.joinpath("repeated (3).output"),
+            tmp_path.joinpath("repeated (4).output"),
+        ]
+
+    def test_concurrent_claims(self, tmp_path: Path) -> None:
+        """Concurrent claims never return the same file."""
+        filename = tmp_path.joinpath("concurrent.output")
+        claims: List[Path] = []
+
+        def claim() -> None:
+            for _ in range(25):
+                claims.append(claim_unique_filename(filename))
+
+        threads = [threading.Thread(target=claim) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert len(set(claims)) == 100
+        assert len(list(tmp_path.iterdir())) == 100
+
+
+class TestReleaseUniqueFilename:
+    """Test giving up a claimed filename."""
+
+    def test_released_name_is_claimed_again(self, tmp_path: Path) -> None:
+        filename = tmp_path.joinpath("image.dcm")
+        cache_scope("release")
+
+        assert claim_unique_filename(filename) == filename
+        claimed = claim_unique_filename(filename)
+
+        release_unique_filename(filename, claimed)
+
+        assert not claimed.exists()
+        assert claim_unique_filename(filename) == claimed
+
+
 class TestFilenameGenerator:
     """Test generator for creating unique filenames."""
 
@@ -196,3 +322,145 @@ class TestRecursiveStringInterpolation:
         params = {"Key": "%(Key)s"}
 
         assert recursive_string_interpolation(string, params) == string
+
+
+class TestTemplateFields:
+    """Test extraction of field names from format strings."""
+
+    def test_with_no_fields(self) -> None:
+        """A string without any fields has no field names."""
+        assert template_fields("filename.dcm") == []
+
+    def test_with_format_specs(self) -> None:
+        """Field names are extracted regardless of their format specification."""
+        string = "%(ImageType)s (%(InstanceNumber)04d)%(Extension)s"
+        assert template_fields(string) == ["ImageType", "InstanceNumber", "Extension"]
+
+    def test_with_repeated_fields(self) -> None:
+        """Each field is only listed once."""
+        assert template_fields("%(Key)s_%(Key)s") == ["Key"]
+
+
+class TestTemplate:
+    """Test pre-tokenized format strings."""
+
+    @pytest.mark.parametrize(
+        "string",
+        [
+            "123abcABC890",
+            "123%(Key)s456",
+            "%(Number)04d_%(Key)s%(Extension)s",
+            "%(Number)-5d|%(Number)+.2f|%(Key)r",
+            "%(Nested)s",
+            "%(Loop)s",
+        ],
+    )
+    def test_matches_recursive_interpolation(self, string: str) -> None:
+        """The result matches that of recursive_string_interpolation."""
+        params = {
+            "Key": "Value",
+            "Number": 7,
+            "Extension": ".dcm",
+            "Nested": "%(Key)s",
+            "Loop": "%(Loop)s",
+        }
+
+        assert Template(string)(params) == recursive_string_interpolation(
+            string, params
+        )
+
+    def test_with_literal_percent(self) -> None:
+        """Strings with literal % signs fall back to recursive interpolation."""
+        template = Template("%(Key)s %%(Key)s")
+
+        assert template.fields is None
+        assert template({"Key": "Value"}) == "Value Value"
+
+    def test_with_lookup(self) -> None:
+        """A custom lookup function is used to resolve fields."""
+        template = Template("%(Key)s_%(Other)s")
+
+        assert template({}, lambda name: name.lower()) == "key_other"
+
+    def test_missing_key(self) -> None:
+        """Missing keys raise just like regular string interpolation."""
+        with pytest.raises(KeyError):
+            Template("%(Key)s")({})
+
+    def test_compile_template_is_cached(self) -> None:
+        """Compiling the same string twice returns the same template."""
+        assert compile_template("%(Key)s") is compile_template("%(Key)s")
+
+
+class TestThrottle:
+    """Test bounding the number of in-flight items."""
+
+    def test_blocks_when_limit_reached(self) -> None:
+        """Items are only produced while fewer than limit are unreleased."""
+        throttle = Throttle(2)
+        consumed: List[int] = []
+
+        def consume() -> None:
+            consumed.extend(throttle(range(5)))
+
+        thread = threading.Thread(target=consume, daemon=True)
+        thread.start()
+        thread.join(0.1)
+
+        assert consumed == [0, 1]
+
+        throttle.release()
+        throttle.release()
+        thread.join(0.1)
+
+        assert consumed == [0, 1, 2, 3]
+
+        throttle.release()
+        thread.join(1)
+
+        assert consumed == [0, 1, 2, 3, 4]
+
+    def test_does_not_read_ahead(self) -> None:
+        """The source is not advanced while waiting for a slot."""
+        throttle = Throttle(2)
+        pulled: List[int] = []
+
+        def source() -> Generator[int, None, None]:
+            for i in range(5):
+                pulled.append(i)
+                yield i
+
+        thread = threading.Thread(target=lambda: list(throttle(source())), daemon=True)
+        thread.start()
+        thread.join(0.1)
+
+        assert pulled == [0, 1]
+
+        throttle.release()
+        thread.join(0.1)
+
+        assert pulled == [0, 1, 2]
+
+        for _ in range(3):
+            throttle.release()
+            thread.join(0.1)
+
+        assert pulled == [0, 1, 2, 3, 4]
+        assert not thread.is_alive()
+
+
+class TestCounted:
+    """Test incrementing a progress total as items are produced."""
+
+    def test_total_is_incremented(self) -> None:
+        class Counter:
+            total: Optional[float] = None
+
+        counter = Counter()
+        generator = counted(["a", "b"], counter)
+
+        assert counter.total is None
+        assert next(generator) == "a"
+        assert counter.total == 1
+        assert list(generator) == ["b"]
+        assert counter.total == 2
@@ -0,0 +1,243 @@
+"""Unit tests for watch module."""
+import pathlib
+import shutil
+import sys
+import threading
+import time
+from typing import Callable, List, Set
+
+import pytest
+
+from dicomsorter.config import Config
+from dicomsorter.dicomsorter import DICOMSorter
+from dicomsorter.watch import (
+    InotifyWatcher,
+    PollingWatcher,
+    QuiescenceTracker,
+    Watcher,
+    create_watcher,
+)
+
+from .conftest import DicomFolderGenerator
+
+linux_only = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is only available on Linux"
+)
+
+
+def wait_for_changes(watcher: Watcher, timeout: float = 5.0) -> Set[pathlib.Path]:
+    changes: Set[pathlib.Path] = set()
+    deadline = time.monotonic() + timeout
+
+    while not changes and time.monotonic() < deadline:
+        changes = watcher.changes(0.05)
+
+    return changes
+
+
+WatcherFactory = Callable[[pathlib.Path], Watcher]
+watchers = pytest.mark.parametrize(
+    "factory", [PollingWatcher, pytest.param(InotifyWatcher, marks=linux_only)]
+)
+
+
+class TestWatcher:
+    @watchers
+    def test_existing_files(
+        self, tmp_path: pathlib.Path, factory: WatcherFactory
+    ) -> None:
+        tmp_path.joinpath("sub").mkdir()
+        tmp_path.joinpath("sub", "a").touch()
+
+        watcher = factory(tmp_path)
+
+        assert watcher.changes(0) == {tmp_path.joinpath("sub", "a")}
+        watcher.close()
+
+    @watchers
+    def test_new_file(self, tmp_path: pathlib.Path, factory: WatcherFactory) -> None:
+        watcher = factory(tmp_path)
+        watcher.changes(0)
+
+        tmp_path.joinpath("a").write_bytes(b"data")
+
+        assert wait_for_changes(watcher) == {tmp_path.joinpath("a")}
+        watcher.close()
+
+    @watchers
+    def test_new_directory(
+        self, tmp_path: pathlib.Path, factory: WatcherFactory
+    ) -> None:
+        watcher = factory(tmp_path)
+        watcher.changes(0)
+
+        tmp_path.joinpath("sub").mkdir()
+        tmp_path.joinpath("sub", "a").write_bytes(b"data")
+
+        changes = wait_for_changes(watcher)
+
+        # inotify may report the file twice (both when listing and from its event)
+        changes |= wait_for_changes(watcher, timeout=0.2)
+
+        assert changes == {tmp_path.joinpath("sub", "a")}
+        watcher.close()
+
+    def test_polling_ignores_unchanged(self, tmp_path: pathlib.Path) -> None:
+        tmp_path.joinpath("a").touch()
+        watcher = PollingWatcher(tmp_path)
+        watcher.changes(0)
+
+        assert watcher.changes(0) == set()
+
+    def test_create_watcher_poll(self, tmp_path: pathlib.Path) -> None:
+        assert isinstance(create_watcher(tmp_path, poll=True), PollingWatcher)
+
+
+class TestQuiescenceTracker:
+    def test_ready_after_window(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("a")
+        filename.write_bytes(b"data")
+
+        tracker = QuiescenceTracker(2.0)
+        tracker.update({filename}, now=0.0)
+
+        assert tracker.ready(now=1.0) == []
+        assert tracker.ready(now=2.0) == [filename]
+        assert tracker.ready(now=3.0) == []
+
+    def test_changed_file_restarts_window(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("a")
+        filename.write_bytes(b"data")
+
+        tracker = QuiescenceTracker(2.0)
+        tracker.update({filename}, now=0.0)
+
+        filename.write_bytes(b"more data")
+
+        assert tracker.ready(now=2.0) == []
+        assert tracker.ready(now=3.0) == []
+        assert tracker.ready(now=4.0) == [filename]
+
+    def test_removed_file(self, tmp_path: pathlib.Path) -> None:
+        filename = tmp_path.joinpath("a")
+        filename.write_bytes(b"data")
+
+        tracker = QuiescenceTracker(2.0)
+        tracker.update({filename}, now=0.0)
+        filename.unlink()
+
+        assert tracker.ready(now=2.0) == []
+        assert len(tracker) == 0
+
+
+class TestDICOMSorterWatch:
+    @pytest.mark.parametrize("poll", [False, True])
+    def test_sorts_new_files(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+        poll: bool,
+    ) -> None:
+        source = dicom_folder(4, False)
+        input_folder = tmp_path_factory.mktemp("input")
+        output_folder = input_folder.joinpath("output")
+
+        shutil.copy(source.files[0], input_folder)
+
+        config = Config(
+            input_directory=input_folder,
+            output_directory=output_folder,
+            original_filename=True,
+            concurrency=1,
+            settle=0.1,
+            poll=poll,
+            poll_interval=0.05,
+        )
+
+        stop = threading.Event()
+        thread = threading.Thread(target=DICOMSorter(config).watch, args=(stop,))
+        thread.start()
+
+        try:
+            for filename in source.files[1:]:
+                shutil.copy(filename, input_folder)
+
+            input_folder.joinpath("notes.txt").write_text("not a DICOM file")
+
+            expected = sorted(f.name for f in source.files)
+            deadline = time.monotonic() + 10
+            sorted_files: List[str] = []
+
+            while sorted_files != expected and time.monotonic() < deadline:
+                time.sleep(0.05)
+                sorted_files = sorted(
+                    f.name for f in output_folder.rglob("*") if f.is_file()
+                )
+        finally:
+            stop.set()
+            thread.join()
+
+        # The output is within the input directory but is not sorted again
+        assert sorted_files == expected
+
+    def test_output_removed_between_batches(
+        self,
+        dicom_folder: DicomFolderGenerator,
+        tmp_path_factory: pytest.TempPathFactory,
+    ) -> None:
+        source = dicom_folder(2, False)
+        input_folder = tmp_path_factory.mktemp("input")
+        output_folder = tmp_path_factory.mktemp("output")
+        config = Config(
+            input_directory=input_folder,
+            output_directory=output_folder,
+            path=[],
+            original_filename=True,
+            concurrency=1,
+            settle=0.1,
+            poll=True,
+            poll_interval=0.05,
+        )
+
+        def wait_for_file(filename: pathlib.Path) -> bool:
+            deadline = time.monotonic() + 10
+
+            while not filename.exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            return filename.exists()
+
+        stop = threading.Event()
+        thread = threading.Thread(target=DICOMSorter(config).watch, args=(stop,))
+        thread.start()
+
+        try:
+            shutil.copy(source.files[0], input_folder)
+            assert wait_for_file(output_folder.joinpath(source.files[0].name))
+
+            shutil.rmtree(output_folder)
+
+            shutil.copy(source.files[1], input_folder)
+            assert wait_for_file(output_folder.joinpath(source.files[1].name))
+        finally:
+            stop.set()
+            thread.join()
+
+    def test_output_via_symlink_is_not_a_candidate(
+        self, dicom_folder: DicomFolderGenerator, tmp_path: pathlib.Path
+    ) -> None:
+        source = dicom_folder(1, False)
+        output_folder = tmp_path.joinpath("output")
+        output_folder.mkdir()
+        tmp_path.joinpath("link").symlink_to(output_folder)
+
+        sorted_file = output_folder.joinpath("image.dcm")
+        shutil.copy(source.files[0], sorted_file)
+
+        config = Config(
+            input_directory=tmp_path, output_directory=tmp_path.joinpath("link")
+        )
+        sorter = DICOMSorter(config)
+
+        assert not sorter.is_candidate(sorted_file)
+        assert sorter.is_candidate(source.files[0])